@@ -0,0 +1,165 @@
+"""/compatibility for a guild: compatibility_scores' NumPy pass vs the old
+_get_comp_score called once per member.
+
+Checks first that both give the same scores over random users (mixed
+services and score formats, AniList<->MyAnimeList ids mapped through
+Al2mal2al, missing and unusable scores), then times one user against 1k
+users of 2k entries each, and how long a member's document takes to decode
+whole vs projected down to scores like the command's aggregate does. Run
+from the project root:
+
+    python -m benchmarks.compatibility [users] [entries]
+"""
+import os, math, random, statistics, sys, time
+
+import bson
+
+# importing the services package sets up (but doesn't connect) the db clients
+for var, default in (('DBUSER', 'bench'), ('DBKEY', 'bench'), ('DBPATH', 'localhost:27017'), ('NON_SRV_DB', '1')):
+    os.environ.setdefault(var, default)
+
+from modules.services import Service
+from modules.services.compatibility import compatibility_scores
+from modules.services.anilist.enums import ScoreFormat
+from modules.core.resources.al2mal2al import Al2mal2al
+
+FORMATS = [ScoreFormat.POINT_10, ScoreFormat.POINT_10_DECIMAL, ScoreFormat.POINT_100, ScoreFormat.POINT_5, ScoreFormat.EMOJI]
+KIND = 'anime'
+
+def get_comp_score(u1, u2, kind, al2mal2al):
+    """misc._get_comp_score before the batched pass, with al2mal2al passed in
+    and without printing the traceback"""
+    try:
+        sf1 = ScoreFormat(u1['profile']['score_format'])
+        sf2 = ScoreFormat(u2['profile']['score_format'])
+        sum1 = 0
+        sum2 = 0
+        smult = 0
+        shared1 = []
+        shared2 = []
+        for i in u1['lists'][kind]:
+            e = u1['lists'][kind][i]
+            ii = [i]
+            if u1['service'] == Service.ANILIST and u2['service'] == Service.MYANIMELIST:
+                ii = al2mal2al.al2mal(kind, i, [])
+            if u1['service'] == Service.MYANIMELIST and u2['service'] == Service.ANILIST:
+                ii = al2mal2al.mal2al(kind, i, [])
+            for s in ii:
+                s = str(s)
+                if s != None and s != "None" and s in u2['lists'][kind]:
+                    s1 = sf1.normalized_score(e['score'])
+                    s2 = sf2.normalized_score(u2['lists'][kind][s]['score'])
+                    if not s1 or not s2:
+                        continue
+                    shared1.append(s1)
+                    shared2.append(s2)
+                    sum1 = sum1 + s1
+                    sum2 = sum2 + s2
+                    smult += s1 * s2
+
+        num_shared = len(shared1)
+
+        if num_shared == 0:
+            return (0,0)
+        elif num_shared == 1:
+            return (100 - 100/9 * abs(sum1 - sum2))
+
+        av1 = sum1/num_shared
+        av2 = sum2/num_shared
+        sdv1 = statistics.stdev(shared1)
+        sdv2 = statistics.stdev(shared2)
+        pcc = (smult - num_shared*av1*av2) / ((num_shared - 1)*sdv1*sdv2)
+        return (pcc*100, num_shared)
+    except Exception:
+        return (0,0)
+
+def mappings(media):
+    """AniList and MyAnimeList ids for the same media, a few unmapped"""
+    al2mal2al = Al2mal2al.__new__(Al2mal2al)
+    al2mal2al._al2mal, al2mal2al._mal2al = {KIND: {}}, {KIND: {}}
+    for i in range(media):
+        if i % 20:
+            al2mal2al._al2mal[KIND][str(i)] = [i + 100_000]
+            al2mal2al._mal2al[KIND][str(i + 100_000)] = [i]
+    return al2mal2al
+
+def score(rng, score_format, bad):
+    if bad and rng.random() < 0.001:
+        return rng.choice([None, 'x'])
+    if score_format == ScoreFormat.EMOJI:
+        return rng.choice([0, 1, 2, 3])
+    if score_format == ScoreFormat.POINT_100:
+        return rng.randint(0, 100)
+    if score_format == ScoreFormat.POINT_5:
+        return rng.randint(0, 5)
+    if score_format == ScoreFormat.POINT_10_DECIMAL:
+        return rng.randint(0, 100) / 10
+    return rng.randint(0, 10)
+
+def user(rng, entries, media, bad=True, full=False):
+    service = rng.choice([Service.ANILIST, Service.ANILIST, Service.MYANIMELIST])
+    score_format = ScoreFormat.POINT_10 if service == Service.MYANIMELIST else rng.choice(FORMATS)
+    offset = 100_000 if service == Service.MYANIMELIST else 0
+    lst = {}
+    for i in rng.sample(range(media), min(entries, media)):
+        entry = {'score': score(rng, score_format, bad)}
+        if full: # the rest of what the syncer stores per entry
+            entry.update({
+                'id': i + offset, 'title': f"Anime title {i}", 'link': f"https://anilist.co/anime/{i}",
+                'cover': f"https://img.anili.st/media/{i}.jpg", 'banner': None, 'episodes': 12,
+                'episode_progress': rng.randint(0, 12), 'status': 'COMPLETED', 'attributes': 0,
+            })
+        lst[str(i + offset)] = entry
+    return {
+        'discord_id': str(rng.randrange(10**17, 10**18)), 'service': service, 'status': 'ACTIVE',
+        'profile': {'name': f"user{rng.randrange(10**6)}", 'score_format': score_format, 'avatar': 'https://s4.anilist.co/avatar.png'},
+        'lists': {KIND: lst},
+    }
+
+def same(a, b):
+    if not isinstance(a, tuple): # a single shared score used to come back bare
+        a = (a, 1)
+    return a[1] == b[1] and math.isclose(a[0], b[0], rel_tol=1e-6, abs_tol=1e-6)
+
+def check(rounds):
+    rng = random.Random(7)
+    al2mal2al = mappings(60)
+    for r in range(rounds):
+        u = user(rng, rng.randint(0, 40), 60)
+        others = [user(rng, rng.randint(0, 40), 60) for _ in range(rng.randint(1, 12))]
+        got = compatibility_scores(u, others, KIND, al2mal2al)
+        for other, score in zip(others, got):
+            expected = get_comp_score(u, other, KIND, al2mal2al)
+            assert same(expected, score), f"round {r}: {score} instead of {expected}"
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+def decode(docs):
+    for doc in docs:
+        bson.decode(doc)
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    entries = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    check(400)
+    print("same scores as _get_comp_score over 400 random guilds")
+
+    rng = random.Random(1)
+    media = entries * 3
+    al2mal2al = mappings(media)
+    u = user(rng, entries, media, bad=False)
+    others = [user(rng, entries, media, bad=False) for _ in range(n)]
+    before = timed(lambda: [get_comp_score(u, other, KIND, al2mal2al) for other in others])
+    after = min(timed(compatibility_scores, u, others, KIND, al2mal2al) for _ in range(3))
+    print(f"1 user against {n} users of {entries} entries")
+    print(f"{'_get_comp_score per member (before)':<38}{before:7.2f} s")
+    print(f"{'compatibility_scores (after)':<38}{after:7.2f} s")
+
+    full = [bson.encode(user(rng, entries, media, bad=False, full=True)) for _ in range(20)]
+    projected = [bson.encode({**doc, 'lists': {KIND: {i: {'score': e['score']} for i, e in doc['lists'][KIND].items()}}}) for doc in map(bson.decode, full)]
+    for name, docs in (('whole document (before)', full), ('scores only (after)', projected)):
+        per_doc = min(timed(decode, docs) for _ in range(3)) / len(docs)
+        print(f"{name:<38}{per_doc*1000:7.2f} ms to decode a member, {sum(map(len, docs))/len(docs)/1024:.0f}KB")
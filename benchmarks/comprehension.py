@@ -0,0 +1,78 @@
+"""Throughput and event loop lag of each Comprehender mode.
+
+Comprehends a batch of users the way the syncer does, one after another,
+while a task on the same loop measures how late it gets woken. Checks
+first that process mode gives the same changes as comprehending in
+place. Run from the project root:
+
+    python -m benchmarks.comprehension [users] [count] [workers]
+"""
+import asyncio, random, sys, time
+
+from benchmarks.list_diff import make, fetch_data
+from modules.services.comprehension import Comprehender, LoopLag
+
+def users(n, count, first_sync):
+    rng = random.Random(25)
+    batch = []
+    for _ in range(n):
+        user, lists, profile = make(rng, count, count // 100)
+        if first_sync:
+            user.lists = {lst: {} for lst in user.lists}
+        batch.append((user, lists, profile))
+    return batch
+
+async def run(comprehender, batch):
+    prepared = [(user, fetch_data(lists, profile)) for user, lists, profile in batch]
+    lag = LoopLag(interval=0.005, report_interval=float('inf'))
+    lag.start('benchmark')
+    await asyncio.sleep(0.05)
+    lag.take()
+    entries = sum(len(r.data) for _, data in prepared for r in data.lists.values())
+    start = time.perf_counter()
+    for user, data in prepared:
+        await comprehender.comprehend(user, data)
+        await asyncio.sleep(0) # the syncer displays/persists in between
+    seconds = time.perf_counter() - start
+    worst, mean = lag.take()
+    lag._task.cancel()
+    return entries / seconds, worst, mean
+
+def summary(comprehensions):
+    return {
+        lst: [(e['id'], [(c.kind, c.old, c.new, c.msg) for c in e.changes(pruned=True)]) for e in entries]
+        for lst, entries in comprehensions.items()
+    }
+
+async def check(batch, workers):
+    inline, processes = Comprehender(Comprehender.INLINE), Comprehender(Comprehender.PROCESS, workers)
+    try:
+        for user, lists, profile in batch:
+            expected, got = fetch_data(lists, profile), fetch_data(lists, profile)
+            assert summary(await inline.comprehend(user, expected)) == summary(await processes.comprehend(user, got)), "process mode gave different changes"
+            fingerprints = lambda data: [e.fingerprint for r in data.lists.values() for e in r.data]
+            assert fingerprints(expected) == fingerprints(got), "process mode gave different fingerprints"
+    finally:
+        processes.close()
+
+async def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    await check(users(3, 300, False) + users(3, 300, True), workers)
+    print("process mode gives the same changes")
+
+    for label, first_sync in (('steady state', False), ('first sync', True)):
+        batch = users(n, count, first_sync)
+        print(f"{label}: {n} users x 3 lists of {count} entries")
+        for mode in Comprehender.MODES:
+            comprehender = Comprehender(mode, workers if mode == Comprehender.PROCESS else None)
+            try:
+                await comprehender.comprehend(*batch[0][:1], fetch_data(*batch[0][1:])) # warm up the pool
+                rate, worst, mean = await run(comprehender, batch)
+            finally:
+                comprehender.close()
+            print(f"  {mode:<8}{rate:10.0f} entries/s   loop lag max {worst*1000:6.1f} ms, mean {mean*1000:5.2f} ms")
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""Construction time and memory of 10k list entries, slotted vs the old
+dict-backed ListEntry. Run from the project root:
+
+    python -m benchmarks.entries [count]
+"""
+import os, sys, time, tracemalloc
+
+# importing the services package sets up (but doesn't connect) the db clients
+for var, default in (('DBUSER', 'bench'), ('DBKEY', 'bench'), ('DBPATH', 'localhost:27017'), ('NON_SRV_DB', '1')):
+    os.environ.setdefault(var, default)
+
+from modules.services.anilist.entry import AnimeEntry
+from modules.services.anilist.enums import Status
+
+class DictAnimeEntry:
+    """ListEntry as it was before fields got slots, with AnimeEntry's specs"""
+    __slots__ = ['fields', '_changes']
+    specs = AnimeEntry.specs
+
+    def __init__(self):
+        self._changes = []
+        self.fields = {}
+
+    def __getitem__(self, key):
+        return self.fields.get(key)
+
+    def __setitem__(self, key, val):
+        if not (key in self.specs.DYNAMIC_FIELDS or key in self.specs.DATA_FIELDS):
+            raise AttributeError(f"Entry has no '{key}' field")
+        self.fields[key] = val
+
+    def get(self, key, default=None):
+        return self.fields.get(key, default)
+
+    @property
+    def dict(self):
+        d = {}
+        for field in self.specs.DYNAMIC_FIELDS:
+            if field.concealed:
+                continue
+            d[field.label] = self.fields.get(field, field.default)
+        for field in self.specs.DATA_FIELDS:
+            if field.concealed:
+                continue
+            d[field.label] = self.fields.get(field, field.default)
+        return d
+
+    def consume(self, entry):
+        for field in self.specs.DYNAMIC_FIELDS:
+            change = field.consume(self, entry.get(field, field.default), self.fields.get(field, field.default))
+            if change:
+                self._changes.append(change)
+
+def build(cls, count):
+    """What AnilistQuery._gen_animelist does per entry"""
+    lst = []
+    for i in range(count):
+        media = cls()
+        media['id'] = i
+        media['link'] = f"https://anilist.co/anime/{i}"
+        media['banner'] = None
+        media['cover'] = f"https://img.anili.st/{i}.jpg"
+        media['title'] = f"Anime {i}"
+        media['episodes'] = 12
+        media['score'] = i % 10
+        media['episode_progress'] = i % 12
+        media['status'] = Status.CURRENT
+        media['attributes'] = 0
+        lst.append(media)
+    return lst
+
+def measure(cls, count, repeat=5):
+    best = min(_timed(build, cls, count) for _ in range(repeat))
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    lst = build(cls, count)
+    size = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, 'filename'))
+    tracemalloc.stop()
+
+    # every entry unchanged except its score, like a typical sync
+    old = [e.dict for e in lst]
+    for d in old:
+        d['score'] = (d['score'] + 1) % 10
+    to_dict = min(_timed(lambda: [e.dict for e in lst]) for _ in range(repeat))
+    consume = min(_timed(_consume_all, build(cls, count), old) for _ in range(repeat))
+    return best, size, to_dict, consume
+
+def _consume_all(lst, old):
+    for entry, d in zip(lst, old):
+        entry.consume(d)
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    print(f"{count} anime entries     build      memory     dict       consume")
+    for name, cls in (('dict fields (before)', DictAnimeEntry), ('slots (after)', AnimeEntry)):
+        build_time, size, to_dict, consume = measure(cls, count)
+        print(f"{name:<22}{build_time*1000:7.1f} ms {size/1024**2:7.2f} MiB {to_dict*1000:7.1f} ms {consume*1000:7.1f} ms")
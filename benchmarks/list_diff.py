@@ -0,0 +1,181 @@
+"""Syncer._comprehend skipping entries by fingerprint and columnar diff vs
+consuming every entry.
+
+Checks first that both give the same changes and stored lists over random
+mutations of anime, manga and vn lists, then times a 10k entry list where a few
+entries changed, and counts what a first sync with a new score format
+leaves allocated. Run from the project root:
+
+    python -m benchmarks.list_diff [rounds] [count]
+"""
+import os, random, sys, time, tracemalloc
+from types import SimpleNamespace
+
+# importing the services package sets up (but doesn't connect) the db clients
+for var, default in (('DBUSER', 'bench'), ('DBKEY', 'bench'), ('DBPATH', 'localhost:27017'), ('NON_SRV_DB', '1')):
+    os.environ.setdefault(var, default)
+
+from modules.services.syncer import Syncer
+from modules.services.models.data import FetchData, QueryResult, ResultStatus
+from modules.services.models.entry import FINGERPRINT
+from modules.services.anilist.entry import AnimeEntry, MangaEntry
+from modules.services.anilist.enums import ScoreFormat, Status
+from modules.services.vndb.entry import VnEntry
+
+STATUSES = [Status.CURRENT, Status.REPEATING, Status.COMPLETED, Status.DROPPED, Status.PAUSED, Status.PLANNING, Status.UNKNOWN]
+FORMATS = [ScoreFormat.POINT_10, ScoreFormat.POINT_100, ScoreFormat.POINT_5, ScoreFormat.EMOJI]
+
+def consume_all(user, data):
+    """_comprehend before fingerprints and the columnar diff"""
+    comprehensions = {}
+    for lst in data.lists:
+        if data.lists[lst].status == ResultStatus.OK:
+            comprehensions[lst] = []
+            for entry in data.lists[lst].data:
+                entry.consume(user.lists.get(lst, {}).get(str(entry['id']), {}))
+                if data.profile.status == ResultStatus.OK:
+                    entry.rationalize_changes(user, data.profile.data)
+                else:
+                    entry.rationalize_changes(user, user.profile)
+                if entry.changes(pruned=True):
+                    comprehensions[lst].append(entry)
+    return comprehensions
+
+def random_value(rng, field):
+    if field == 'status':
+        return rng.choice(STATUSES)
+    value = rng.choice([0, 1, 2, 3, 7, 7.0, 7.5, 10, 12, 100])
+    return value if field != 'vote' else rng.choice([None, 10, 55, 80, 100])
+
+def random_list(rng, klass, count, fingerprinted):
+    """Stored entries, written by the syncer (with fingerprints) or before
+    entries had them"""
+    stored = {}
+    for i in range(count):
+        d = {field.label: random_value(rng, field.label) for field in klass.specs.DYNAMIC_FIELDS}
+        d['title'] = f"{klass.__name__} {i}"
+        if fingerprinted:
+            entry = klass()
+            for field, value in d.items():
+                entry[field] = value
+            d = entry.dict
+        stored[str(i)] = d
+    return stored
+
+def mutate(rng, klass, stored, mutations):
+    """Fetched entries: the stored list with some entries changed, added,
+    removed or missing fields"""
+    fetched = {i: dict(d) for i, d in stored.items()}
+    for _ in range(mutations):
+        kind = rng.random()
+        if kind < 0.6 and fetched:
+            d = fetched[rng.choice(list(fetched))]
+            field = rng.choice(klass.specs.DYNAMIC_FIELDS).label
+            d[field] = random_value(rng, field)
+        elif kind < 0.75:
+            fetched[str(rng.randrange(10**6, 2*10**6))] = {field.label: random_value(rng, field.label) for field in klass.specs.DYNAMIC_FIELDS}
+        elif kind < 0.9 and fetched:
+            del fetched[rng.choice(list(fetched))]
+        elif fetched:
+            fetched[rng.choice(list(fetched))].pop(rng.choice(klass.specs.DYNAMIC_FIELDS).label, None)
+    ids = list(fetched)
+    rng.shuffle(ids)
+    entries = []
+    for i in ids:
+        entry = klass()
+        entry['id'] = i
+        entry['title'] = fetched[i].get('title', 'new')
+        for field, value in fetched[i].items():
+            if field not in ('title', FINGERPRINT):
+                entry[field] = value
+        entries.append(entry)
+    return entries
+
+def make(rng, count, mutations, fingerprinted=True):
+    user = SimpleNamespace(lists={}, profile=SimpleNamespace(score_format=rng.choice(FORMATS)))
+    lists = {}
+    for lst, klass in (('anime', AnimeEntry), ('manga', MangaEntry), ('vn', VnEntry)):
+        user.lists[lst] = random_list(rng, klass, count, fingerprinted)
+        lists[lst] = mutate(rng, klass, user.lists[lst], mutations)
+    profile = SimpleNamespace(score_format=rng.choice(FORMATS))
+    return user, lists, profile
+
+def fetch_data(lists, profile):
+    """Fresh entries, consume() keeps changes on them"""
+    copies = {}
+    for lst, entries in lists.items():
+        copies[lst] = []
+        for e in entries:
+            copy = type(e)()
+            for key, value in e.fields.items():
+                copy[key] = value
+            copies[lst].append(copy)
+    return FetchData(
+        lists={lst: QueryResult(status=ResultStatus.OK, data=entries) for lst, entries in copies.items()},
+        profile=QueryResult(status=ResultStatus.OK, data=profile)
+    )
+
+def outcome(fn, user, data):
+    try:
+        comprehensions = fn(user, data)
+    except Exception as e:
+        return type(e)
+    return {
+        lst: [(e['id'], [(c.kind, c.old, c.new, c.msg, c.ignore) for c in e.changes(pruned=False)]) for e in entries]
+        for lst, entries in comprehensions.items()
+    }
+
+def check(rounds):
+    rng = random.Random(22)
+    for r in range(rounds):
+        user, lists, profile = make(rng, rng.randrange(0, 60), rng.randrange(0, 40), fingerprinted=r % 2 == 0)
+        expected = outcome(consume_all, user, fetch_data(lists, profile))
+        got = outcome(Syncer._comprehend, user, fetch_data(lists, profile))
+        assert got == expected, f"round {r}: skipping entries gave different changes"
+        for lst, entries in lists.items():
+            stored = user.lists.get(lst) or {}
+            assert Syncer._stored_list(stored, entries) == rebuild_all(stored, entries), f"round {r}: reused entries differ"
+
+def rebuild_all(old, entries):
+    """_persist building the stored list before fingerprints"""
+    return {str(entry['id']): entry.dict for entry in entries}
+
+def timed(comprehend, rebuild, user, data):
+    """Comprehending a user's lists and building what gets stored"""
+    start = time.perf_counter()
+    comprehend(user, data)
+    for lst, result in data.lists.items():
+        rebuild(user.lists.get(lst) or {}, result.data)
+    return time.perf_counter() - start
+
+def allocations(fn, user, data):
+    """Blocks and bytes the comprehension leaves allocated, mostly changes
+    and their messages"""
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    comprehensions = fn(user, data)
+    stats = tracemalloc.take_snapshot().compare_to(before, 'filename')
+    tracemalloc.stop()
+    del comprehensions
+    return sum(s.count_diff for s in stats), sum(s.size_diff for s in stats)
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    check(rounds)
+    print(f"same changes as consuming every entry over {rounds} random lists")
+
+    rng = random.Random(1)
+    user, lists, profile = make(rng, count, 20)
+    for name, comprehend, rebuild in (
+        ('consume every entry (before)', consume_all, rebuild_all),
+        ('skip unchanged (after)', Syncer._comprehend, Syncer._stored_list)
+    ):
+        best = min(timed(comprehend, rebuild, user, fetch_data(lists, profile)) for _ in range(5))
+        print(f"{name:<30}{best*1000:7.1f} ms to comprehend and store 3 lists of {count} entries")
+
+    # nothing stored yet and the score format changed, every entry has changes and all scores are ignored
+    user.lists = {lst: {} for lst in user.lists}
+    profile = SimpleNamespace(score_format=ScoreFormat.POINT_100 if user.profile.score_format != ScoreFormat.POINT_100 else ScoreFormat.POINT_10)
+    blocks, size = allocations(Syncer._comprehend, user, fetch_data(lists, profile))
+    print(f"first sync of 3 lists of {count} entries leaves {blocks} blocks, {size/1024**2:.2f} MiB allocated")
@@ -0,0 +1,102 @@
+"""Matching a message against a guild's reactions, ReactionMatcher vs the
+old Events.determine_reaction.
+
+Checks first that both pick the same reaction over random trigger sets and
+messages, then times messages against 500 triggers. Run from the project
+root:
+
+    python -m benchmarks.reactions [triggers] [messages]
+"""
+import random, re, string, sys, time
+
+from modules.core.reactions import ReactionMatcher
+
+WORDS = ['hi', 'hello', 'lain', 'anime', 'good', 'night', 'morning', 'wired', 'bot', 'cat', 'dog', 'yes', 'no', 'ok', 'lol', 'nice', 'based', 'cringe', 'sad', 'gm']
+PUNCTUATION = ['', '', '', '!', '?', '.', ',', '...']
+PATTERNS = ['h+i', 'go+d', 'n(ight|ite)', 'a.ime', 'l[ae]in', '(yes|no)+']
+
+def determine_reaction(msg, reactions):
+    """Events.determine_reaction before the matcher"""
+    for reaction in reactions:
+        if reaction['type'] == 'exact':
+            if msg == reaction['trigger']:
+                if 'response' in reaction:
+                    return reaction['response']
+                else:
+                    return reaction['responses'][random.randint(0, len(reaction['responses'])-1)]
+        elif reaction['type'] == 'in':
+            clean_msg = msg.translate(str.maketrans('', '', string.punctuation))
+            if re.search(f"(^| |\n){reaction['trigger']}($| |\n)", clean_msg):
+                if 'response' in reaction:
+                    return reaction['response']
+                else:
+                    return reaction['responses'][random.randint(0, len(reaction['responses'])-1)]
+    return None
+
+def phrase(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+def reactions(rng, count, patterns=True):
+    """Mostly plain word/phrase triggers, some exact and a few using regex
+    syntax. Every reaction has its own response so the one picked is known"""
+    lst = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < 0.2:
+            lst.append({'type': 'exact', 'trigger': phrase(rng, rng.randint(1, 3)), 'response': f"r{i}"})
+        elif kind < 0.25 and patterns:
+            lst.append({'type': 'in', 'trigger': rng.choice(PATTERNS), 'response': f"r{i}"})
+        else:
+            # enough distinct words that most long triggers never match
+            trigger = phrase(rng, rng.randint(1, 3)) if rng.random() < 0.3 else f"{phrase(rng, 1)} w{rng.randrange(10**6)}"
+            lst.append({'type': 'in', 'trigger': trigger, 'response': f"r{i}"})
+    return lst
+
+def message(rng):
+    parts = []
+    for _ in range(rng.randint(1, 12)):
+        parts.append(rng.choice(WORDS) + rng.choice(PUNCTUATION))
+        parts.append(rng.choice([' ', ' ', ' ', '\n']))
+    return ''.join(parts[:-1])
+
+def check(rounds):
+    rng = random.Random(6)
+    for r in range(rounds):
+        lst = reactions(rng, rng.randint(0, 40), patterns=False)
+        for pattern in rng.sample(PATTERNS, rng.randint(0, 2)):
+            lst.insert(rng.randint(0, len(lst)), {'type': 'in', 'trigger': pattern, 'response': pattern})
+        matcher = ReactionMatcher(lst)
+        for _ in range(20):
+            msg = message(rng) if rng.random() < 0.9 or not lst else rng.choice(lst)['trigger']
+            assert matcher.match(msg) == determine_reaction(msg, lst), f"round {r}: different reaction for {msg!r}"
+
+def timed(fn, msgs):
+    start = time.perf_counter()
+    for msg in msgs:
+        fn(msg)
+    return (time.perf_counter() - start) / len(msgs)
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    check(30_000 // 20)
+    print("same reactions as determine_reaction over 30000 random messages")
+
+    rng = random.Random(1)
+    lst = reactions(rng, count)
+    msgs = [message(rng) for _ in range(n)]
+    build = min(timed(lambda _: ReactionMatcher(lst), [None] * 20) for _ in range(5))
+    matcher = ReactionMatcher(lst)
+    print(f"{len(lst)} triggers, {n} messages")
+    def cold(msg):
+        # other guilds' triggers have pushed this guild's out of re's pattern cache (512 patterns)
+        re.purge()
+        determine_reaction(msg, lst)
+    for name, fn in (
+        ('determine_reaction (before)', lambda msg: determine_reaction(msg, lst)),
+        ('  with a cold re cache', cold),
+        ('ReactionMatcher (after)', matcher.match)
+    ):
+        best = min(timed(fn, msgs) for _ in range(3))
+        print(f"{name:<30}{best*1e6:9.1f} us per message")
+    print(f"{'building the matcher':<30}{build*1e3:9.2f} ms")
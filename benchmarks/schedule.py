@@ -0,0 +1,122 @@
+"""Simulated AniList syncing: how late list updates get posted and how many
+queries it takes, polling everyone every round vs with a UserSchedule.
+
+Users update their lists at random (Poisson) at one of a few rates. The
+syncer sends a query of up to MAX_USERS_PER_QUERY users every
+time_between_queries seconds when anyone is due, the way its scheduled
+rounds do, on a simulated clock. Latency is from an update to the next
+poll of that user. Run from the project root:
+
+    python -m benchmarks.schedule [users] [days]
+"""
+import bisect, os, random, sys
+from types import SimpleNamespace
+
+# importing the services package sets up (but doesn't connect) the db clients
+for var, default in (('DBUSER', 'bench'), ('DBKEY', 'bench'), ('DBPATH', 'localhost:27017'), ('NON_SRV_DB', '1')):
+    os.environ.setdefault(var, default)
+
+from modules.services import Service
+from modules.services import schedule as schedule_module
+from modules.services.anilist.query import AnilistQuery
+from modules.services.schedule import UserSchedule
+
+HOUR = 60*60
+DAY = 24*HOUR
+# (label, share of users, mean time between list updates)
+KINDS = [('hourly', 0.1, HOUR), ('daily', 0.3, DAY), ('idle', 0.6, 30*DAY)]
+WARMUP = DAY # schedules settle before anything is measured
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+def make_users(rng, n, days):
+    users = []
+    for i in range(n):
+        r, acc = rng.random(), 0
+        for label, share, gap in KINDS:
+            acc += share
+            if r < acc:
+                break
+        updates, t = [], rng.expovariate(1/gap)
+        while t < WARMUP + days*DAY:
+            updates.append(t)
+            t += rng.expovariate(1/gap)
+        users.append(SimpleNamespace(_id=i, kind=label, updates=updates, seen=0))
+    return users
+
+class Result:
+    def __init__(self):
+        self.latencies = {label: [] for label, _, _ in KINDS}
+        self.queries = 0
+
+    def poll(self, user, now):
+        """Whether user had updates since they were last polled"""
+        i = bisect.bisect_right(user.updates, now)
+        changed = i > user.seen
+        if now >= WARMUP:
+            self.latencies[user.kind].extend(now - u for u in user.updates[user.seen:i] if u >= WARMUP)
+        user.seen = i
+        return changed
+
+def every_round(users, days, per_query, spacing):
+    result = Result()
+    now, k = 0.0, 0
+    while now < WARMUP + days*DAY:
+        for user in users[k:k+per_query]:
+            result.poll(user, now)
+        if now >= WARMUP:
+            result.queries += 1
+        k = k + per_query if k + per_query < len(users) else 0
+        now += spacing
+    return result
+
+def scheduled(users, days, per_query, spacing, **options):
+    clock = Clock()
+    schedule_module.time = clock
+    try:
+        schedule = UserSchedule(Service.ANILIST, **options)
+        schedule._heap = [(0, user._id) for user in users]
+        schedule._changed = {user._id: None for user in users}
+        result = Result()
+        while clock.now < WARMUP + days*DAY:
+            ids = schedule.due_ids(per_query)
+            if ids:
+                for i in ids:
+                    schedule.observe(users[i], result.poll(users[i], clock.now))
+                if clock.now >= WARMUP:
+                    result.queries += 1
+                clock.now += spacing
+            else: # the syncer's _end_round
+                clock.now += min(max(schedule.wait_time(), spacing), schedule.min_interval)
+        return result
+    finally:
+        schedule_module.time = __import__('time')
+
+def report(name, result, days):
+    cells = []
+    for label, _, _ in KINDS:
+        lat = sorted(result.latencies[label])
+        mean = sum(lat) / len(lat) if lat else 0
+        p95 = lat[int(len(lat)*0.95)] if lat else 0
+        cells.append(f"{mean/60:7.1f} {p95/60:7.1f}")
+    print(f"{name:<34}{'  '.join(cells)}   {result.queries/(days*24):7.0f}")
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    days = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    per_query, spacing = AnilistQuery.MAX_USERS_PER_QUERY, Service.ANILIST.time_between_queries
+    print(f"{n} users, {per_query} per query, a query every {spacing}s at most, {days} days")
+    print(f"{'minutes until an update is seen':<34}" + '  '.join(f"{label+' mean':>7} {'p95':>7}" for label, _, _ in KINDS) + "   queries/h")
+    for name, run in (
+        ('every user every round', lambda users: every_round(users, days, per_query, spacing)),
+        ('schedule, defaults, fill', lambda users: scheduled(users, days, per_query, spacing, fill=True)),
+        ('schedule, defaults, no fill', lambda users: scheduled(users, days, per_query, spacing)),
+        ('schedule, recency 0.05, fill', lambda users: scheduled(users, days, per_query, spacing, recency=0.05, fill=True)),
+        ('schedule, max 2h, fill', lambda users: scheduled(users, days, per_query, spacing, max_interval=2*HOUR, fill=True)),
+    ):
+        report(name, run(make_users(random.Random(19), n, days)), days)
@@ -43,10 +43,12 @@ def exit_cleanup():
 	asyncio.run(close_sessions())
 	logging.info('Shut down.')
 
-atexit.register(exit_cleanup)
-
-if not TOKEN:
-	logging.critical('No bot token provided.')
-else:
-	logging.info("Starting up...")
-	Client.bot.run(TOKEN) #runs the Discord bot using one of the above tokens
+# comprehension worker processes import this module too, only the bot's own process runs it
+if __name__ == '__main__':
+	atexit.register(exit_cleanup)
+
+	if not TOKEN:
+		logging.critical('No bot token provided.')
+	else:
+		logging.info("Starting up...")
+		Client.bot.run(TOKEN) #runs the Discord bot using one of the above tokens
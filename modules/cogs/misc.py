@@ -1,4 +1,5 @@
 import discord, os, random, asyncio, logging, statistics, json, math, sys, traceback
+from bson import ObjectId
 from discord.ext import commands
 from discord import app_commands
 logger = logging.getLogger(__name__)
@@ -8,6 +9,7 @@ from modules.core.resources import Resources
 from modules.services.anilist.enums import ScoreFormat, Status
 from modules.services.models.user import UserStatus
 from modules.services import Service
+from modules.services.compatibility import compatibility_scores
 
 from typing import Literal, Optional
 
@@ -45,7 +47,7 @@ class Misc(commands.Cog, name="other"):
 		channel = interaction.channel
 		guild = interaction.guild
 
-		await interaction.response.send_message("I am slow at this for now. Just wait")
+		await interaction.response.send_message("Calculating...")
 
 		user = await Resources.user_col.find_one(
 			{'discord_id': str(interaction.user.id)},
@@ -53,64 +55,32 @@ class Misc(commands.Cog, name="other"):
 				'service': 1,
 				'profile.name': 1,
 				'profile.score_format': 1,
-				f"lists.{kind}": 1,
+				**Resources.lists.projection([kind]),
 			}
 		)
 		if not user:
 			return await interaction.edit_original_response(content="Can't do compare. You're not registered")
 
-		# get all users in db that are in this guild
+		# get all active users in db that are in this guild
 		userIdsInGuild = [str(u.id) for u in guild.members if u.id != interaction.user.id]
-		active_ids = [d async for d in Resources.user_col.aggregate(
-				[
-					{
-						'$group': {
-							'_id': None, 
-							'data': {'$addToSet': {'discord_id': '$discord_id', 'status': '$status'}}
-						}
-					},
-					{
-						'$project': {
-							'active': {
-								'$filter': {
-									'input': '$data',
-									'as': 'item',
-									'cond': {'$not': {'$eq': ['$$item.status', UserStatus.INACTIVE]}}
-								}
-							}
-						}
-					},
-					{
-						'$project': {
-							'_id': 0,
-							'active': '$active.discord_id'
-						}
-					}
-				]
-			)
-		]
-		common_ids = list(set(userIdsInGuild).intersection(set(active_ids[0]['active'])))
-
-		scores = []
-		async def _process(discord_id):
-			u = await Resources.user_col.find_one(
+
+		# kept up to date by the syncers, only calculate from scratch if there's nothing stored yet
+		stored = await Resources.compatibility.scores(user['_id'], kind)
+		if stored:
+			scores = {}
+			async for u in Resources.user_col.find(
 				{
-					'discord_id': discord_id,
+					'_id': {'$in': [ObjectId(k) for k in stored]},
+					'discord_id': {'$in': userIdsInGuild},
+					'status': { '$not': { '$eq': UserStatus.INACTIVE } },
 				},
-				{
-					'service': 1,
-					'profile.name': 1,
-					'profile.score_format': 1,
-					f"lists.{kind}": 1,
-				}
-			)
-			scores.append((u['profile']['name'], _get_comp_score(user, u, kind)))
-
-		Resources.al2mal2al.renew()
-
-		await asyncio.gather(
-			*[_process(discord_id) for discord_id in common_ids]
-		)
+				{'discord_id': 1, 'profile.name': 1}
+			):
+				# one entry per discord user even if they have both services linked
+				scores.setdefault(u['discord_id'], (u['profile']['name'], stored[str(u['_id'])]))
+			scores = list(scores.values())
+		else:
+			scores = await self._calculate_comp_scores(user, userIdsInGuild, kind)
 
 		scores.sort(reverse=True, key=lambda e: e[1][0])
 
@@ -146,6 +116,33 @@ class Misc(commands.Cog, name="other"):
 		else:
 			await interaction.edit_original_response(content="No compatibilities. Most likely didn't share any scores with anyone")
 
+	async def _calculate_comp_scores(self, user, userIdsInGuild, kind):
+		await Resources.lists.fill([user], [kind])
+		others = await Resources.lists.score_docs(
+			{
+				'discord_id': {'$in': userIdsInGuild},
+				'status': { '$not': { '$eq': UserStatus.INACTIVE } },
+				'service': {'$in': [Service.ANILIST, Service.MYANIMELIST]},
+			},
+			kind,
+			{'discord_id': 1, 'profile.name': 1}
+		)
+		# one entry per discord user even if they have both services linked
+		others = list({u['discord_id']: u for u in reversed(others)}.values())
+
+		Resources.al2mal2al.renew()
+
+		comp_scores = await self.bot.loop.run_in_executor(
+			None,
+			compatibility_scores,
+			user,
+			others,
+			kind,
+			Resources.al2mal2al
+		)
+		scores = [(u['profile']['name'], score) for u, score in zip(others, comp_scores)]
+		return scores
+
 def _get_comp_score(u1, u2, kind):
 	# https://en.wikipedia.org/wiki/Pearson_correlation_coefficient
 	try:
@@ -81,11 +81,12 @@ async def _profile(respond, search):
 			'service': 1,
 			'service_id': 1,
 			'profile': 1,
-			'lists.anime': 1
+			**Resources.lists.projection(['anime'])
 		}
 	)
 	if userData:
 		# found
+		await Resources.lists.fill([userData], ['anime'])
 		embed = discord.Embed(
 			title = userData['profile']['name'],
 			color = discord.Color.teal(),
@@ -165,7 +166,7 @@ async def _user_get_status_lists(interaction, user, kind, statuses):
 			'service': 1,
 			'service_id': 1,
 			'profile': 1,
-			f"lists.{kind}": 1
+			**Resources.lists.projection([kind])
 		}
 	)
 
@@ -179,6 +180,7 @@ async def _user_get_status_lists(interaction, user, kind, statuses):
 			'service_id': userData['service_id'],
 			'profile': userData['profile']
 		}
+		await Resources.lists.fill([userData], [kind], statuses)
 		for e in userData['lists'][kind].values():
 			if e['status'] in statuses:
 				data['lists'][e['status']].append(e)
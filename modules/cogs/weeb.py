@@ -655,29 +655,34 @@ async def embedScores(guild, anilistId, malId, listType, maxDisplay, embed):
 		# get all users in db that are in this guild and have the show on their list
 		userIdsInGuild = [str(u.id) for u in guild.members]
 
-		users = [d async for d in Resources.user_col.find(
-			{
-				'discord_id': {'$in': userIdsInGuild},
-				'status': { '$not': { '$eq': UserStatus.INACTIVE } },
-				'$or': [
-					{
-						'$and': [{'service': 'anilist'}, {f"lists.{listType}.{anilistId}": {'$exists': True}}]
-					},
-					{
-						'$and': [{'service': 'myanimelist'}, {f"lists.{listType}.{malId}": {'$exists': True}}]
-					}
-				]        
-			},
-			{
-				'service': 1,
-				'profile.name': 1,
-				'profile.score_format': 1,
-				'profile.favourites': 1,
-				f"lists.{listType}.{anilistId}": 1,
-				f"lists.{listType}.{malId}": 1
-			}
-			)
-		]
+		profile = {
+			'service': 1,
+			'profile.name': 1,
+			'profile.score_format': 1,
+			'profile.favourites': 1,
+		}
+		users = await indexedUsers({'anilist': [anilistId], 'myanimelist': [malId]}, listType, userIdsInGuild, profile)
+		if users is None: # index still building
+			users = [d async for d in Resources.user_col.find(
+				{
+					'discord_id': {'$in': userIdsInGuild},
+					'status': { '$not': { '$eq': UserStatus.INACTIVE } },
+					'$or': [
+						{
+							'$and': [{'service': 'anilist'}, {f"lists.{listType}.{anilistId}": {'$exists': True}}]
+						},
+						{
+							'$and': [{'service': 'myanimelist'}, {f"lists.{listType}.{malId}": {'$exists': True}}]
+						}
+					]        
+				},
+				{
+					**profile,
+					f"lists.{listType}.{anilistId}": 1,
+					f"lists.{listType}.{malId}": 1
+				}
+				)
+			]
 
 		avg = calculateMean(users, malId, anilistId, listType)
 		if avg:
@@ -700,6 +705,34 @@ async def embedScores(guild, anilistId, malId, listType, maxDisplay, embed):
 		else:
 			return None
 
+async def indexedUsers(service_ids, listType, userIdsInGuild, projection):
+	"""Active guild members that have any of service_ids (service -> media ids)
+	on listType, as user documents holding just those entries. None if the
+	media index isn't built yet (the user documents still have the lists then)"""
+	if not Resources.lists.ready:
+		return None
+	service_ids = {service: [i for i in ids if i is not None] for service, ids in service_ids.items()}
+	rows = await Resources.lists.holders(service_ids, listType, userIdsInGuild)
+	if not rows:
+		return []
+
+	entries = {}
+	for row in rows:
+		entry = {'status': row['status']}
+		entry['vote' if row['service'] == 'vndb' else 'score'] = row['score']
+		entries.setdefault(row['user'], {})[row['media_id']] = entry
+
+	users = [d async for d in Resources.user_col.find(
+		{
+			'_id': {'$in': list(entries)},
+			'status': { '$not': { '$eq': UserStatus.INACTIVE } },
+		},
+		projection
+	)]
+	for user in users:
+		user['lists'] = {listType: entries[user['_id']]}
+	return users
+
 def userScoreEmbeder(user, showID, listType, embed):
 	entry = user['lists'][listType][str(showID)]
 	status = statusConversion(entry['status'], listType)
@@ -735,21 +768,23 @@ async def embedVnScores(guild, vnId, maxDisplay, embed):
 	norm_id = vnId if vnId.startswith('v') else f"v{vnId}"
 	alt_id = norm_id[1:] if norm_id.startswith('v') else norm_id
 
-	users = [d async for d in Resources.user_col.find(
-		{
-			'discord_id': {'$in': userIdsInGuild},
-			'status': { '$not': { '$eq': UserStatus.INACTIVE } },
-			'service': 'vndb',
-			'$or': [
-				{f"lists.vn.{norm_id}": {'$exists': True}},
-				{f"lists.vn.{alt_id}": {'$exists': True}},
-			]
-		},
-		{
-			'profile.name': 1,
-			'lists.vn': 1
-		}
-	)]
+	users = await indexedUsers({'vndb': [norm_id, alt_id]}, 'vn', userIdsInGuild, {'profile.name': 1})
+	if users is None: # index still building
+		users = [d async for d in Resources.user_col.find(
+			{
+				'discord_id': {'$in': userIdsInGuild},
+				'status': { '$not': { '$eq': UserStatus.INACTIVE } },
+				'service': 'vndb',
+				'$or': [
+					{f"lists.vn.{norm_id}": {'$exists': True}},
+					{f"lists.vn.{alt_id}": {'$exists': True}},
+				]
+			},
+			{
+				'profile.name': 1,
+				'lists.vn': 1
+			}
+		)]
 
 	if not users:
 		return None
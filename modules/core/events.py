@@ -3,6 +3,7 @@ from os import path
 
 from modules.core.client import Client
 from modules.core.resources import Resources
+from modules.core.reactions import ReactionMatcher
 
 bot = Client.bot
 
@@ -13,6 +14,7 @@ class Events:
 
 	@bot.event
 	async def on_ready(): #bot startup event
+		Resources.member_index.build(bot.guilds)
 
 		if bot.user.id == 727537208235524178:
 			print('Esports Club is ready to go!')
@@ -22,6 +24,41 @@ class Events:
 			print('Lain is online!')
 			await bot.change_presence(status=discord.Status.online, activity=status)
 
+	# keep member index current
+	@bot.event
+	async def on_member_join(member):
+		Resources.member_index.add(member)
+
+	@bot.event
+	async def on_member_remove(member):
+		Resources.member_index.remove(member)
+
+	@bot.event
+	async def on_member_update(before, after):
+		Resources.member_index.add(after)
+
+	@bot.event
+	async def on_user_update(before, after):
+		Resources.member_index.rename(before, after)
+
+	@bot.event
+	async def on_guild_join(guild):
+		Resources.member_index.add_guild(guild)
+
+	@bot.event
+	async def on_guild_remove(guild):
+		Resources.member_index.remove_guild(guild)
+
+	_reaction_matchers = {}
+
+	def reaction_matcher(guild_id, reactions):
+		# rebuilt whenever the cached guild document (and so its reactions list) is replaced
+		matcher = Events._reaction_matchers.get(guild_id)
+		if not matcher or matcher.source is not reactions:
+			matcher = ReactionMatcher(reactions)
+			Events._reaction_matchers[guild_id] = matcher
+		return matcher
+
 	def determine_reaction(msg, reactions):
 		for reaction in reactions:
 			if reaction['type'] == 'exact':
@@ -51,10 +88,10 @@ class Events:
 					await msg.channel.send('https://tenor.com/brJRK.gif')
 
 				# slower response but on the fly changes and per guild
-				reactions = await Resources.guild_col.find_one({'guild_id': str(msg.guild.id), 'reactions': {'$exists': True}}, {'reactions': 1})
-				if reactions:
+				guild = Resources.guild_settings.get(msg.guild.id)
+				if guild and 'reactions' in guild:
 					try:
-						reaction = await bot.loop.run_in_executor(None, Events.determine_reaction, msg.content, reactions['reactions'])
+						reaction = Events.reaction_matcher(msg.guild.id, guild['reactions']).match(msg.content)
 						if reaction:
 							await msg.channel.send(reaction)
 					except:
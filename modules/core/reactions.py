@@ -0,0 +1,81 @@
+import logging, random, re, string
+logger = logging.getLogger(__name__)
+
+_strip_punctuation = str.maketrans('', '', string.punctuation)
+_delimiters = re.compile('[ \n]')
+_regex_chars = set('.^$*+?{}[]\\|()')
+
+class ReactionMatcher:
+	"""A guild's reactions compiled for matching a message in one pass.
+
+	Gives the same answer as Events.determine_reaction: the first reaction (in
+	list order) whose trigger matches wins. 'exact' triggers are a dict lookup
+	on the message. Plain word/phrase 'in' triggers are a dict keyed by the
+	phrase, looked up with every run of space/newline separated words in the
+	punctuation-stripped message that has a trigger's word count. 'in' triggers
+	using regex syntax are compiled once and only tried if they could beat the
+	best plain match.
+	"""
+
+	__slots__ = ['source', '_reactions', '_exact', '_phrases', '_phrase_lengths', '_patterns']
+
+	def __init__(self, reactions):
+		self.source = reactions
+		self._reactions = []
+		self._exact = {}
+		self._phrases = {}
+		self._phrase_lengths = set()
+		self._patterns = []
+		for idx, reaction in enumerate(reactions):
+			self._reactions.append(reaction)
+			trigger = reaction.get('trigger')
+			if not isinstance(trigger, str):
+				continue
+			if reaction.get('type') == 'exact':
+				self._exact.setdefault(trigger, idx)
+			elif reaction.get('type') == 'in':
+				words = trigger.split(' ')
+				if _regex_chars.isdisjoint(trigger) and '\n' not in trigger and all(words):
+					self._phrases.setdefault(trigger, idx)
+					self._phrase_lengths.add(len(words))
+				else:
+					try:
+						self._patterns.append((idx, re.compile(f"(^| |\n){trigger}($| |\n)")))
+					except re.error:
+						logger.warning(f"Skipping reaction with invalid trigger: {trigger}")
+
+	def match(self, msg):
+		"""Response for msg or None"""
+		best = self._exact.get(msg)
+
+		if self._phrases or self._patterns:
+			clean_msg = msg.translate(_strip_punctuation)
+
+			if self._phrases:
+				# word spans as (start, end) offsets so phrases keep the message's own separators
+				spans = []
+				start = 0
+				for sep in _delimiters.finditer(clean_msg):
+					spans.append((start, sep.start()))
+					start = sep.end()
+				spans.append((start, len(clean_msg)))
+
+				for n in self._phrase_lengths:
+					for i in range(len(spans) - n + 1):
+						idx = self._phrases.get(clean_msg[spans[i][0]:spans[i+n-1][1]])
+						if idx is not None and (best is None or idx < best):
+							best = idx
+
+			for idx, pattern in self._patterns:
+				if best is not None and idx > best:
+					break
+				if pattern.search(clean_msg):
+					best = idx
+					break
+
+		if best is None:
+			return None
+		reaction = self._reactions[best]
+		if 'response' in reaction:
+			return reaction['response']
+		return reaction['responses'][random.randint(0, len(reaction['responses'])-1)]
@@ -1,9 +1,16 @@
 import pytz, os, aiohttp
 
-from .database import Database
+from .database import Database, BulkWriter
 from .img_gen import ImageGenerator as img_gen
 from .al2mal2al import Al2mal2al
+from .member_index import MemberIndex
+from .guild_settings import GuildSettingsCache
+from .media_index import MediaIndex
+from .list_repository import ListRepository
+from .quarantine import Quarantine
 from modules.services.vndb_ratelimit import VndbRateLimiter
+from modules.services.anilist_ratelimit import AnilistRateLimiter
+from modules.services.mal_ratelimit import MalRateLimiter
 
 db_url = 'mongodb://'+os.getenv('DBUSER')+':'+os.getenv('DBKEY')+'@' + os.getenv('DBPATH')
 if not bool(os.getenv('NON_SRV_DB', default=False)):
@@ -13,8 +20,13 @@ class Resources:
     session = None
     syncer_session = None
     vndb_rate_limiter = VndbRateLimiter()
+    anilist_rate_limiter = AnilistRateLimiter(reserve=int(os.getenv('ANILIST_INTERACTIVE_RESERVE', default=10)))
+    mal_rate_limiter = MalRateLimiter(concurrency=int(os.getenv('MAL_CONCURRENCY', default=4)))
     user_col = Database(db_url, 'v2', 'users')
     guild_col = Database(db_url, 'v2', 'guilds')
+    guild_settings = GuildSettingsCache(guild_col)
+    media_index = MediaIndex(Database(db_url, 'v2', 'media_index'), user_col)
+    lists = ListRepository(user_col, Database(db_url, 'v2', 'entries'), media_index, os.getenv('LIST_STORAGE', default=ListRepository.DOCUMENT))
     storage_col = Database(db_url, 'lain-bot', 'storage')
     timezone_str = 'US/Central'
     timezone = pytz.timezone(timezone_str)
@@ -23,10 +35,19 @@ class Resources:
     status_buffers = {}
     sync_resume_buffers = {}
     al2mal2al = Al2mal2al()
+    compat_col = Database(db_url, 'v2', 'compatibility')
+    compatibility = None # CompatibilityStore, set up when services register
+    quarantine = Quarantine(Database(db_url, 'v2', 'quarantine'))
+    display_col = Database(db_url, 'v2', 'display_queue') # updates from sync workers for the bot to post
+    lease_col = Database(db_url, 'v2', 'sync_leases')
+    member_index = MemberIndex(rest_fallback=bool(os.getenv('MEMBER_REST_FALLBACK', default=False)))
 
     selectors =  ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣', '8️⃣', '9️⃣', '🇦', '🇧', '🇨', '🇩', '🇪', '🇫', '🇬', '🇭', '🇮', '🇯', '🇰', '🇱', '🇲', '🇳', '🇴', '🇵', '🇶', '🇷', '🇸', '🇹', '🇺', '🇻', '🇼', '🇽', '🇾', '🇿', '🔴', '🟠', '🟡', '🟢', '🔵', '🟣', '🟤', '🔺', '🔻', '🔸', '🔹', '🔶', '🔷', '🔳', '🔲', '▫️', '◼️', '◻️', '🟥', '🟧', '🟨', '🟩', '🟦', '🟪', '🟫', '♈', '♉', '♊', '♍', '♌', '♋', '♎', '♏', '♐', '♓', '♒', '♑', '⛎']
 
     @staticmethod
     async def init():
         Resources.session = aiohttp.ClientSession(raise_for_status=True)
-        Resources.syncer_session = aiohttp.ClientSession()
\ No newline at end of file
+        Resources.syncer_session = aiohttp.ClientSession()
+        await Resources.guild_settings.start()
+        await Resources.lists.start()
+        await Resources.quarantine.start()
\ No newline at end of file
@@ -1,4 +1,8 @@
 import motor.motor_asyncio
+import logging, time
+from pymongo.errors import BulkWriteError
+
+logger = logging.getLogger(__name__)
 
 class Database:
 
@@ -14,6 +18,14 @@ class Database:
 		else:
 			return res
 
+	async def delete_many(self, filter):
+		try:
+			res = await self.collection.delete_many(filter)
+		except:
+			return None
+		else:
+			return res
+
 	async def update_one(self, filter, update, upsert=False):
 		try:
 			res = await self.collection.update_one(filter, update, upsert)
@@ -30,6 +42,14 @@ class Database:
 		else:
 			return res
 
+	async def find_one_and_update(self, filter, update, upsert=False, **kwargs):
+		try:
+			res = await self.collection.find_one_and_update(filter, update, upsert=upsert, **kwargs)
+		except:
+			return None
+		else:
+			return res
+
 	async def find_one(self, filter, projection=None):
 		try:
 			res = await self.collection.find_one(filter, projection)
@@ -42,4 +62,92 @@ class Database:
 		return self.collection.find(filter, projection)
 
 	def aggregate(self, pipeline=[]):
-		return self.collection.aggregate(pipeline)
\ No newline at end of file
+		return self.collection.aggregate(pipeline)
+
+class BulkWriter:
+	"""Buffers writes to a Database and sends them as one unordered bulk_write.
+
+	Writes are queued by key as a function that builds the pymongo operation.
+	The builder is only called at flush time so it can check anything that may
+	have changed while the write was waiting (and return None to drop it). A
+	later write for the same key replaces the earlier one.
+
+	Attributes:
+		max_ops: flush once this many writes are waiting
+		max_delay: flush once the oldest waiting write is this many seconds old
+		flushes, written, errors: running totals
+		last_latency: seconds the last bulk_write took
+		flushed: keys handled by the last flush, including dropped writes
+		failed: the ones among them whose write didn't make it
+	"""
+
+	def __init__(self, db, max_ops=100, max_delay=30):
+		self.db = db
+		self.max_ops = max_ops
+		self.max_delay = max_delay
+		self._pending = {}
+		self._oldest = None
+		self.flushes = 0
+		self.written = 0
+		self.errors = 0
+		self.last_latency = 0
+		self.flushed = set()
+		self.failed = set()
+
+	def __len__(self):
+		return len(self._pending)
+
+	def add(self, key, build):
+		if not self._pending:
+			self._oldest = time.monotonic()
+		self._pending[key] = build
+
+	@property
+	def due(self):
+		if not self._pending:
+			return False
+		return len(self._pending) >= self.max_ops or time.monotonic() - self._oldest >= self.max_delay
+
+	async def flush_if_due(self):
+		if self.due:
+			return await self.flush()
+		return None
+
+	async def flush(self):
+		pending = self._pending
+		self._pending = {}
+		self._oldest = None
+		self.flushed = set(pending)
+		self.failed = set()
+
+		ops = []
+		keys = []
+		for key, build in pending.items():
+			op = build()
+			if op is not None:
+				ops.append(op)
+				keys.append(key)
+		if not ops:
+			return None
+
+		start = time.monotonic()
+		errors = 0
+		res = None
+		try:
+			res = await self.db.collection.bulk_write(ops, ordered=False)
+		except BulkWriteError as e:
+			write_errors = e.details.get('writeErrors', [])
+			errors = len(write_errors)
+			self.failed = {keys[err['index']] for err in write_errors}
+			logger.warning(f"bulk write to {self.db.collection.name} had {errors} errors: {write_errors[:3]}")
+		except Exception:
+			errors = len(ops)
+			self.failed = set(keys)
+			logger.exception(f"bulk write to {self.db.collection.name} failed")
+		self.last_latency = time.monotonic() - start
+
+		self.flushes += 1
+		self.written += len(ops) - errors
+		self.errors += errors
+		logger.info(f"flushed {len(ops)} writes to {self.db.collection.name} in {self.last_latency*1000:.0f}ms ({errors} errors)")
+		return res
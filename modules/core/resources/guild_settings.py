@@ -0,0 +1,94 @@
+import asyncio, logging
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+class GuildSettingsCache:
+	"""Every guild document kept in memory by guild_id.
+
+	Loaded once at startup and kept current from a change stream on the
+	collection. Deployments without a replica set can't open change streams so
+	it falls back to reloading everything every ttl seconds. Writes made
+	through update_one land in the cache as soon as the database confirms them.
+	"""
+
+	def __init__(self, db, ttl=300):
+		self.db = db
+		self.ttl = ttl
+		self._guilds = {}
+		self._ids = {} # document _id -> guild_id, change stream deletes only have _id
+		self._task = None
+
+	async def start(self):
+		await self.load()
+		if not self._task:
+			self._task = asyncio.create_task(self._watch())
+
+	async def load(self):
+		guilds = {}
+		ids = {}
+		try:
+			async for doc in self.db.find({}):
+				guilds[doc['guild_id']] = doc
+				ids[doc['_id']] = doc['guild_id']
+		except Exception:
+			logger.exception('Loading guild settings failed')
+			return
+		self._guilds = guilds
+		self._ids = ids
+
+	def get(self, guild_id, default=None):
+		return self._guilds.get(str(guild_id), default)
+
+	def get_many(self, guild_ids):
+		return [self._guilds[str(i)] for i in guild_ids if str(i) in self._guilds]
+
+	async def update_one(self, guild_id, update, upsert=False):
+		"""Write through to the database and cache the updated document"""
+		guild_id = str(guild_id)
+		doc = await self.db.find_one_and_update({'guild_id': guild_id}, update, upsert=upsert, return_document=ReturnDocument.AFTER)
+		if doc:
+			self._store(doc)
+		return doc
+
+	def _store(self, doc):
+		self._guilds[doc['guild_id']] = doc
+		self._ids[doc['_id']] = doc['guild_id']
+
+	def _apply(self, change):
+		op = change.get('operationType')
+		if op in ('insert', 'update', 'replace'):
+			doc = change.get('fullDocument')
+			if doc and 'guild_id' in doc:
+				self._store(doc)
+		elif op == 'delete':
+			guild_id = self._ids.pop(change['documentKey']['_id'], None)
+			if guild_id:
+				self._guilds.pop(guild_id, None)
+		elif op in ('drop', 'rename', 'dropDatabase', 'invalidate'):
+			self._guilds = {}
+			self._ids = {}
+
+	async def _watch(self):
+		while True:
+			try:
+				async with self.db.collection.watch(full_document='updateLookup') as stream:
+					async for change in stream:
+						self._apply(change)
+			except asyncio.CancelledError:
+				raise
+			except OperationFailure as e:
+				# no replica set (or not allowed to watch), poll instead
+				logger.info(f"Guild settings change stream unavailable ({e.code}), polling every {self.ttl}s")
+				return await self._poll()
+			except Exception:
+				logger.exception('Guild settings change stream failed, reconnecting')
+			# may have missed changes while disconnected
+			await asyncio.sleep(10)
+			await self.load()
+
+	async def _poll(self):
+		while True:
+			await asyncio.sleep(self.ttl)
+			await self.load()
@@ -0,0 +1,284 @@
+import logging
+from pymongo import UpdateOne, DeleteOne, DeleteMany
+
+from .media_index import MediaIndex
+
+logger = logging.getLogger(__name__)
+
+class ListRepository:
+	"""Where users' list entries are read from and written to.
+
+	Entries have always lived in the user document as lists.<list>.<id>. They
+	can also be kept in an entries collection, one row per (user, list,
+	media_id) holding the entry plus its status and score, so reads only pull
+	the rows they need. mode picks the layout:
+
+		document: user documents only (the default)
+		dual: written to both. Users copied over by migrate() are read from the
+			entries collection, everyone else from their document
+		entries: entries collection only. Run migrate() (and then
+			migrate(finish=True) to drop the old lists) before switching
+
+	Everything that reads or writes list entries goes through here. The media
+	index is kept up to date alongside while user documents still hold the
+	lists; once they don't, the entries collection answers holders() itself.
+	"""
+
+	DOCUMENT = 'document'
+	DUAL = 'dual'
+	ENTRIES = 'entries'
+	REVISION = 'lists_rev' # bumped on a user document whenever the syncer changes its lists in dual mode
+
+	def __init__(self, user_db, entries_db, media_index, mode=DOCUMENT):
+		if mode not in (self.DOCUMENT, self.DUAL, self.ENTRIES):
+			logger.error(f"Unknown list storage '{mode}', using {self.DOCUMENT}")
+			mode = self.DOCUMENT
+		self.user_db = user_db
+		self.entries_db = entries_db
+		self.media_index = media_index
+		self.mode = mode
+		self._ops = [] # (user key, op)
+
+	async def start(self):
+		if self.mode != self.DOCUMENT:
+			try:
+				await self.entries_db.collection.create_index([('user', 1), ('list', 1), ('media_id', 1)], unique=True)
+				await self.entries_db.collection.create_index([('user', 1), ('list', 1), ('status', 1)])
+				await self.entries_db.collection.create_index([('list', 1), ('media_id', 1)])
+			except Exception:
+				logger.exception('Could not create entries indexes')
+		if self.mode != self.ENTRIES:
+			await self.media_index.start()
+
+	@property
+	def writes_documents(self):
+		return self.mode != self.ENTRIES
+
+	@property
+	def writes_entries(self):
+		return self.mode != self.DOCUMENT
+
+	@property
+	def tracks_revisions(self):
+		return self.mode == self.DUAL
+
+	@property
+	def reads_entries(self):
+		"""Whether user documents come without their lists"""
+		return self.mode == self.ENTRIES
+
+	@property
+	def ready(self):
+		return self.mode == self.ENTRIES or self.media_index.ready
+
+	### reads ###
+
+	def projection(self, lists):
+		"""Fields to add to a user document query so fill() can do its job"""
+		if self.mode == self.ENTRIES:
+			return {}
+		projection = {f"lists.{lst}": 1 for lst in lists}
+		if self.mode == self.DUAL:
+			projection['entries_migrated'] = 1
+		return projection
+
+	def _from_entries(self, doc):
+		return self.mode == self.ENTRIES or (self.mode == self.DUAL and doc.get('entries_migrated'))
+
+	async def fill(self, docs, lists, statuses=None):
+		"""Make sure each user document has lists.<list> for every list in lists,
+		optionally only the entries with one of statuses"""
+		from_entries = {doc['_id']: doc for doc in docs if self._from_entries(doc)}
+		for doc in docs:
+			doc_lists = doc.setdefault('lists', {})
+			for lst in lists:
+				if doc['_id'] in from_entries:
+					doc_lists[lst] = {}
+				elif statuses is not None:
+					doc_lists[lst] = {i: e for i, e in (doc_lists.get(lst) or {}).items() if e.get('status') in statuses}
+				else:
+					doc_lists.setdefault(lst, {})
+		if not from_entries:
+			return docs
+
+		filter = {'user': {'$in': list(from_entries)}, 'list': {'$in': list(lists)}}
+		if statuses is not None:
+			filter['status'] = {'$in': list(statuses)}
+		async for row in self.entries_db.find(filter, {'user': 1, 'list': 1, 'media_id': 1, 'entry': 1}):
+			from_entries[row['user']]['lists'][row['list']][row['media_id']] = row['entry']
+		return docs
+
+	async def score_docs(self, filter, lst, projection={}):
+		"""User documents matching filter with lists.<lst> trimmed down to
+		{media id: {'score': score}}"""
+		if self.mode == self.ENTRIES:
+			docs = await self.user_db.find(filter, {'service': 1, 'profile.score_format': 1, **projection}).to_list(length=None)
+			by_id = {doc['_id']: doc for doc in docs}
+			for doc in docs:
+				doc['lists'] = {lst: {}}
+			if by_id:
+				async for row in self.entries_db.find({'user': {'$in': list(by_id)}, 'list': lst}, {'user': 1, 'media_id': 1, 'score': 1}):
+					by_id[row['user']]['lists'][lst][row['media_id']] = {'score': row.get('score')}
+			return docs
+		return [d async for d in self.user_db.aggregate([
+			{'$match': filter},
+			{
+				# only scores are needed, leave the rest of each entry in the db
+				'$project': {
+					**projection,
+					'service': 1,
+					'profile.score_format': 1,
+					'lists': {
+						lst: {
+							'$arrayToObject': {
+								'$map': {
+									'input': {'$objectToArray': {'$ifNull': [f"$lists.{lst}", {}]}},
+									'in': {'k': '$$this.k', 'v': {'score': '$$this.v.score'}}
+								}
+							}
+						}
+					}
+				}
+			}
+		])]
+
+	async def holders(self, service_ids, lst, discord_ids=None):
+		"""Rows (user, discord_id, service, media_id, status, score) for media on
+		lst, service_ids maps a service to the media ids to look for on it. Only
+		users in discord_ids if given"""
+		if self.mode != self.ENTRIES:
+			return await self.media_index.holders(service_ids, lst, discord_ids)
+		members = set(discord_ids) if discord_ids is not None else None
+		clauses = [
+			{'list': lst, 'media_id': {'$in': [str(i) for i in ids]}, 'service': service}
+			for service, ids in service_ids.items() if ids
+		]
+		if not clauses:
+			return []
+		rows = []
+		async for row in self.entries_db.find({'$or': clauses}, {'entry': 0}):
+			if members is None or row['discord_id'] in members:
+				rows.append(row)
+		return rows
+
+	### writes ###
+
+	@staticmethod
+	def _row(user_id, discord_id, service, lst, media_id, entry):
+		return {
+			'user': user_id,
+			'discord_id': discord_id,
+			'service': service,
+			'list': lst,
+			'media_id': str(media_id),
+			'status': entry.get('status'),
+			'score': entry['score'] if 'score' in entry else entry.get('vote'),
+			'entry': entry,
+		}
+
+	def queue(self, user, lst, changed, removed):
+		"""Queue writes for one of user's lists: changed maps media id to
+		(old entry or None, new entry), removed is media ids that left the list.
+		The user document's own lists.<list> paths are part of the user's write"""
+		if self.mode != self.ENTRIES:
+			indexed = {
+				i: new for i, (old, new) in changed.items()
+				if old is None or any(old.get(f) != new.get(f) for f in ('status', 'score', 'vote'))
+			}
+			self.media_index.queue(user, lst, indexed, removed)
+		if not self.writes_entries:
+			return
+		for media_id, (_, entry) in changed.items():
+			if media_id == 'None': # myanimelist placeholder before the first sync
+				continue
+			self._ops.append((str(user._id), UpdateOne(
+				{'user': user._id, 'list': lst, 'media_id': str(media_id)},
+				{'$set': self._row(user._id, user.discord_id, user.service, lst, media_id, entry)},
+				upsert=True
+			)))
+		for media_id in removed:
+			self._ops.append((str(user._id), DeleteOne({'user': user._id, 'list': lst, 'media_id': str(media_id)})))
+
+	async def apply(self, written=None, failed=()):
+		"""Send queued writes. written: user keys whose document writes landed,
+		only their rows are written (everyone's if None) and the rest stay
+		queued. failed: user keys whose writes didn't land, their rows are
+		dropped so they never hold what the document doesn't"""
+		if self.mode != self.ENTRIES:
+			await self.media_index.apply(written, failed)
+		ops, self._ops = MediaIndex.take(self._ops, written, failed)
+		if not ops:
+			return
+		try:
+			await self.entries_db.collection.bulk_write(ops, ordered=True)
+		except Exception:
+			logger.exception(f"Entries update of {len(ops)} rows failed")
+
+	def _user_ops(self, user_id, discord_id, service, lists):
+		"""Writes that leave exactly lists in the entries collection for a user.
+		Rows are upserted one at a time and only rows not on lists are deleted
+		after, so the user's rows never disappear while it runs"""
+		ops = []
+		kept = []
+		for lst, entries in (lists or {}).items():
+			ids = []
+			for media_id, entry in (entries or {}).items():
+				if media_id == 'None' or not isinstance(entry, dict):
+					continue
+				ids.append(str(media_id))
+				ops.append(UpdateOne(
+					{'user': user_id, 'list': lst, 'media_id': str(media_id)},
+					{'$set': self._row(user_id, discord_id, service, lst, media_id, entry)},
+					upsert=True
+				))
+			kept.append({'list': lst, 'media_id': {'$in': ids}})
+		ops.append(DeleteMany({'user': user_id, '$nor': kept} if kept else {'user': user_id}))
+		return ops
+
+	async def set_user(self, user_id, discord_id, service, lists):
+		"""Replace everything stored for a user's lists besides their document,
+		which the caller writes"""
+		if self.mode != self.ENTRIES:
+			await self.media_index.set_user(user_id, discord_id, service, lists)
+		if self.writes_entries:
+			try:
+				await self.entries_db.collection.bulk_write(self._user_ops(user_id, discord_id, service, lists), ordered=True)
+				if self.mode == self.DUAL:
+					await self.user_db.update_one({'_id': user_id}, {'$set': {'entries_migrated': True}})
+			except Exception:
+				logger.exception(f"Could not store entries for {service} user {discord_id}")
+
+	async def remove_user(self, user_id):
+		if self.mode != self.ENTRIES:
+			await self.media_index.remove_user(user_id)
+		if self.writes_entries:
+			await self.entries_db.delete_many({'user': user_id})
+
+	async def migrate(self, finish=False):
+		"""Copy lists from every user document not copied yet into the entries
+		collection. With finish, drop lists from documents already copied.
+		Returns (users, rows) handled. Safe to run again: a user the syncer
+		changed while they were being copied isn't marked as copied, so they
+		keep being read from their document and are copied again next run"""
+		users = rows = stale = 0
+		if finish:
+			res = await self.user_db.update_many({'entries_migrated': True, 'lists': {'$exists': True}}, {'$unset': {'lists': ''}})
+			return (res.modified_count if res else 0, 0)
+		async for doc in self.user_db.find({'entries_migrated': {'$ne': True}, 'lists': {'$exists': True}}, {'discord_id': 1, 'service': 1, 'lists': 1, self.REVISION: 1}):
+			ops = self._user_ops(doc['_id'], doc['discord_id'], doc['service'], doc.get('lists'))
+			await self.entries_db.collection.bulk_write(ops, ordered=True)
+			res = await self.user_db.update_one({'_id': doc['_id'], self.REVISION: doc.get(self.REVISION)}, {'$set': {'entries_migrated': True}})
+			if not res or not res.modified_count:
+				stale += 1
+				continue
+			users += 1
+			rows += len(ops) - 1
+		logger.info(f"Migrated {rows} entries of {users} users ({stale} changed while copying, run again for them)")
+		return (users, rows)
+
+	async def status(self):
+		"""(users copied to the entries collection, users not yet, entry rows)"""
+		migrated = await self.user_db.collection.count_documents({'entries_migrated': True})
+		pending = await self.user_db.collection.count_documents({'entries_migrated': {'$ne': True}, 'lists': {'$exists': True}})
+		rows = await self.entries_db.collection.estimated_document_count()
+		return (migrated, pending, rows)
@@ -0,0 +1,143 @@
+import asyncio, logging
+from pymongo import UpdateOne, DeleteOne, DeleteMany, InsertOne
+
+logger = logging.getLogger(__name__)
+
+class MediaIndex:
+	"""Which users have a given media on their list.
+
+	One row per (service, list, media_id, user) in its own collection, holding
+	the entry's status and score (vndb's vote) plus the user's discord_id so a
+	guild lookup is a single indexed query intersected with the member list.
+	The syncers queue row changes as they build each user's write and apply()
+	sends them after the user writes land. Built from the user documents the
+	first time it starts, and again on later starts until a build has run to
+	the end and left its marker; until then ready is False and callers should
+	query the user documents instead.
+	"""
+
+	_BUILT = {'_id': 'built'} # marker document written once a build finished
+
+	def __init__(self, db, user_db):
+		self.db = db
+		self.user_db = user_db
+		self.ready = False
+		self._ops = [] # (user key, op)
+		self._task = None
+
+	async def start(self):
+		try:
+			await self.db.collection.create_index([('service', 1), ('list', 1), ('media_id', 1), ('user', 1)], unique=True)
+			await self.db.collection.create_index([('user', 1)])
+			self.ready = bool(await self.db.collection.find_one(self._BUILT))
+		except Exception:
+			logger.exception('Could not set up the media index')
+			return
+		if not self.ready and not self._task:
+			self._task = asyncio.create_task(self.rebuild())
+
+	@staticmethod
+	def _row(user_id, discord_id, service, lst, media_id, entry):
+		return {
+			'service': service,
+			'list': lst,
+			'media_id': str(media_id),
+			'user': user_id,
+			'discord_id': discord_id,
+			'status': entry.get('status'),
+			'score': entry['score'] if 'score' in entry else entry.get('vote'),
+		}
+
+	def queue(self, user, lst, entries, removed):
+		"""Queue index changes for one of user's lists: entries maps media id to
+		the new entry for everything added or changed, removed is media ids that
+		left the list"""
+		for media_id, entry in entries.items():
+			if media_id == 'None': # myanimelist placeholder before the first sync
+				continue
+			row = self._row(user._id, user.discord_id, user.service, lst, media_id, entry)
+			self._ops.append((str(user._id), UpdateOne(
+				{'service': user.service, 'list': lst, 'media_id': str(media_id), 'user': user._id},
+				{'$set': row},
+				upsert=True
+			)))
+		for media_id in removed:
+			self._ops.append((str(user._id), DeleteOne({'service': user.service, 'list': lst, 'media_id': str(media_id), 'user': user._id})))
+
+	@staticmethod
+	def take(queued, written=None, failed=()):
+		"""Split queued (user key, op) pairs into the ops to send now and the
+		pairs to keep queued. written: user keys whose document writes landed,
+		only their ops are sent (all of them if None), the rest stay queued.
+		failed: user keys whose writes didn't land, their ops are dropped"""
+		failed = set(failed)
+		written = set(written) if written is not None else None
+		ops, keep = [], []
+		for key, op in queued:
+			if key in failed:
+				continue
+			if written is None or key in written:
+				ops.append(op)
+			else:
+				keep.append((key, op))
+		return ops, keep
+
+	async def apply(self, written=None, failed=()):
+		"""Send queued row changes, see take() for written and failed"""
+		ops, self._ops = self.take(self._ops, written, failed)
+		if not ops:
+			return
+		try:
+			await self.db.collection.bulk_write(ops, ordered=True)
+		except Exception:
+			logger.exception(f"Media index update of {len(ops)} rows failed")
+
+	def _user_ops(self, user_id, discord_id, service, lists):
+		ops = [DeleteMany({'user': user_id})]
+		for lst, entries in (lists or {}).items():
+			for media_id, entry in (entries or {}).items():
+				if media_id == 'None' or not isinstance(entry, dict):
+					continue
+				ops.append(InsertOne(self._row(user_id, discord_id, service, lst, media_id, entry)))
+		return ops
+
+	async def set_user(self, user_id, discord_id, service, lists):
+		"""(Re)index everything on a user's lists"""
+		self._ops.extend((str(user_id), op) for op in self._user_ops(user_id, discord_id, service, lists))
+		await self.apply([str(user_id)])
+
+	async def remove_user(self, user_id):
+		self._ops.append((str(user_id), DeleteMany({'user': user_id})))
+		await self.apply([str(user_id)])
+
+	async def rebuild(self):
+		"""Reindex every user document"""
+		count = 0
+		try:
+			async for doc in self.user_db.find({}, {'discord_id': 1, 'service': 1, 'lists': 1}):
+				ops = self._user_ops(doc['_id'], doc['discord_id'], doc['service'], doc.get('lists'))
+				count += len(ops) - 1
+				await self.db.collection.bulk_write(ops, ordered=True)
+			await self.db.collection.replace_one(self._BUILT, {**self._BUILT, 'rows': count}, upsert=True)
+		except Exception:
+			logger.exception('Building the media index failed')
+			return count
+		self.ready = True
+		logger.info(f"Media index built with {count} rows")
+		return count
+
+	async def holders(self, service_ids, lst, discord_ids=None):
+		"""Index rows for media on lst, service_ids maps a service to the media
+		ids to look for on it. Only users in discord_ids if given"""
+		members = set(discord_ids) if discord_ids is not None else None
+		clauses = [
+			{'service': service, 'list': lst, 'media_id': {'$in': [str(i) for i in ids]}}
+			for service, ids in service_ids.items() if ids
+		]
+		if not clauses:
+			return []
+		rows = []
+		async for row in self.db.find({'$or': clauses}):
+			if members is None or row['discord_id'] in members:
+				rows.append(row)
+		return rows
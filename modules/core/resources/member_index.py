@@ -0,0 +1,77 @@
+class MemberIndex:
+	"""discord id -> {guild id: display name} for every member the bot can see.
+
+	Built from the gateway member cache on ready and kept current from member
+	join/leave/update events, so finding which guilds a user is in (and their
+	nickname there) doesn't need a REST call per guild. Ids are stored as str
+	like they are in the database.
+	"""
+	__slots__ = ['_members', 'built', 'rest_fallback']
+
+	def __init__(self, rest_fallback=False):
+		self._members = {}
+		self.built = False
+		self.rest_fallback = rest_fallback # ask discord about users missing from the index
+
+	def build(self, guilds):
+		members = {}
+		for guild in guilds:
+			gid = str(guild.id)
+			for member in guild.members:
+				members.setdefault(str(member.id), {})[gid] = _display_name(member)
+		self._members = members
+		self.built = True
+
+	def add(self, member):
+		self._members.setdefault(str(member.id), {})[str(member.guild.id)] = _display_name(member)
+
+	def remove(self, member):
+		guilds = self._members.get(str(member.id))
+		if guilds is None:
+			return
+		guilds.pop(str(member.guild.id), None)
+		if not guilds:
+			del self._members[str(member.id)]
+
+	def add_guild(self, guild):
+		for member in guild.members:
+			self.add(member)
+
+	def remove_guild(self, guild):
+		gid = str(guild.id)
+		for discord_id in list(self._members):
+			guilds = self._members[discord_id]
+			guilds.pop(gid, None)
+			if not guilds:
+				del self._members[discord_id]
+
+	def rename(self, before, after):
+		"""user changed their username. only matters where they have no nickname"""
+		guilds = self._members.get(str(after.id), {})
+		for gid in guilds:
+			if guilds[gid] == before.name:
+				guilds[gid] = after.name
+
+	def guilds(self, discord_id):
+		return self._members.get(str(discord_id), {})
+
+	def nick(self, discord_id, guild_id, default=''):
+		return self.guilds(discord_id).get(str(guild_id), default)
+
+	async def resolve(self, bot, discord_id):
+		"""Guilds (id -> display name) containing the user. Falls back on fetching
+		the member from each guild when the index misses, if enabled"""
+		if not self.built:
+			self.build(bot.guilds)
+		guilds = self.guilds(discord_id)
+		if guilds or not self.rest_fallback:
+			return guilds
+		for guild in bot.guilds:
+			try: member = await guild.fetch_member(int(discord_id))
+			except: member = None
+			if member:
+				self.add(member)
+		return self.guilds(discord_id)
+
+def _display_name(member):
+	return member.nick if member.nick else member.name
@@ -0,0 +1,72 @@
+import logging, time
+
+logger = logging.getLogger(__name__)
+
+class Quarantine:
+	"""Users a syncer should leave out of its batches for a while.
+
+	A user whose part of a query keeps erroring (private or deleted account,
+	...) is put here by (service, service_id) with exponential backoff: base
+	seconds after the first strike, doubling with each one after, up to
+	max_backoff. Once the time is up they're fetched again, a clean fetch
+	clears them and another failure adds a strike. Kept in memory and
+	written through to the collection so restarts don't start over.
+	"""
+
+	def __init__(self, db, base=15*60, max_backoff=7*24*60*60):
+		self.db = db
+		self.base = base
+		self.max_backoff = max_backoff
+		self._entries = {} # (service, service_id) -> document
+
+	async def start(self):
+		entries = {}
+		try:
+			async for doc in self.db.find({}):
+				entries[(doc['service'], doc['service_id'])] = doc
+		except Exception:
+			logger.exception('Loading quarantine failed')
+			return
+		self._entries = entries
+
+	@staticmethod
+	def _key(service, service_id):
+		return (service, str(service_id))
+
+	def blocked(self, service, service_id, now=None):
+		"""Whether the user is still serving out their backoff"""
+		entry = self._entries.get(self._key(service, service_id))
+		return bool(entry) and entry['until'] > (now or time.time())
+
+	def has(self, service, service_id):
+		return self._key(service, service_id) in self._entries
+
+	async def strike(self, service, service_id, error=None):
+		"""Quarantine a user, or extend it if they already were"""
+		key = self._key(service, service_id)
+		strikes = self._entries.get(key, {}).get('strikes', 0) + 1
+		backoff = min(self.max_backoff, self.base * 2 ** (strikes - 1))
+		doc = {
+			'service': key[0],
+			'service_id': key[1],
+			'strikes': strikes,
+			'until': time.time() + backoff,
+			'error': str(error)[:500] if error else None,
+		}
+		self._entries[key] = doc
+		logger.warning(f"{service} user {service_id} quarantined for {backoff/60:.0f}min (strike {strikes}): {doc['error']}")
+		await self.db.update_one({'service': key[0], 'service_id': key[1]}, {'$set': doc}, upsert=True)
+
+	async def release(self, service, service_id):
+		"""Take a user out of quarantine, returns whether they were in it"""
+		key = self._key(service, service_id)
+		if not self._entries.pop(key, None):
+			return False
+		await self.db.delete_one({'service': key[0], 'service_id': key[1]})
+		return True
+
+	def list(self, service=None):
+		return sorted(
+			(doc for doc in self._entries.values() if service is None or doc['service'] == service),
+			key=lambda doc: doc['until']
+		)
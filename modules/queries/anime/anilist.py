@@ -1,5 +1,17 @@
 import graphene
 import requests
+from modules.core.resources import Resources
+from modules.services.vndb_ratelimit import parse_retry_after
+
+def _post(url, **kwargs):
+	"""requests.post through the shared AniList rate limiter"""
+	Resources.anilist_rate_limiter.acquire_blocking()
+	response = requests.post(url, **kwargs)
+	if response.status_code == 429:
+		Resources.anilist_rate_limiter.mark_limited(parse_retry_after(response.headers.get('Retry-After')))
+	else:
+		Resources.anilist_rate_limiter.update(response.headers)
+	return response
 
 class Anilist(graphene.ObjectType):
 	def aniSearchManga(show):
@@ -49,7 +61,7 @@ class Anilist(graphene.ObjectType):
 
 		source = 'https://graphql.anilist.co'
 
-		response = requests.post(source, json={'query': query, 'variables': variables})
+		response = _post(source, json={'query': query, 'variables': variables})
 		result = response.json()
 
 		response.raise_for_status()
@@ -91,7 +103,7 @@ class Anilist(graphene.ObjectType):
 
 		url = 'https://graphql.anilist.co'
 
-		response = requests.post(url, json={'query': query, 'variables': variables})
+		response = _post(url, json={'query': query, 'variables': variables})
 		result = response.json()
 
 		response.raise_for_status()
@@ -151,7 +163,7 @@ class Anilist(graphene.ObjectType):
 
 		source = 'https://graphql.anilist.co'
 
-		response = requests.post(source, json={'query': query, 'variables': variables})
+		response = _post(source, json={'query': query, 'variables': variables})
 		result = response.json()
 
 		response.raise_for_status()
@@ -192,7 +204,7 @@ class Anilist(graphene.ObjectType):
 
 		url = 'https://graphql.anilist.co'
 
-		response = requests.post(url, json={'query': query, 'variables': variables})
+		response = _post(url, json={'query': query, 'variables': variables})
 		result = response.json()
 
 		response.raise_for_status()
@@ -250,7 +262,7 @@ class Anilist(graphene.ObjectType):
 
 		url = 'https://graphql.anilist.co'
 
-		response = requests.post(url, json={'query': query, 'variables': variables})
+		response = _post(url, json={'query': query, 'variables': variables})
 		result = response.json()
 		
 		response.raise_for_status()
@@ -276,7 +288,7 @@ class Anilist(graphene.ObjectType):
 
 		url = 'https://graphql.anilist.co'
 
-		response = requests.post(url, json={'query': query, 'variables': variables})
+		response = _post(url, json={'query': query, 'variables': variables})
 		result = response.json()
 
 		response.raise_for_status()
@@ -375,7 +387,7 @@ class Anilist(graphene.ObjectType):
 
 		url = 'https://graphql.anilist.co'
 
-		response = requests.post(url, json={'query': query, 'variables': variables})
+		response = _post(url, json={'query': query, 'variables': variables})
 		result = response.json()
 
 		response.raise_for_status()
@@ -1,4 +1,6 @@
 import logging
+from modules.core.resources import Resources
+from modules.services.vndb_ratelimit import parse_retry_after
 logger = logging.getLogger(__name__)
 
 class Anilist2:
@@ -148,9 +150,14 @@ class Anilist2:
 
 
     async def __request(session, query, variables):
+        await Resources.anilist_rate_limiter.acquire(interactive=True)
         async with session.post(Anilist2.apiUrl, json={'query': query, 'variables': variables}, raise_for_status=False) as resp:
             logger.debug("POST with vars %s returned status %s" % (variables,
                 resp.status))
+            if resp.status == 429:
+                Resources.anilist_rate_limiter.mark_limited(parse_retry_after(resp.headers.get('Retry-After')))
+            else:
+                Resources.anilist_rate_limiter.update(resp.headers)
             return await Anilist2.__resolveResponse(resp)
 
 
@@ -3,6 +3,7 @@ from .myanimelist import Description as myanimelist
 from .vndb import Description as vndb
 
 from enum import Enum
+import os
 
 class Meta(str):
     __slots__ = ['Profile', 'list_names', 'Query', 'link', 'time_between_queries']
@@ -58,16 +59,69 @@ class Service:
         return [Service.ANILIST, Service.MYANIMELIST, Service.VNDB]
 
     @staticmethod
-    async def register(bot):
+    async def start_stores():
+        """Stores the syncers keep up to date alongside the user documents"""
+        from .compatibility_store import CompatibilityStore
+        from modules.core.resources import Resources
+
+        Resources.compatibility = CompatibilityStore(Resources.compat_col, Resources.user_col, Resources.al2mal2al, Resources.lists)
+        await Resources.compatibility.start()
+
+    @staticmethod
+    def syncers(bot, leases={}, display_queue=None):
+        """A Syncer for every active service, set up from the environment"""
         from .syncer import Syncer
-        from .commands import ServiceCommands
+        from .schedule import UserSchedule
+        from .comprehension import Comprehender
         from modules.core.resources import Resources
 
-        await bot.add_cog(ServiceCommands(bot))
+        # overlap fetching the next batch with handling the current one
+        pipelined = bool(os.getenv('SYNC_PIPELINE', default=False))
         
+        # poll users by how recently their lists changed instead of everyone every round
+        scheduled = bool(os.getenv('SYNC_SCHEDULE', default=False))
+        min_interval = float(os.getenv('SYNC_MIN_INTERVAL', default=60))
+        max_interval = float(os.getenv('SYNC_MAX_INTERVAL', default=60*60))
+        recency = float(os.getenv('SYNC_RECENCY', default=0.02)) # of the time since a user's lists last changed
+
+        # where diffing fetched lists runs: inline, thread or process (see Comprehender)
+        workers = os.getenv('SYNC_COMPREHENSION_WORKERS')
+        comprehender = Comprehender(os.getenv('SYNC_COMPREHENSION', default=Comprehender.THREAD), int(workers) if workers else None)
+
+        syncers = []
         for service in Service.active():
             Resources.removal_buffers[service] = set()
             Resources.status_buffers[service] = {}
             Resources.sync_resume_buffers[service] = []
-            syncer = Syncer(bot, service, service.Query(), service.time_between_queries)
+            lease = leases.get(service)
+            query = service.Query()
+            schedule = UserSchedule(service, min_interval, max_interval, recency, owns=lease.owns if lease else None, fill=query.SHARED_BATCH) if scheduled else None
+            syncers.append(Syncer(
+                bot, service, query, service.time_between_queries,
+                pipelined=pipelined, schedule=schedule, lease=lease, display_queue=display_queue, comprehender=comprehender
+            ))
+        return syncers
+
+    @staticmethod
+    async def register(bot):
+        from .syncer import Syncer
+        from .commands import ServiceCommands
+        from .display_queue import DisplayQueue
+        from modules.core.resources import Resources
+
+        await Service.start_stores()
+
+        await bot.add_cog(ServiceCommands(bot))
+
+        if os.getenv('SYNC_MODE', default='local') == 'remote':
+            # sync_worker.py processes do the syncing, post the updates they queue
+            queue = DisplayQueue(Resources.display_col)
+            await queue.start()
+            for service in Service.active():
+                Resources.removal_buffers[service] = set()
+                Resources.status_buffers[service] = {}
+                bot.loop.create_task(Syncer(bot, service, None).display_from(queue))
+            return
+
+        for syncer in Service.syncers(bot):
             bot.loop.create_task(syncer.loop())
@@ -0,0 +1,114 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Callable, Dict, List, Mapping, Optional
+    from ..models.user import User
+
+import logging, time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class BatchStats:
+    """Running totals for the adaptive batcher"""
+    requests: int = 0
+    failures: int = 0
+    entries: int = 0 # estimated entries asked for
+    bytes: int = 0
+    latency: float = 0 # seconds spent waiting on responses
+    paced: float = 0 # seconds spent waiting for the rate limit
+
+class AdaptiveBatcher:
+    """Sizes AniList batches by how many list entries they'll pull rather than
+    by user count alone.
+
+    Each user's cost is their list size from the last full fetch. Users are
+    packed cheapest first into batches whose total stays under a budget of
+    entries, and never past max_users (the complexity limit). The budget grows
+    while responses come back well under target_latency and max_bytes and
+    shrinks as soon as they don't or a request fails. Rate limit headers
+    space requests out so the remaining allowance lasts until it resets.
+    """
+
+    def __init__(self, max_users: int, budget: int = 3000, min_budget: int = 200, max_budget: int = 50000,
+                 target_latency: float = 6, max_bytes: int = 4*1024**2, default_size: int = 500) -> None:
+        self.max_users = max_users
+        self.budget = budget
+        self.min_budget = min_budget
+        self.max_budget = max_budget
+        self.target_latency = target_latency
+        self.max_bytes = max_bytes
+        self.default_size = default_size # for users never fully fetched
+        self.sizes: Dict[object, int] = {} # user _id -> entries on their lists
+        self.stats = BatchStats()
+        self._next_request = 0.0 # monotonic time the rate limit allows the next request at
+
+    def size(self, user: User) -> int:
+        return self.sizes.get(user._id, self.default_size)
+
+    def plan(self, users: List[User], cost: Optional[Callable[[User], int]] = None) -> List[List[User]]:
+        """Split users into batches that fit the current budget"""
+        cost = cost or self.size
+        batches = []
+        batch, total = [], 0
+        for user in sorted(users, key=cost):
+            c = cost(user)
+            if batch and (total + c > self.budget or len(batch) >= self.max_users):
+                batches.append(batch)
+                batch, total = [], 0
+            batch.append(user)
+            total += c
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def observe(self, entries: int, latency: float, size: int, headers: Mapping[str, str] = {}) -> None:
+        """Adjust the budget from a successful request"""
+        self.stats.requests += 1
+        self.stats.entries += entries
+        self.stats.bytes += size
+        self.stats.latency += latency
+        self._pace(headers)
+
+        # how far under (or over) the targets this request was, capped so one
+        # odd response can't swing the budget too far
+        ratio = min(self.target_latency / max(latency, 0.01), self.max_bytes / max(size, 1))
+        ratio = max(0.5, min(ratio, 1.5))
+        if entries < self.budget / 2 and ratio > 1:
+            ratio = 1 # batch wasn't near the budget, says nothing about a bigger one
+        old = self.budget
+        self.budget = int(max(self.min_budget, min(self.max_budget, self.budget * ratio)))
+        logger.info(
+            f"anilist batch: ~{entries} entries, {size/1024:.0f}KiB in {latency:.1f}s, "
+            f"budget {old} -> {self.budget}, rate limit remaining {headers.get('X-RateLimit-Remaining', '?')}"
+        )
+
+    def failed(self, headers: Mapping[str, str] = {}) -> None:
+        """A request timed out or errored, back off"""
+        self.stats.failures += 1
+        self._pace(headers)
+        old = self.budget
+        self.budget = max(self.min_budget, self.budget // 2)
+        logger.info(f"anilist batch failed, budget {old} -> {self.budget}")
+
+    def limited(self, retry_after: float) -> None:
+        """Got a 429, hold every request until retry_after has passed"""
+        self._next_request = max(self._next_request, time.monotonic() + retry_after)
+
+    def _pace(self, headers: Mapping[str, str]) -> None:
+        try:
+            remaining = int(headers['X-RateLimit-Remaining'])
+        except (KeyError, TypeError, ValueError):
+            return
+        try:
+            reset_in = max(0.0, float(headers['X-RateLimit-Reset']) - time.time())
+        except (KeyError, TypeError, ValueError):
+            reset_in = 60.0 # anilist's window is a minute
+        # spread what's left evenly over the rest of the window
+        delay = reset_in if remaining <= 0 else reset_in / (remaining + 1)
+        self._next_request = max(self._next_request, time.monotonic() + delay)
+
+    def wait_time(self) -> float:
+        """Seconds until the rate limit allows another request"""
+        return max(0.0, self._next_request - time.monotonic())
@@ -25,62 +25,95 @@ def _format_manga_title(self: MangaEntry) -> str:
         return f"[{title}]({link})"
     return title
 
+# messages are only put together if the change gets displayed, see Change.msg
+
+def _status_msg(title: str, new: str) -> str:
+    if new in [Status.COMPLETED, Status.DROPPED, Status.PAUSED]:
+        return f"{new} {title}"
+    return f"{title} added to {new} list"
+
+def _anime_status_msg(self: AnimeEntry, old: str, new: str) -> str:
+    return _status_msg(_format_anime_title(self), new)
+
+def _manga_status_msg(self: MangaEntry, old: str, new: str) -> str:
+    return _status_msg(_format_manga_title(self), new)
+
+def _anime_score_msg(self: AnimeEntry, old: Union[float, int], new: Union[float, int]) -> str:
+    return f"score of {_format_anime_title(self)} changed: {old} ➔ {new}"
+
+def _manga_score_msg(self: MangaEntry, old: Union[float, int], new: Union[float, int]) -> str:
+    return f"score of {_format_manga_title(self)} changed: {old} ➔ {new}"
+
+def _progress_msg(action: str, unit: str, title: str, old: int, new: int) -> str:
+    if new - old > 1:
+        return f"{action} {unit}s {old+1}-{new} of {title}"
+    return f"{action} {unit} {new} of {title}"
+
+def _episode_msg(self: AnimeEntry, old: int, new: int) -> str:
+    return _progress_msg('watched', 'episode', _format_anime_title(self), old, new)
+
+def _chapter_msg(self: MangaEntry, old: int, new: int) -> str:
+    return _progress_msg('read', 'chapter', _format_manga_title(self), old, new)
+
+def _volume_msg(self: MangaEntry, old: int, new: int) -> str:
+    return _progress_msg('read', 'volume', _format_manga_title(self), old, new)
+
 def status_consumer(self: AnimeEntry, old: str, new: str) -> Optional[Change]:
     if old == new:
         return None
-    title = _format_anime_title(self)
-    msg = f"{title} added to {new} list"
-    if new in [Status.COMPLETED, Status.DROPPED, Status.PAUSED]:
-        msg = f"{new} {title}"
-    return Change(ChangeKind.STATUS, old, new, msg)
+    return Change(ChangeKind.STATUS, old, new, _anime_status_msg, self)
 
 def score_consumer(self: AnimeEntry, old: Union[float, int], new: Union[float, int]) -> Optional[Change]:
     if old == new:
         return None
-    msg = f"score of {_format_anime_title(self)} changed: {old} ➔ {new}"
-    return Change(ChangeKind.SCORE, old, new, msg)
+    return Change(ChangeKind.SCORE, old, new, _anime_score_msg, self)
 
 def status_consumer_manga(self: MangaEntry, old: str, new: str) -> Optional[Change]:
     if old == new:
         return None
-    title = _format_manga_title(self)
-    msg = f"{title} added to {new} list"
-    if new in [Status.COMPLETED, Status.DROPPED, Status.PAUSED]:
-        msg = f"{new} {title}"
-    return Change(ChangeKind.STATUS, old, new, msg)
+    return Change(ChangeKind.STATUS, old, new, _manga_status_msg, self)
 
 def score_consumer_manga(self: MangaEntry, old: Union[float, int], new: Union[float, int]) -> Optional[Change]:
     if old == new:
         return None
-    msg = f"score of {_format_manga_title(self)} changed: {old} ➔ {new}"
-    return Change(ChangeKind.SCORE, old, new, msg)
+    return Change(ChangeKind.SCORE, old, new, _manga_score_msg, self)
 
 def episode_consumer(self: AnimeEntry, old: int, new: int) -> Optional[Change]:
     if old >= new:
         return None
-    title = _format_anime_title(self)
-    msg = f"watched episode {new} of {title}"
-    if new - old > 1:
-        msg = f"watched episodes {old+1}-{new} of {title}"
-    return Change(ChangeKind.PROGRESS, old, new, msg)
+    return Change(ChangeKind.PROGRESS, old, new, _episode_msg, self)
 
 def chapter_consumer(self: MangaEntry, old: int, new: int) -> Optional[Change]:
     if old >= new:
         return None
-    title = _format_manga_title(self)
-    msg = f"read chapter {new} of {title}"
-    if new - old > 1:
-        msg = f"read chapters {old+1}-{new} of {title}"
-    return Change(ChangeKind.PROGRESS, old, new, msg)
+    return Change(ChangeKind.PROGRESS, old, new, _chapter_msg, self)
 
 def volume_consumer(self: MangaEntry, old: int, new: int) -> Optional[Change]:
     if old >= new:
         return None
-    title = _format_manga_title(self)
-    msg = f"read volume {new} of {title}"
-    if new - old > 1:
-        msg = f"read volumes {old+1}-{new} of {title}"
-    return Change(ChangeKind.PROGRESS, old, new, msg)
+    return Change(ChangeKind.PROGRESS, old, new, _volume_msg, self)
+
+def _rationalized_score_msg(source: tuple, old: Union[float, int], new: Union[float, int]) -> str:
+    self, old_score_format, new_score_format = source
+    title = f"[{self['title']}]({self['link']})" if self['link'] else (self['title'] or 'Unknown')
+    if old == 0:
+        return f"score of {title} set to {new_score_format.formatted_score(new)}"
+    return f"score of {title} changed: {old_score_format.formatted_score(old)} ➔ {new_score_format.formatted_score(new)}"
+
+# wrap a change's pending (msg, source) so the rationalizer's additions are
+# only put together along with the rest of the message
+
+def _repeating_msg(source: tuple, old: int, new: int) -> str:
+    msg, msg_source = source
+    return f"re{Change.render(msg, msg_source, old, new)}"
+
+def _on_progress_msg(source: tuple, old: str, new: str) -> str:
+    msg, msg_source, self = source
+    return f"{Change.render(msg, msg_source, old, new)} on {self.progress}"
+
+def _with_score_msg(source: tuple, old: str, new: str) -> str:
+    msg, msg_source, self, score_format = source
+    return f"{Change.render(msg, msg_source, old, new)} with a score of {score_format.formatted_score(self['score'])}"
 
 def rationalizer(self, user: User, latest_profile: WeebProfile = None) -> None:
     if not self.changes():
@@ -107,7 +140,7 @@ def rationalizer(self, user: User, latest_profile: WeebProfile = None) -> None:
     # handle case of adding re to read/watch for repeating media
     if progress_changes and self['status'] == Status.REPEATING:
         for pc in progress_changes:
-            pc.msg = f"re{pc.msg}"
+            pc.defer(_repeating_msg, pc.pending)
 
     # rationalize various special cases of status changes
     if status_change:
@@ -119,14 +152,14 @@ def rationalizer(self, user: User, latest_profile: WeebProfile = None) -> None:
             # have dropped/paused status overrule any progress changes
             ignore_progress_changes()
             if self.has_progress:
-                status_change.msg = f"{status_change.msg} on {self.progress}"
+                status_change.defer(_on_progress_msg, (*status_change.pending, self))
         if status_change.new == Status.COMPLETED:
             # have completed status overrule any progress or score changes
             if score_change: score_change.ignore = True
             ignore_progress_changes()
             if self['score']:
                 # include score of completed media if available
-                status_change.msg = f"{status_change.msg} with a score of {new_score_format.formatted_score(self['score'])}"
+                status_change.defer(_with_score_msg, (*status_change.pending, self, new_score_format))
 
     # special case where user changes score format and all their scores adjust to it
     if new_score_format != old_score_format:
@@ -134,13 +167,7 @@ def rationalizer(self, user: User, latest_profile: WeebProfile = None) -> None:
 
     # use dynamic score formatting depending on user's score format
     if score_change:
-        old = old_score_format.formatted_score(score_change.old)
-        new = new_score_format.formatted_score(score_change.new)
-        title = f"[{self['title']}]({self['link']})" if self['link'] else (self['title'] or 'Unknown')
-        if score_change.old == 0:
-            score_change.msg = f"score of {title} set to {new}"
-        else:
-            score_change.msg = f"score of {title} changed: {old} ➔ {new}"
+        score_change.defer(_rationalized_score_msg, (self, old_score_format, new_score_format))
 
 def img(self) -> List[Image]:
     if self['banner'] and self['cover']:
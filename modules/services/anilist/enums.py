@@ -18,6 +18,10 @@ class ChangeKind:
 class Format(str):
     __slots__ = ['formatted_score', 'normalized_score']
 
+    def __reduce__(self):
+        # the functions don't pickle, look the format up again by name
+        return (ScoreFormat, (str(self),))
+
 def _format(tag: str, format_fn: Callable, normal_fn: Callable) -> Format:
     f = Format(tag)
     f.formatted_score = format_fn
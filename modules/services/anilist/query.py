@@ -1,17 +1,20 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
-    from typing import List, Dict, Any
+    from typing import List, Dict, Any, Iterable, Optional, Set
     from ..models.user import User
 
-import re, asyncio, aiohttp, logging
+import re, asyncio, aiohttp, logging, os, bisect, collections, json, time
+from dataclasses import dataclass, field
 
 from ..models.query import Query, user_id
 from ..models.data import FetchData, QueryResult, ResultStatus, UserSearch, EntryAttributes
+from .batcher import AdaptiveBatcher
 from .entry import AnimeEntry, MangaEntry
 from .profile import WeebProfile
 from .enums import ScoreFormat, Status
 from modules.core.resources import Resources
+from modules.services.vndb_ratelimit import parse_retry_after
 
 logger = logging.getLogger(__name__)
 
@@ -108,6 +111,33 @@ userFieldsId = '''
     }
 '''
 
+# recently updated entries only, for incremental syncs
+mangaUpdatesFields = '''
+    {
+        mediaList(userId:{id}, type:MANGA, sort:UPDATED_TIME_DESC) {
+            ...mediaFields
+            hiddenFromStatusLists
+            progressVolumes
+            media {
+                chapters
+                volumes
+            }
+        }
+    }
+'''
+
+animeUpdatesFields = '''
+    {
+        mediaList(userId:{id}, type:ANIME, sort:UPDATED_TIME_DESC) {
+            ...mediaFields
+            hiddenFromStatusLists
+            media {
+                episodes
+            }
+        }
+    }
+'''
+
 fragments = '''
     fragment mediaFields on MediaList {
         status
@@ -129,20 +159,10 @@ fragments = '''
     }
 '''
 
-def compute_lines_per_user():
-    # first line is empty
-    m = len(mangaListFields.split('\n'))-1
-    a = len(animeListFields.split('\n'))-1
-    p = len(userFields.split('\n'))-1
-
-    return m+a+p
-
-lines_per_user = compute_lines_per_user()
-
 # anilist limits single query to 500 complexity
-def compute_complexity():
-    pieces = [animeListFields, mangaListFields, userFields]
-    frags = get_fragment_complexities()
+def compute_complexity(pieces=None, fragments=fragments):
+    pieces = pieces or [animeListFields, mangaListFields, userFields]
+    frags = get_fragment_complexities(fragments)
 
     # add in any complexity the fragments are to each pice that has a fragment
     complexity = 0
@@ -155,7 +175,7 @@ def compute_complexity():
     complexity += len(pieces) # each piece is one complexity
     return complexity
 
-def get_fragment_complexities():
+def get_fragment_complexities(fragments=fragments):
     # fancy regex to get list of all fragment names
     frags = list(re.finditer(r'(?:fragment )(?P<frag_name>[a-zA-Z]+)(?: on [a-zA-Z]+)', fragments))
     frag_comp = {}
@@ -181,26 +201,108 @@ def extract_complexities(s):
     s = re.sub(' +', ' ', re.sub('\n|{|}', ' ', s)).strip()
     return [s for s in s.split(' ') if s]
 
+# incremental syncs also need when entries were updated and the status counts to check against
+syncUserFields = userFields.replace('''
+                genres(sort:COUNT_DESC) {
+                    genre
+                }
+            }''', '''
+                genres(sort:COUNT_DESC) {
+                    genre
+                }
+                statuses {
+                    status
+                    count
+                }
+            }
+            manga {
+                statuses {
+                    status
+                    count
+                }
+            }''')
+syncFragments = fragments.replace('''
+        progress
+''', '''
+        progress
+        updatedAt
+''', 1)
+
 query_complexity = compute_complexity()
+sync_query_complexity = compute_complexity([animeListFields, mangaListFields, syncUserFields], syncFragments)
+incremental_query_complexity = compute_complexity([animeUpdatesFields, mangaUpdatesFields, syncUserFields], syncFragments)
 anilist_max_complexity = 500
 
+@dataclass
+class SyncState:
+    """What incremental syncs remember about a user between fetches"""
+    updated_at: Dict[str, int] = field(default_factory=dict) # list -> newest updatedAt seen
+    offsets: Dict[str, Dict[str, int]] = field(default_factory=dict) # list -> status -> anilist's count minus ours, as of the last full fetch
+    since_full: int = 0 # incremental fetches since the last full one
+    force_full: bool = False
+
 class AnilistQuery(Query):
     MAX_USERS_PER_QUERY = anilist_max_complexity // query_complexity
-
-    def _build_query(self, ids):
-        """helper to build query for given list of ids"""
+    SHARED_BATCH = True # one graphql request per batch
+
+    def __init__(self, incremental: bool = None, full_every: int = None, page_size: int = 25, adaptive: bool = None, isolate: bool = None) -> None:
+        # only ask for entries updated since the last fetch, with a full fetch
+        # every full_every fetches or when the status counts don't add up
+        self.incremental = bool(os.getenv('ANILIST_INCREMENTAL', default=False)) if incremental is None else incremental
+        self.full_every = int(os.getenv('ANILIST_FULL_SYNC_EVERY', default=20)) if full_every is None else full_every
+        self.page_size = page_size # recently updated entries asked for per list
+        self.sync_states: Dict[user_id, SyncState] = {}
+        self._line_starts = [] # first line of each user's part of the last built query
+        if self.incremental:
+            # room for a batch of full fetches, which cost a bit more with the extra fields
+            self.MAX_USERS_PER_QUERY = anilist_max_complexity // sync_query_complexity
+            logger.info(f"anilist incremental sync: complexity per user {incremental_query_complexity} incremental, {sync_query_complexity} full")
+
+        # bisect batches with errors and quarantine the users causing them
+        # instead of retrying the whole batch without whoever the error lines point at
+        self.isolate = bool(os.getenv('ANILIST_ISOLATE_ERRORS', default=False)) if isolate is None else isolate
+
+        # batch users by how big their lists are instead of a fixed count
+        adaptive = bool(os.getenv('ANILIST_ADAPTIVE_BATCHES', default=False)) if adaptive is None else adaptive
+        self.batcher = AdaptiveBatcher(self.MAX_USERS_PER_QUERY) if adaptive else None
+        if self.batcher:
+            # hand fetch() enough users at a time to sort them into batches
+            self.MAX_USERS_PER_QUERY *= 4
+            self.SHARED_BATCH = False # the batcher splits them by list size
+
+    def _build_query(self, ids, incremental=()):
+        """helper to build query for given list of ids, the ones in incremental
+        only get their recently updated entries"""
         if not ids:
             return None
 
+        user_fields = syncUserFields if self.incremental else userFields
         built_query = 'query {\n'
+        line = built_query.count('\n') + 1
+        self._line_starts = []
         for user in ids:
-            built_query += f"profile_{user}: User(id:{user}){userFields}"
-            built_query += f"animelist_{user}: MediaListCollection(userId:{user}, type:ANIME, forceSingleCompletedList:true){animeListFields}"
-            built_query += f"mangalist_{user}: MediaListCollection(userId:{user}, type:MANGA, forceSingleCompletedList:true){mangaListFields}"
-        built_query += f"}}{fragments}"
+            piece = f"profile_{user}: User(id:{user}){user_fields}"
+            if user in incremental:
+                piece += f"animelist_{user}: Page(perPage:{self.page_size}){animeUpdatesFields.replace('{id}', str(user))}"
+                piece += f"mangalist_{user}: Page(perPage:{self.page_size}){mangaUpdatesFields.replace('{id}', str(user))}"
+            else:
+                piece += f"animelist_{user}: MediaListCollection(userId:{user}, type:ANIME, forceSingleCompletedList:true){animeListFields}"
+                piece += f"mangalist_{user}: MediaListCollection(userId:{user}, type:MANGA, forceSingleCompletedList:true){mangaListFields}"
+            self._line_starts.append(line)
+            line += piece.count('\n')
+            built_query += piece
+        built_query += f"}}{syncFragments if self.incremental else fragments}"
         
         return built_query
 
+    def _line_owner(self, line: int) -> int:
+        """Index of the user whose part of the last built query has line"""
+        return bisect.bisect_right(self._line_starts, line) - 1
+
+    def _fetch_incrementally(self, user: User) -> bool:
+        state = self.sync_states.get(user._id)
+        return bool(self.incremental and state and not state.force_full and state.since_full < self.full_every)
+
     def _serach_query(self, username):
         built_query = 'query {\n'
         built_query += f"profile: User(name:\"{username}\"){userFieldsId}"
@@ -215,11 +317,14 @@ class AnilistQuery(Query):
             return UserSearch(status=ResultStatus.ERROR, data='No username provided')
 
         try:
+            await Resources.anilist_rate_limiter.acquire(interactive=True)
             async with Resources.syncer_session.post('https://graphql.anilist.co', json={'query':self._serach_query(username)}, raise_for_status=False, timeout=aiohttp.ClientTimeout(total=5)) as resp:
+                Resources.anilist_rate_limiter.update(resp.headers)
                 # handle non 200 status
                 if resp.status == 404:
                     return UserSearch(status=ResultStatus.NOTFOUND, data=None)
                 if resp.status == 429:
+                    Resources.anilist_rate_limiter.mark_limited(parse_retry_after(resp.headers.get('Retry-After')))
                     return UserSearch(status=ResultStatus.ERROR, data='Anilist is rate limiting me. Try again later')
                 try:
                     resp.raise_for_status()
@@ -261,36 +366,75 @@ class AnilistQuery(Query):
             return UserSearch(status=ResultStatus.ERROR, data=f"I failed")
 
     async def fetch(self, users: List[User] = [], tries: int = 3) -> Dict[user_id, FetchData]:
+        if self.isolate:
+            # users who keep erroring sit out until their backoff is up
+            users = [u for u in users if not Resources.quarantine.blocked(u.service, u.service_id)]
         if not users or tries < 1:
             return {}
+        if not self.batcher:
+            return await self._fetch_batch(users, tries)
+
+        # split what the syncer handed over into batches sized by list size
+        ret = {}
+        batches = self.batcher.plan(users, self._cost)
+        logger.info(f"anilist: {len(users)} users in {len(batches)} batches of {[len(b) for b in batches]}, budget {self.batcher.budget} entries")
+        for batch in batches:
+            wait = self.batcher.wait_time()
+            if wait:
+                self.batcher.stats.paced += wait
+                await asyncio.sleep(wait)
+            ret.update(await self._fetch_batch(batch, tries))
+        return ret
 
+    def _cost(self, user: User) -> int:
+        """Entries a user's part of a query is expected to return"""
+        if self._fetch_incrementally(user):
+            return 2 * self.page_size
+        return self.batcher.size(user)
+
+    async def _fetch_batch(self, users: List[User], tries: int) -> Dict[user_id, FetchData]:
         query_ids = [u.service_id for u in users]
+        incremental_ids = {u.service_id for u in users if self._fetch_incrementally(u)}
+        isolated = None
         while tries:
             tries -= 1
-            q = self._build_query(query_ids)
+            q = self._build_query(query_ids, incremental_ids)
             if not q: return {} # all the users failed
             try:
+                await Resources.anilist_rate_limiter.acquire(interactive=False)
+                start = time.monotonic()
                 async with Resources.syncer_session.post('https://graphql.anilist.co', json={'query':q}, raise_for_status=False, timeout=aiohttp.ClientTimeout(total=20)) as resp:
 
-                    # too many request but still have more tries -> try next time anilist says it'll accept request
-                    if tries and resp.status == 429:
-                        wait_time = 60 # rate limiting should reset after minute at latest
-                        try: wait_time = int(resp.headers['Retry-After']) # use provided wait time from anilist if there
-                        except: pass
-
-                        await asyncio.sleep(wait_time)
-                        continue # retry
+                    # too many request -> hold every anilist caller until anilist says it'll accept requests again
+                    # (a minute at latest) and retry if there are tries left
+                    if resp.status == 429:
+                        wait_time = Resources.anilist_rate_limiter.mark_limited(parse_retry_after(resp.headers.get('Retry-After')))
+                        if self.batcher:
+                            self.batcher.limited(wait_time)
+                        if tries:
+                            continue # retry, the limiter waits
+                    else:
+                        Resources.anilist_rate_limiter.update(resp.headers)
 
                     # bad request that probably won't work after retry
                     # maybe API changed so query needs updating, anilist down, etc.
                     if resp.status not in [200, 404]: 
                         logger.warning(f"Bad anilist request [{resp.status}]")
+                        if self.batcher:
+                            self.batcher.failed(resp.headers)
                         return {}
 
                     data = None
-                    try: data = await resp.json()
+                    size = 0
+                    try:
+                        body = await resp.read()
+                        size = len(body)
+                        data = json.loads(body)
                     except: pass
 
+                    if self.batcher:
+                        self.batcher.observe(sum(self._cost(u) for u in users if u.service_id in query_ids), time.monotonic() - start, size, resp.headers)
+
                     if not data: # parsing failed or got gobbledygook 
                         logger.warning(f"JSON parsing failure for anilist")
                         await asyncio.sleep(10) # we'll just try again after a little bit of time and see what happends
@@ -305,11 +449,15 @@ class AnilistQuery(Query):
                         for error in errors:
                             locations = error.get('locations') # which lines caused query error
                             if locations:
-                                idx = (locations[0]['line'] - 2) // lines_per_user # which index in query_id array is this location associated with
+                                idx = self._line_owner(locations[0]['line']) # which index in query_id array is this location associated with
                                 if 0 <= idx < len(query_ids): # just being careful
                                     logger.error(f"Anilist user (discord_id={query_ids[idx]}) has error: {error}")
                                     bad_ids.append(query_ids[idx])
 
+                    if errors and self.isolate:
+                        isolated = (data, errors)
+                        break # bisect once this response is closed
+
                     if bad_ids:
                         query_ids = list(set(query_ids) - set(bad_ids))
                         continue # retry
@@ -322,20 +470,66 @@ class AnilistQuery(Query):
                         return {}
 
                     try:
-                        return await asyncio.get_running_loop().run_in_executor(
+                        ret = await asyncio.get_running_loop().run_in_executor(
                             None,
                             self._get_data,
                             users,
-                            data
+                            data,
+                            incremental_ids
                         )
                     except:
                         return {}
+                    if self.isolate:
+                        await self._release(users, ret)
+                    return ret
 
             except: # some sort of connection error
+                if self.batcher:
+                    self.batcher.failed()
                 if tries: await asyncio.sleep(10) # wait a little and try again
+        if isolated:
+            return await self._isolate(users, *isolated, incremental_ids, tries)
         return {} # all requests failed
 
-    def _get_data(self, users: List[User], data: Dict[str, Any]) -> Dict[user_id, FetchData]:
+    ### fault isolation ###
+
+    async def _isolate(self, users: List[User], response: Dict[str, Any], errors: List[Dict[str, Any]], incremental_ids: Set[Any], tries: int) -> Dict[user_id, FetchData]:
+        """Keep what came back for users whose part of the query worked and
+        bisect the rest until each error is down to one user, who then goes
+        into quarantine"""
+        data = response.get('data') or {}
+        healthy, failing = [], []
+        for user in users:
+            parts = (data.get(f"{k}_{user.service_id}") for k in ('profile', 'animelist', 'mangalist'))
+            (healthy if all(p is not None for p in parts) else failing).append(user)
+
+        ret = {}
+        if healthy:
+            try:
+                ret = await asyncio.get_running_loop().run_in_executor(None, self._get_data, healthy, data, incremental_ids)
+            except Exception:
+                logger.exception('anilist data for healthy users could not be read')
+            await self._release(healthy, ret)
+
+        if not failing: # errors that didn't cost anyone their data
+            logger.warning(f"anilist errors without missing data: {errors[:3]}")
+        elif len(failing) == 1:
+            await Resources.quarantine.strike(failing[0].service, failing[0].service_id, errors[0].get('message'))
+        else:
+            half = len(failing) // 2
+            logger.info(f"anilist errors for {len(failing)} users, splitting them up")
+            for part in (failing[:half], failing[half:]):
+                ret.update(await self._fetch_batch(part, max(tries, 1)))
+        return ret
+
+    async def _release(self, users: List[User], fetched: Dict[user_id, FetchData]) -> None:
+        """A clean fetch lets quarantined users back in"""
+        for user in users:
+            if user._id in fetched and Resources.quarantine.has(user.service, user.service_id):
+                await Resources.quarantine.release(user.service, user.service_id)
+                logger.info(f"{user.service} user {user.service_id} fetched cleanly, out of quarantine")
+
+    def _get_data(self, users: List[User], data: Dict[str, Any], incremental_ids: Set[Any] = set()) -> Dict[user_id, FetchData]:
         ret = {}
         for user in users:
             profile = data.get(f"profile_{user.service_id}")
@@ -345,15 +539,92 @@ class AnilistQuery(Query):
             if profile == None or animelist == None or mangalist == None: # id not present (probably removed because it had query error)
                 continue # go next
 
-            ret[user._id] = FetchData(
-                lists={
+            if user.service_id in incremental_ids:
+                lists = self._updated_lists(user, profile, {'anime': animelist, 'manga': mangalist})
+            else:
+                lists = {
                     'anime': self._gen_animelist(animelist),
                     'manga': self._gen_mangalist(mangalist)
-                },
+                }
+                if self.incremental:
+                    self._full_fetched(user, profile, {'anime': animelist, 'manga': mangalist}, lists)
+                if self.batcher:
+                    self.batcher.sizes[user._id] = sum(len(r.data) for r in lists.values() if r.status == ResultStatus.OK)
+
+            ret[user._id] = FetchData(
+                lists=lists,
                 profile=self._gen_profile(profile)
             )
         return ret
 
+    ### incremental sync ###
+
+    @staticmethod
+    def _newest(entries: List[Dict[str, Any]], default: int = 0) -> int:
+        return max((e.get('updatedAt') or 0 for e in entries), default=default)
+
+    def _status_counts(self, profile: Dict[str, Any], lst: str) -> Optional[Dict[str, int]]:
+        """anilist's entry count per status, None if it didn't send them"""
+        try:
+            return {self._convert_status(s['status']): s['count'] for s in profile['statistics'][lst]['statuses']}
+        except Exception:
+            return None
+
+    @staticmethod
+    def _offsets(theirs: Dict[str, int], ours: Iterable[Dict[str, Any]]) -> Dict[str, int]:
+        counts = collections.Counter(e.get('status') for e in ours)
+        return {status: diff for status in set(theirs) | set(counts) if (diff := theirs.get(status, 0) - counts.get(status, 0))}
+
+    def _full_fetched(self, user: User, profile: Dict[str, Any], raw: Dict[str, Any], lists: Dict[str, QueryResult]) -> None:
+        state = self.sync_states.setdefault(user._id, SyncState())
+        state.since_full = 0
+        state.force_full = False
+        for lst, result in lists.items():
+            if result.status != ResultStatus.OK:
+                state.force_full = True
+                continue
+            entries = [e for sublst in raw[lst]['lists'] for e in sublst['entries']]
+            state.updated_at[lst] = self._newest(entries)
+            theirs = self._status_counts(profile, lst)
+            if theirs is None:
+                state.offsets.pop(lst, None)
+            else:
+                # anilist's counts don't always match the lists (hidden entries, ...), remember by how much
+                state.offsets[lst] = self._offsets(theirs, (e.dict for e in result.data))
+
+    def _updated_lists(self, user: User, profile: Dict[str, Any], raw: Dict[str, Any]) -> Dict[str, QueryResult]:
+        state = self.sync_states[user._id]
+        state.since_full += 1
+        gen = {'anime': self._gen_animelist, 'manga': self._gen_mangalist}
+        lists = {}
+        for lst, page in raw.items():
+            since = state.updated_at.get(lst, 0)
+            fetched = page.get('mediaList') or []
+            # same second updates are fetched again, consuming an unchanged entry does nothing
+            entries = [e for e in fetched if (e.get('updatedAt') or 0) >= since and not e.get('hiddenFromStatusLists')]
+            if len(fetched) >= self.page_size and all((e.get('updatedAt') or 0) >= since for e in fetched):
+                state.force_full = True # more updates than one page holds
+            result = gen[lst]({'lists': [{'isCustomList': False, 'entries': entries}]})
+            if result.status != ResultStatus.OK:
+                state.force_full = True
+                lists[lst] = result
+                continue
+            result.partial = True
+            lists[lst] = result
+            state.updated_at[lst] = self._newest(fetched, since)
+
+            # a removed entry doesn't show up as an update, catch it from the status counts
+            theirs = self._status_counts(profile, lst)
+            if theirs is None or lst not in state.offsets:
+                continue
+            merged = dict(user.lists.get(lst) or {})
+            for entry in result.data:
+                merged[str(entry['id'])] = entry.dict
+            if self._offsets(theirs, merged.values()) != state.offsets[lst]:
+                logger.info(f"anilist {lst} status counts for {user.service_id} changed unexpectedly, doing a full fetch next")
+                state.force_full = True
+        return lists
+
     def _gen_animelist(self, data) -> QueryResult:
         if data == None:
             return QueryResult(status=ResultStatus.ERROR, data='Anilist animelist generator given None data')
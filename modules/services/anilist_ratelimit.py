@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Mapping
+
+
+@dataclass
+class AnilistLimiterStats:
+    granted_sync: int = 0
+    granted_interactive: int = 0
+    waited_sync: float = 0.0 # seconds spent waiting for a token
+    waited_interactive: float = 0.0
+    limited: int = 0 # 429s reported
+
+
+class AnilistRateLimiter:
+    """Token bucket shared by everything that talks to AniList.
+
+    Tokens refill at limit per minute up to a burst of capacity. Callers
+    await acquire() and get a token as soon as one is free rather than an
+    error. The syncer asks with interactive=False and only gets a token while
+    more than reserve are left, so commands always have some headroom.
+
+    AniList's X-RateLimit-Limit/Remaining headers are fed back through
+    update() so the bucket follows what the API actually allows (it has
+    run at less than its documented 90 a minute), and a 429 empties the
+    bucket until Retry-After has passed. State is guarded by a threading
+    lock so the blocking requests-based queries can share it through
+    acquire_blocking().
+    """
+
+    def __init__(self, *, limit: int = 90, capacity: int | None = None, reserve: int = 10) -> None:
+        if reserve >= (capacity or limit):
+            raise ValueError("Reserve has to leave room for sync requests")
+        self._limit = limit
+        self._max_capacity = capacity or limit
+        self._capacity = self._max_capacity
+        self._reserve = reserve
+        self._tokens: float = self._capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = AnilistLimiterStats()
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self._capacity, self._tokens + max(0.0, now - self._updated) * self._limit / 60)
+        self._updated = now
+
+    def _try_take(self, interactive: bool) -> float:
+        """Take a token and return 0, or return how long until one might be free"""
+        with self._lock:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            self._refill(now)
+            floor = 0 if interactive else self._reserve
+            if self._tokens - 1 >= floor:
+                self._tokens -= 1
+                return 0.0
+            return (floor + 1 - self._tokens) * 60 / self._limit
+
+    def _granted(self, interactive: bool, waited: float) -> None:
+        if interactive:
+            self.stats.granted_interactive += 1
+            self.stats.waited_interactive += waited
+        else:
+            self.stats.granted_sync += 1
+            self.stats.waited_sync += waited
+
+    async def acquire(self, *, interactive: bool) -> float:
+        """Wait for a token, returns the seconds waited"""
+        start = time.monotonic()
+        while wait := self._try_take(interactive):
+            await asyncio.sleep(wait)
+        waited = time.monotonic() - start
+        self._granted(interactive, waited)
+        return waited
+
+    def acquire_blocking(self, *, interactive: bool = True) -> float:
+        """acquire() for code that can't await"""
+        start = time.monotonic()
+        while wait := self._try_take(interactive):
+            time.sleep(wait)
+        waited = time.monotonic() - start
+        self._granted(interactive, waited)
+        return waited
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        """Follow the X-RateLimit-* headers of an AniList response"""
+        with self._lock:
+            self._refill(time.monotonic())
+            try:
+                limit = int(headers['X-RateLimit-Limit'])
+                if limit > self._reserve:
+                    self._limit = limit
+                    self._capacity = min(self._max_capacity, limit)
+            except (KeyError, TypeError, ValueError):
+                pass
+            try:
+                # anilist counts requests we didn't make (other instances, the site), trust it over the bucket
+                self._tokens = min(self._tokens, float(headers['X-RateLimit-Remaining']))
+            except (KeyError, TypeError, ValueError):
+                pass
+
+    def mark_limited(self, retry_after: float | None = None) -> float:
+        """Hold every caller after a 429, returns how long for"""
+        with self._lock:
+            now = time.monotonic()
+            cooldown = retry_after if retry_after is not None else 60.0
+            self._blocked_until = max(self._blocked_until, now + max(0.0, cooldown))
+            self._tokens = 0
+            self._updated = self._blocked_until
+            self.stats.limited += 1
+            return self._blocked_until - now
@@ -1,5 +1,5 @@
 from modules.services.models.data import EntryAttributes, ResultStatus
-import discord, asyncio, logging
+import discord, asyncio, logging, copy, time
 from discord.ext import commands
 from discord import app_commands
 from modules.core.resources import Resources
@@ -39,7 +39,7 @@ class ServiceCommands(commands.Cog):
             if inactive:
                 embed.add_field(name='__Unavailable (WIP/Brokey)__', value='\n'.join(inactive), inline=True)
 
-            guild = await Resources.guild_col.find_one({'guild_id': str(ctx.guild.id)})
+            guild = Resources.guild_settings.get(ctx.guild.id)
             
             update_channels = guild['settings']['updates'] if guild else guild
 
@@ -80,6 +80,9 @@ class ServiceCommands(commands.Cog):
                     '`>services filter` \nbring up panel to ignore updates that have certain attributes (admin)\n\n'
                     '`>services filterImages` \nbring up panel to ignore just images in updates that have certain attributes (admin)\n'
                     '*using filter will naturally override filterImage if setting filter to ignore*\n\n'
+                    '`>services compatibility rebuild/check` \nrecompute or verify stored compatibility scores (admin)\n\n'
+                    '`>services storage [status/migrate/finish]` \nshow or move where list entries are stored (admin)\n\n'
+                    '`>services quarantine [release <service> <id>]` \nusers the syncer is skipping because their lists keep erroring (admin)\n\n'
                 ), 
                 inline=False)
 
@@ -128,6 +131,23 @@ class ServiceCommands(commands.Cog):
                 return await ctx.send(f"Only an administrator can modify filters")
             return await self._filter(ctx, onlyImages=True)
 
+        elif args[0] == 'compatibility':
+            if not ctx.author.guild_permissions.administrator:
+                return await ctx.send(f"Only an administrator can manage compatibility scores")
+            if len(args) < 2 or args[1] not in ['rebuild', 'check']:
+                return await ctx.send(f"Use `>services compatibility rebuild` or `>services compatibility check [anime/manga]`")
+            return await self._compatibility(ctx, args[1], args[2] if len(args) > 2 else 'anime')
+
+        elif args[0] == 'storage':
+            if not ctx.author.guild_permissions.administrator:
+                return await ctx.send(f"Only an administrator can manage list storage")
+            return await self._storage(ctx, args[1] if len(args) > 1 else 'status')
+
+        elif args[0] == 'quarantine':
+            if not ctx.author.guild_permissions.administrator:
+                return await ctx.send(f"Only an administrator can manage the sync quarantine")
+            return await self._quarantine(ctx, *args[1:])
+
         elif args[0] == 'hideupdates':
             return await self._hide_updates(ctx, True)
         
@@ -136,6 +156,68 @@ class ServiceCommands(commands.Cog):
 
         return await ctx.send('I don\'t recognize that service or command')
 
+    async def _compatibility(self, ctx, action, kind):
+        if action == 'rebuild':
+            msg = await ctx.send('Rebuilding compatibility scores...')
+            start = time.time()
+            pairs = await Resources.compatibility.rebuild()
+            return await msg.edit(content=f"Rebuilt {pairs} compatibility pairs in {time.time()-start:.1f}s")
+
+        if kind not in ['anime', 'manga']:
+            return await ctx.send('Kind must be anime or manga')
+        report = await Resources.compatibility.check(kind)
+        lines = [f"Checked {report['checked']} {kind} pairs against a full calculation: {report['mismatched']} differ (max difference {report['max_diff']:.2f})"]
+        for a, b, expected, stored in report['examples']:
+            lines.append(f"{a} x {b}: expected {expected[0]:.1f}% ({expected[1]}), stored {stored[0]:.1f}% ({stored[1]})")
+        return await ctx.send('\n'.join(lines))
+
+    async def _storage(self, ctx, action):
+        mode = Resources.lists.mode
+        if action == 'migrate':
+            if mode != Resources.lists.DUAL:
+                return await ctx.send(f"Set LIST_STORAGE=dual before migrating (currently {mode})")
+            msg = await ctx.send('Copying lists to the entries collection...')
+            users, rows = await Resources.lists.migrate()
+            return await msg.edit(content=f"Copied {rows} entries of {users} users")
+        elif action == 'finish':
+            if mode != Resources.lists.ENTRIES:
+                return await ctx.send(f"Set LIST_STORAGE=entries before dropping lists from user documents (currently {mode})")
+            users, _ = await Resources.lists.migrate(finish=True)
+            return await ctx.send(f"Dropped lists from {users} user documents")
+        elif action == 'status':
+            migrated, pending, rows = await Resources.lists.status()
+            return await ctx.send(f"List storage: {mode}. {migrated} users in the entries collection ({rows} entries), {pending} not yet")
+        return await ctx.send('Use `>services storage status/migrate/finish`')
+
+    async def _quarantine(self, ctx, action='list', service=None, service_id=None):
+        if action == 'release':
+            if not service or not service_id:
+                return await ctx.send('Use `>services quarantine release <service> <id on that service>`')
+            if await Resources.quarantine.release(service, service_id):
+                return await ctx.send(f"Released {service} user {service_id}, they'll be synced next round")
+            return await ctx.send(f"{service} user {service_id} isn't quarantined")
+        elif action != 'list':
+            return await ctx.send('Use `>services quarantine [list]` or `>services quarantine release <service> <id>`')
+
+        entries = Resources.quarantine.list()
+        if not entries:
+            return await ctx.send('Nobody is quarantined')
+        names = {}
+        async for doc in Resources.user_col.find(
+            {'$or': [{'service': e['service'], 'service_id': {'$in': [e['service_id'], int(e['service_id']) if e['service_id'].isdigit() else e['service_id']]}} for e in entries]},
+            {'service': 1, 'service_id': 1, 'profile.name': 1}
+        ):
+            names[(doc['service'], str(doc['service_id']))] = doc['profile']['name']
+        now = time.time()
+        lines = []
+        for e in entries[:20]:
+            name = names.get((e['service'], e['service_id']), '?')
+            left = f"{(e['until'] - now)/60:.0f}min left" if e['until'] > now else 'retrying'
+            lines.append(f"**{e['service']}** {e['service_id']} ({name}): {e['strikes']} strikes, {left}\n> {e['error']}")
+        if len(entries) > 20:
+            lines.append(f"...and {len(entries) - 20} more")
+        return await ctx.send('\n'.join(lines))
+
     async def _filter(self, ctx, onlyImages=False):
         # await ctx.trigger_typing()
         selectors = ['1️⃣', '2️⃣', '3️⃣', '4️⃣', '5️⃣', '6️⃣', '7️⃣', '8️⃣', '9️⃣'] # needs expanding if possible options exceed 9
@@ -146,7 +228,7 @@ class ServiceCommands(commands.Cog):
             description='React to the corresponding emoji to apply the ignore filter, the others will the displaying. Hit ✅ to confirm or ❌ to cancel.'
         )
 
-        current = await Resources.guild_col.find_one({'guild_id': str(ctx.guild.id)})
+        current = Resources.guild_settings.get(ctx.guild.id)
         ignore_flags = EntryAttributes(current['settings']['entry_ignore_attributes']) if current else EntryAttributes.adult
         ignore_img_flags = EntryAttributes(current['settings']['image_ignore_attributes']) if current else EntryAttributes.adult
         msgs = []
@@ -193,8 +275,8 @@ class ServiceCommands(commands.Cog):
                 if onlyImages:
                     path = 'settings.image_ignore_attributes'
                 if not current:
-                    await Resources.guild_col.update_one(
-                        {'guild_id': str(ctx.guild.id)}, 
+                    await Resources.guild_settings.update_one(
+                        ctx.guild.id, 
                         {
                             '$set': {
                                 'name': ctx.guild.name,
@@ -208,7 +290,7 @@ class ServiceCommands(commands.Cog):
                         upsert=True
                     )
                 else:
-                    await Resources.guild_col.update_one({'guild_id': str(ctx.guild.id)}, {'$set': {path: new_settings}})
+                    await Resources.guild_settings.update_one(ctx.guild.id, {'$set': {path: new_settings}})
                 await ctx.send('setting applied successfully!')
             else:
                 await ctx.send('canceled. no filters changed')
@@ -287,7 +369,8 @@ class ServiceCommands(commands.Cog):
                     discord_id=str(interaction.user.id),
                     service=service,
                     service_id=user.id,
-                    status=UserStatus.ACTIVE
+                    status=UserStatus.ACTIVE,
+                    synced=False
                 )
                 if user.data:
                     if user.data.profile.status == ResultStatus.OK:
@@ -300,20 +383,29 @@ class ServiceCommands(commands.Cog):
                                 k[str(entry['id'])] = entry.dict
                             new_user.lists[lst] = k
 
+                user_doc = new_user.dict
+                if not Resources.lists.writes_documents:
+                    del user_doc['lists']
                 await Resources.user_col.update_one(
                     {
                         'discord_id': new_user.discord_id,
                         'service': new_user.service
                     }, 
-                    {'$set': new_user.dict},
+                    {'$set': user_doc},
                     upsert=True
                 )
+                doc = await Resources.user_col.find_one({'discord_id': new_user.discord_id, 'service': new_user.service}, {'_id': 1})
+                if doc:
+                    await Resources.lists.set_user(doc['_id'], new_user.discord_id, new_user.service, new_user.lists)
+                    if service in (Service.ANILIST, Service.MYANIMELIST):
+                        Resources.compatibility.queue_rebuild(doc['_id'])
                 await interaction.followup.send(content='Your details have been updated!')
             else:
                 await interaction.followup.send(content='Your details have NOT been updated!')
 
     async def _rem_user(self, interaction, service):
         user_id = str(interaction.user.id)
+        doc = await Resources.user_col.find_one({'discord_id': user_id, 'service': service}, {'_id': 1})
         res = await Resources.user_col.delete_one(
             {
                 'discord_id': user_id,
@@ -322,13 +414,16 @@ class ServiceCommands(commands.Cog):
         )
         if res.deleted_count:
             Resources.removal_buffers[service].add(user_id)
+            if doc:
+                await Resources.lists.remove_user(doc['_id'])
+                await Resources.compatibility.remove_user(doc['_id'])
             await interaction.response.send_message(f"You have been removed form the {service} service!")
         else:
             await interaction.response.send_message('Failure. User not removed or not found.')
 
     async def _enable_list(self, ctx, lst):
-        await Resources.guild_col.update_one(
-            {'guild_id': str(ctx.guild.id)}, 
+        await Resources.guild_settings.update_one(
+            ctx.guild.id, 
             {
                 '$set': {'name': ctx.guild.name},
                 '$setOnInsert': {'settings.entry_ignore_attributes': EntryAttributes.adult, 'settings.image_ignore_attributes': EntryAttributes.adult},
@@ -338,7 +433,7 @@ class ServiceCommands(commands.Cog):
         await ctx.send(f"This channel is now set to show {lst} updates")
 
     async def _disable_list(self, ctx, lst):
-        doc = await Resources.guild_col.find_one({'guild_id': str(ctx.guild.id)}, {'settings.updates'})
+        doc = copy.deepcopy(Resources.guild_settings.get(ctx.guild.id))
 
         if not doc:
             return await ctx.send('This guild doesn\'t have updates')
@@ -356,7 +451,7 @@ class ServiceCommands(commands.Cog):
         except:
             pass
 
-        await Resources.guild_col.update_one({'guild_id': str(ctx.guild.id)}, {'$set': {'settings.updates': doc['settings']['updates']}})
+        await Resources.guild_settings.update_one(ctx.guild.id, {'$set': {'settings.updates': doc['settings']['updates']}})
 
         await ctx.send(f"This channel will no longer show {lst} updates")
 
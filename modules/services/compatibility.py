@@ -0,0 +1,227 @@
+"""Pearson compatibility of one user against many at once.
+
+Gives the same numbers as misc._get_comp_score(user, other, kind) for every
+other user, including its quirks: pairs are built from the first user's
+entries (mapping AniList<->MyAnimeList ids through Al2mal2al when the services
+differ), a pair is skipped if either normalized score is falsy, and any error
+along the way (bad score, score format that can't normalize, ...) gives (0, 0).
+The one difference is a single shared entry returns (score, 1) rather than a
+bare number.
+
+Scores are gathered into a users x pairs matrix and every coefficient is
+computed with a handful of NumPy reductions.
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, List, Optional, Tuple
+    from modules.core.resources.al2mal2al import Al2mal2al
+
+import numpy as np
+from operator import methodcaller
+
+from . import Service
+from .anilist.enums import ScoreFormat
+
+_BAD = -np.inf # marks a raw score normalizing would raise on (missing, not a number)
+_TEXT = np.inf # marks a string score. POINT_* formats "normalize" it by repeating it, which only raises once it's summed
+
+def _emoji(a: np.ndarray) -> np.ndarray:
+    return np.select(
+        [(0 < a) & (a < 1.5), (1.5 <= a) & (a < 2.5), (2.5 <= a) & (a <= 3)],
+        [35, 60, 85],
+        default=np.nan
+    )
+
+def _identity(a: np.ndarray) -> np.ndarray:
+    return a
+
+# vectorized ScoreFormat.normalized_score, NaN where it'd give None
+_normalizers = {
+    ScoreFormat.POINT_10: lambda a: a*10,
+    ScoreFormat.POINT_10_DECIMAL: lambda a: a*10,
+    ScoreFormat.POINT_100: _identity,
+    ScoreFormat.POINT_5: lambda a: a*20,
+    ScoreFormat.EMOJI: _emoji,
+}
+
+def _normalizer(score_format: str) -> Optional[Callable[[np.ndarray], np.ndarray]]:
+    """None for formats that can't normalize"""
+    return _normalizers.get(ScoreFormat(score_format))
+
+def _raises(norm: Callable, raw: np.ndarray) -> np.ndarray:
+    """Where ScoreFormat.normalized_score would raise for raw scores. None (NaN)
+    only gets through POINT_100's identity function, strings only through the
+    POINT_* ones"""
+    if norm is _identity:
+        return raw == _BAD
+    if norm is _emoji:
+        return (raw == _BAD) | (raw == _TEXT) | np.isnan(raw)
+    return (raw == _BAD) | np.isnan(raw)
+
+def _text(norm: Callable, raw: np.ndarray) -> np.ndarray:
+    """Where a normalized score is a (truthy) string"""
+    if norm is _emoji:
+        return np.zeros(raw.shape, dtype=bool)
+    return raw == _TEXT
+
+_get_score = methodcaller('get', 'score', _BAD)
+
+def _raw_score(entry: Any) -> float:
+    """Score as float, NaN for None and _BAD if it's unusable"""
+    try:
+        score = entry['score']
+    except Exception:
+        return _BAD
+    if score is None:
+        return np.nan
+    if isinstance(score, (int, float)):
+        return float(score)
+    if isinstance(score, str) and score:
+        return _TEXT
+    return _BAD
+
+def _pairs(user: Dict[str, Any], other_service: str, kind: str, al2mal2al: Al2mal2al) -> Optional[Tuple[List[str], List[float]]]:
+    """(target id in other_service, raw score) for every pair _get_comp_score 
+    would look at. None if building them would've raised"""
+    targets = []
+    scores = []
+    try:
+        lst = user['lists'][kind]
+        for i in lst:
+            ii = [i]
+            if user['service'] == Service.ANILIST and other_service == Service.MYANIMELIST:
+                ii = al2mal2al.al2mal(kind, i, [])
+            if user['service'] == Service.MYANIMELIST and other_service == Service.ANILIST:
+                ii = al2mal2al.mal2al(kind, i, [])
+            for s in ii:
+                s = str(s)
+                if s != "None":
+                    targets.append(s)
+                    scores.append(_raw_score(lst[i]))
+    except Exception:
+        return None
+    return targets, scores
+
+def compatibility_scores(user: Dict[str, Any], others: List[Dict[str, Any]], kind: str, al2mal2al: Al2mal2al) -> List[Tuple[float, int]]:
+    """(pearson coefficient * 100, number of shared scores) of user against each
+    of others (user documents with service, profile.score_format and lists.<kind>)"""
+    results = [(0, 0)] * len(others)
+    try:
+        norm1 = _normalizer(user['profile']['score_format'])
+    except Exception:
+        norm1 = None
+    if not norm1:
+        return results
+
+    # pairs depend on the other user's service, so work per service
+    by_service = {}
+    for k, other in enumerate(others):
+        by_service.setdefault(other.get('service'), []).append(k)
+
+    for service, rows in by_service.items():
+        pairs = _pairs(user, service, kind, al2mal2al)
+        if not pairs or not pairs[0]:
+            continue
+        targets, raw1 = pairs
+        for k, res in zip(rows, _scores(norm1, targets, raw1, [others[k] for k in rows], kind)):
+            results[k] = res
+    return results
+
+def _scores(norm1: Callable, targets: List[str], raw1: List[float], others: List[Dict[str, Any]], kind: str) -> List[Tuple[float, int]]:
+    # pairs can share a target id so gather each distinct target once, expand after
+    columns = {}
+    pair_cols = np.fromiter((columns.setdefault(t, len(columns)) for t in targets), dtype=np.intp, count=len(targets))
+
+    num = len(others)
+    raw = np.full((num, len(columns)), np.nan)
+    present = np.zeros((num, len(columns)), dtype=bool)
+    usable_rows = np.zeros(num, dtype=bool)
+    norms = []
+    hit_rows, hit_cols, hit_scores = [], [], []
+    for k, other in enumerate(others):
+        try:
+            norm2 = _normalizer(other['profile']['score_format'])
+            lst = other['lists'][kind]
+            if not isinstance(lst, dict):
+                norm2 = None
+        except Exception:
+            norm2 = None
+        norms.append(norm2)
+        if not norm2:
+            continue
+        usable_rows[k] = True
+        shared = list(columns.keys() & lst.keys())
+        if not shared:
+            continue
+        entries = [lst[t] for t in shared]
+        hit_rows.extend([k] * len(shared))
+        hit_cols.extend(map(columns.__getitem__, shared))
+        try:
+            hit_scores.extend(map(_get_score, entries))
+        except AttributeError:
+            hit_scores.extend(map(_raw_score, entries))
+    present[hit_rows, hit_cols] = True
+    try:
+        # None -> NaN
+        raw[hit_rows, hit_cols] = np.array(hit_scores, dtype=float)
+    except (TypeError, ValueError):
+        raw[hit_rows, hit_cols] = [s if s is _BAD else _raw_score({'score': s}) for s in hit_scores]
+
+    # normalize each row with its user's score format
+    y = np.full_like(raw, np.nan)
+    y_bad = np.zeros_like(present)
+    y_text = np.zeros_like(present)
+    for norm2 in set(n for n in norms if n):
+        rows = np.fromiter((n is norm2 for n in norms), dtype=bool, count=num)
+        with np.errstate(invalid='ignore'):
+            y[rows] = norm2(raw[rows])
+        y_bad[rows] = _raises(norm2, raw[rows])
+        y_text[rows] = _text(norm2, raw[rows])
+
+    raw1 = np.asarray(raw1, dtype=float)
+    with np.errstate(invalid='ignore'):
+        x = norm1(raw1)
+    x_bad = _raises(norm1, raw1)
+    x_text = _text(norm1, raw1)
+
+    # back to one column per pair
+    present = present[:, pair_cols]
+    y = y[:, pair_cols]
+    y_bad = y_bad[:, pair_cols]
+    y_text = y_text[:, pair_cols]
+
+    with np.errstate(invalid='ignore'):
+        x_truthy = x_text | (~np.isnan(x) & (x != 0))
+        y_truthy = y_text | (~np.isnan(y) & (y != 0))
+    # a shared entry with a score that can't be normalized raised in _get_comp_score,
+    # one normalized to a string raised when it was summed (unless skipped as falsy first)
+    text = (x_text | y_text) & x_truthy & y_truthy
+    failed = ~usable_rows | (present & (y_bad | x_bad | text)).any(axis=1)
+
+    shared = present & x_truthy & y_truthy & ~x_text & ~y_text
+    n = shared.sum(axis=1)
+    xs = np.where(shared, x, 0)
+    ys = np.where(shared, y, 0)
+    sum1 = xs.sum(axis=1)
+    sum2 = ys.sum(axis=1)
+    smult = (xs*ys).sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        av1 = sum1/n
+        av2 = sum2/n
+        sdv1 = np.sqrt((np.where(shared, x - av1[:, None], 0)**2).sum(axis=1)/(n - 1))
+        sdv2 = np.sqrt((np.where(shared, y - av2[:, None], 0)**2).sum(axis=1)/(n - 1))
+        pcc = (smult - n*av1*av2) / ((n - 1)*sdv1*sdv2)
+
+    results = []
+    for k in range(num):
+        if failed[k] or n[k] == 0:
+            results.append((0, 0))
+        elif n[k] == 1:
+            results.append((100 - 100/9 * abs(sum1[k] - sum2[k]), 1))
+        elif sdv1[k] == 0 or sdv2[k] == 0: # stdev of identical scores, _get_comp_score divides by zero
+            results.append((0, 0))
+        else:
+            results.append((float(pcc[k]*100), int(n[k])))
+    return results
@@ -0,0 +1,430 @@
+"""Persisted pairwise compatibility, kept up to date by the syncers.
+
+Every pair of AniList/MyAnimeList users that share a scored entry has a
+document in the compatibility collection holding the running sums over their
+shared normalized scores:
+
+    {kind, a, b, n, sx, sy, sxy, sxx, syy}
+
+where a < b are user document ids (as strings), x is a's score and y is b's.
+Pearson's coefficient falls out of the sums, so /compatibility is a lookup
+instead of a pass over everyone's lists.
+
+Entries are compared in AniList id space: MyAnimeList entries are keyed by
+their first mal2al id, or 'mal:<id>' when there's no mapping. This is symmetric
+so unlike misc._get_comp_score the result doesn't depend on who asks; the
+consistency check reports how far the two drift apart.
+
+Syncers queue score deltas as their user writes are built and apply() folds
+them into the sums right after the writes land. A full rebuild (or a rebuild of
+one user when they link or switch score format) recomputes the sums with a few
+matrix products per block of users, off the event loop, and upserts them over
+the stored ones so readers never see a pair missing or half summed. apply()
+and rebuilds take turns.
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Dict, Iterable, List, Optional, Tuple
+    from modules.core.resources.database import Database
+    from modules.core.resources.al2mal2al import Al2mal2al
+    from modules.core.resources.list_repository import ListRepository
+    from .models.user import User
+
+import asyncio, logging, math, time
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from . import Service
+from .anilist.enums import ScoreFormat
+from .compatibility import compatibility_scores
+
+logger = logging.getLogger(__name__)
+
+KINDS = ['anime', 'manga']
+SUMS = ['n', 'sx', 'sy', 'sxy', 'sxx', 'syy']
+_EPSILON = 1e-6 # variance below this counts as identical scores
+_BLOCK = 256 # users per side of a rebuild's matrix products
+
+def normalized(score_format: str, score: Any) -> Optional[float]:
+    """Normalized score, None if it doesn't count towards compatibility"""
+    try:
+        s = ScoreFormat(score_format).normalized_score(score)
+    except Exception:
+        return None
+    return float(s) if s else None
+
+def pearson(sums: Dict[str, float]) -> Tuple[float, int]:
+    """(pearson coefficient * 100, number of shared scores) from running sums,
+    with the same conventions as misc._get_comp_score"""
+    n = int(round(sums.get('n', 0)))
+    if n <= 0:
+        return (0, 0)
+    sx, sy = sums['sx'], sums['sy']
+    if n == 1:
+        return (100 - 100/9 * abs(sx - sy), 1)
+    vx = sums['sxx'] - sx*sx/n
+    vy = sums['syy'] - sy*sy/n
+    if vx <= _EPSILON or vy <= _EPSILON: # identical scores, _get_comp_score divides by zero
+        return (0, 0)
+    return ((sums['sxy'] - sx*sy/n) / math.sqrt(vx*vy) * 100, n)
+
+def _pair(u: str, v: str) -> Tuple[str, str]:
+    return (u, v) if u < v else (v, u)
+
+class CompatibilityStore:
+
+    def __init__(self, col: Database, user_col: Database, al2mal2al: Al2mal2al, lists: ListRepository) -> None:
+        self.col = col
+        self.user_col = user_col
+        self.al2mal2al = al2mal2al
+        self.lists = lists
+        self._queued = [] # (user key, service, kind, score format, {media id: (old score, new score)})
+        self._rebuilds = set() # user keys to recompute from scratch
+        self._lock = asyncio.Lock() # apply() and rebuilds, so an $inc never lands in the middle of a rebuild
+
+    async def start(self) -> None:
+        try:
+            await self.col.collection.create_index([('kind', 1), ('a', 1), ('b', 1)], unique=True)
+            await self.col.collection.create_index([('kind', 1), ('b', 1)])
+        except Exception:
+            logger.exception('could not create compatibility indexes')
+
+    ### id space ###
+
+    def key(self, service: str, kind: str, media_id: str) -> Optional[str]:
+        """Key an entry is compared under, None if it can't be compared"""
+        if media_id is None or str(media_id) == 'None':
+            return None
+        if service == Service.ANILIST:
+            return str(media_id)
+        if service == Service.MYANIMELIST:
+            mapped = self.al2mal2al.mal2al(kind, media_id, None)
+            if isinstance(mapped, (list, tuple)):
+                mapped = mapped[0] if mapped else None
+            if mapped is None or str(mapped) == 'None':
+                return f"mal:{media_id}"
+            return str(mapped)
+        return None
+
+    def _holder_ids(self, kind: str, keys: Iterable[str]) -> Dict[str, set]:
+        """service -> media ids of entries compared under any of keys"""
+        al_ids = set()
+        mal_ids = set()
+        for k in keys:
+            if k.startswith('mal:'):
+                mal_ids.add(k[4:])
+                continue
+            al_ids.add(k)
+            for j in self.al2mal2al.al2mal(kind, k, None) or []:
+                if self.key(Service.MYANIMELIST, kind, j) == k:
+                    mal_ids.add(str(j))
+        return {Service.ANILIST: al_ids, Service.MYANIMELIST: mal_ids}
+
+    async def _holders(self, kind: str, keys: Iterable[str]) -> List[Dict[str, Any]]:
+        """User documents (service, profile.score_format and the matching
+        entries of lists.<kind>) of everyone with an entry under any of keys"""
+        service_ids = self._holder_ids(kind, keys)
+        if not self.lists.ready: # media index still building, user documents have the lists
+            clauses = []
+            for service, ids in service_ids.items():
+                for i in ids:
+                    clauses.append({'service': service, f"lists.{kind}.{i}": {'$exists': True}})
+            return await self.user_col.find({'$or': clauses}, {'service': 1, 'profile.score_format': 1, f"lists.{kind}": 1}).to_list(length=None)
+
+        entries = {}
+        for row in await self.lists.holders(service_ids, kind):
+            entries.setdefault(row['user'], {})[row['media_id']] = {'score': row['score']}
+        if not entries:
+            return []
+        docs = await self.user_col.find({'_id': {'$in': list(entries)}}, {'service': 1, 'profile.score_format': 1}).to_list(length=None)
+        for doc in docs:
+            doc['lists'] = {kind: entries[doc['_id']]}
+        return docs
+
+    ### incremental ###
+
+    def queue(self, user: User, kind: str, diffs: Dict[str, Tuple[Any, Any]], old_format: Optional[str] = None) -> None:
+        """Queue score changes of one of user's lists. diffs maps media id to
+        (old score, new score) with None for a missing entry. Call as the user's
+        write is built; apply() once it's been written"""
+        if user.service not in (Service.ANILIST, Service.MYANIMELIST) or kind not in KINDS:
+            return
+        user_key = str(user._id)
+        score_format = user.profile.score_format
+        if old_format is not None and old_format != score_format:
+            self._rebuilds.add(user_key) # every normalized score moved
+            return
+        if diffs and user_key not in self._rebuilds:
+            self._queued.append((user_key, user.service, kind, score_format, diffs))
+
+    async def apply(self, written: Optional[Iterable[str]] = None, failed: Iterable[str] = ()) -> None:
+        """Fold queued changes into the stored sums. Holders of the changed
+        entries are read after the writes landed, so their values are rolled
+        back to what they were before this batch and then replayed in order.
+
+        written: user keys whose writes landed, only their changes are folded
+            in (all of them if None). Others stay queued for whoever flushes them
+        failed: user keys whose writes didn't land, their changes are dropped
+        """
+        failed = set(failed)
+        if written is None:
+            queued, self._queued = [q for q in self._queued if q[0] not in failed], []
+        else:
+            written = set(written)
+            queued = [q for q in self._queued if q[0] in written]
+            self._queued = [q for q in self._queued if q[0] not in written and q[0] not in failed]
+        rebuilds, self._rebuilds = self._rebuilds, set()
+        start = time.time()
+        pairs = 0
+        try:
+            async with self._lock:
+                for kind in KINDS:
+                    kind_queued = [q for q in queued if q[2] == kind and q[0] not in rebuilds]
+                    if kind_queued:
+                        pairs += await self._apply_kind(kind, kind_queued)
+                for user_key in rebuilds:
+                    await self._rebuild(user_key)
+        except Exception:
+            logger.exception('compatibility update failed, a rebuild will fix any drift')
+            return
+        if queued or rebuilds:
+            logger.info(f"compatibility: {len(queued)} list changes touched {pairs} pairs, {len(rebuilds)} users rebuilt in {time.time()-start:.2f}s")
+
+    async def _apply_kind(self, kind: str, queued: List[Tuple]) -> int:
+        # entries still to be replayed, valued as they were before this batch
+        pending = {}
+        keys = set()
+        for user_key, service, _, score_format, diffs in queued:
+            for mid, (old, new) in diffs.items():
+                k = self.key(service, kind, mid)
+                if k is None:
+                    continue
+                keys.add(k)
+                pending.setdefault((user_key, mid), (k, normalized(score_format, old)))
+        if not keys:
+            return 0
+
+        # key -> {(user key, media id): normalized score}
+        index = {k: {} for k in keys}
+        for doc in await self._holders(kind, keys):
+            user_key = str(doc['_id'])
+            score_format = doc.get('profile', {}).get('score_format')
+            for mid, entry in (doc.get('lists', {}).get(kind) or {}).items():
+                k = self.key(doc.get('service'), kind, mid)
+                if k not in index or (user_key, mid) in pending:
+                    continue
+                s = normalized(score_format, (entry or {}).get('score'))
+                if s:
+                    index[k][(user_key, mid)] = s
+        for (user_key, mid), (k, s) in pending.items():
+            if s:
+                index[k][(user_key, mid)] = s
+
+        deltas = {}
+        def add(u: str, x: float, v: str, y: float, sign: int) -> None:
+            a, b = _pair(u, v)
+            if a != u:
+                x, y = y, x
+            d = deltas.setdefault((a, b), [0, 0, 0, 0, 0, 0])
+            d[0] += sign
+            d[1] += sign*x
+            d[2] += sign*y
+            d[3] += sign*x*y
+            d[4] += sign*x*x
+            d[5] += sign*y*y
+
+        for user_key, service, _, score_format, diffs in queued:
+            for mid, (old, new) in diffs.items():
+                k = self.key(service, kind, mid)
+                if k is None:
+                    continue
+                holders = index[k]
+                x_old = holders.pop((user_key, mid), None)
+                x_new = normalized(score_format, new)
+                for (v, _), y in holders.items():
+                    if v == user_key:
+                        continue
+                    if x_old:
+                        add(user_key, x_old, v, y, -1)
+                    if x_new:
+                        add(user_key, x_new, v, y, 1)
+                if x_new:
+                    holders[(user_key, mid)] = x_new
+
+        ops = []
+        for (a, b), d in deltas.items():
+            if not any(d):
+                continue
+            ops.append(UpdateOne(
+                {'kind': kind, 'a': a, 'b': b},
+                {'$inc': dict(zip(SUMS, d))},
+                upsert=True
+            ))
+        if ops:
+            await self.col.collection.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    ### rebuild ###
+
+    async def _score_rows(self, kind: str) -> Tuple[List[str], List[Dict[str, float]]]:
+        """user keys and {key: normalized score} for every AniList/MyAnimeList user"""
+        users = []
+        rows = []
+        docs = await self.lists.score_docs({'service': {'$in': [Service.ANILIST, Service.MYANIMELIST]}}, kind)
+        for doc in docs:
+            score_format = doc.get('profile', {}).get('score_format')
+            row = {}
+            for mid, entry in doc['lists'][kind].items():
+                k = self.key(doc.get('service'), kind, mid)
+                s = normalized(score_format, entry.get('score'))
+                if k is not None and s:
+                    row[k] = s
+            users.append(str(doc['_id']))
+            rows.append(row)
+        return users, rows
+
+    @staticmethod
+    def _sums(rows_a: List[Dict[str, float]], rows_b: List[Dict[str, float]]) -> Dict[str, np.ndarray]:
+        """Running sums for every row of rows_a against every row of rows_b.
+        Only keys both sides have a score for get a column"""
+        keys_a = set()
+        for row in rows_a:
+            keys_a.update(row)
+        columns = {}
+        for row in rows_b:
+            for k in row:
+                if k in keys_a:
+                    columns.setdefault(k, len(columns))
+        def matrix(rows):
+            x = np.zeros((len(rows), len(columns)))
+            r, c, v = [], [], []
+            for i, row in enumerate(rows):
+                for k, s in row.items():
+                    j = columns.get(k)
+                    if j is not None:
+                        r.append(i)
+                        c.append(j)
+                        v.append(s)
+            x[r, c] = v
+            return x
+        xa = matrix(rows_a)
+        xb = xa if rows_a is rows_b else matrix(rows_b)
+        ma = (xa != 0).astype(float)
+        mb = (xb != 0).astype(float)
+        return {
+            'n': ma @ mb.T,
+            'sx': xa @ mb.T,
+            'sy': ma @ xb.T,
+            'sxy': xa @ xb.T,
+            'sxx': (xa*xa) @ mb.T,
+            'syy': ma @ (xb*xb).T,
+        }
+
+    @classmethod
+    def _block_docs(cls, kind: str, users: List[str], rows: List[Dict[str, float]], a_idx: List[int], b_idx: List[int]) -> List[Dict[str, Any]]:
+        """Pair documents of users a_idx against users b_idx, each pair once
+        (j > i when both sides cover the same users)"""
+        sums = cls._sums([rows[i] for i in a_idx], [rows[j] for j in b_idx])
+        docs = []
+        for r, i in enumerate(a_idx):
+            for c in np.nonzero(sums['n'][r])[0]:
+                j = b_idx[c]
+                if j == i or (j < i and j in a_idx):
+                    continue
+                u, v = users[i], users[j]
+                doc = {s: float(sums[s][r, c]) for s in SUMS}
+                doc['n'] = int(doc['n'])
+                if v < u: # x belongs to a
+                    doc['sx'], doc['sy'] = doc['sy'], doc['sx']
+                    doc['sxx'], doc['syy'] = doc['syy'], doc['sxx']
+                a, b = _pair(u, v)
+                docs.append({'kind': kind, 'a': a, 'b': b, **doc})
+        return docs
+
+    async def rebuild(self, user_key: Optional[str] = None) -> int:
+        """Recompute sums from the user documents, for every pair or just the
+        pairs of one user. Returns the number of pairs stored"""
+        async with self._lock:
+            return await self._rebuild(user_key)
+
+    async def _rebuild(self, user_key: Optional[str] = None) -> int:
+        loop = asyncio.get_running_loop()
+        stored = 0
+        for kind in KINDS:
+            users, rows = await self._score_rows(kind)
+            if user_key is None:
+                a_idx = list(range(len(users)))
+                scope = {'kind': kind}
+            else:
+                if user_key not in users:
+                    await self.remove_user(user_key, kinds=[kind])
+                    continue
+                a_idx = [users.index(user_key)]
+                scope = {'kind': kind, '$or': [{'a': user_key}, {'b': user_key}]}
+
+            # sums are $set over the old ones, pairs this rebuild didn't write are deleted after
+            stamp = ObjectId()
+            for s in range(0, len(a_idx), _BLOCK):
+                block = a_idx[s:s+_BLOCK]
+                # every pair once: a full rebuild pairs a block with itself and the users after it
+                others = range(block[0], len(users)) if user_key is None else range(len(users))
+                for t in range(0, len(others), _BLOCK):
+                    docs = await loop.run_in_executor(None, self._block_docs, kind, users, rows, block, others[t:t+_BLOCK])
+                    ops = [
+                        UpdateOne({'kind': kind, 'a': doc['a'], 'b': doc['b']}, {'$set': {**doc, 'rebuilt': stamp}}, upsert=True)
+                        for doc in docs
+                    ]
+                    for i in range(0, len(ops), 1000):
+                        await self.col.collection.bulk_write(ops[i:i+1000], ordered=False)
+                    stored += len(ops)
+            await self.col.collection.delete_many({**scope, 'rebuilt': {'$ne': stamp}})
+        return stored
+
+    def queue_rebuild(self, user_key: str) -> None:
+        self._rebuilds.add(str(user_key))
+
+    async def remove_user(self, user_key: str, kinds: List[str] = KINDS) -> None:
+        user_key = str(user_key)
+        self._queued = [q for q in self._queued if q[0] != user_key]
+        self._rebuilds.discard(user_key)
+        await self.col.delete_many({'kind': {'$in': kinds}, '$or': [{'a': user_key}, {'b': user_key}]})
+
+    ### lookup ###
+
+    async def scores(self, user_key: str, kind: str) -> Dict[str, Tuple[float, int]]:
+        """other user key -> (pearson coefficient * 100, number of shared scores)"""
+        user_key = str(user_key)
+        scores = {}
+        async for doc in self.col.find({'kind': kind, '$or': [{'a': user_key}, {'b': user_key}]}):
+            other = doc['b'] if doc['a'] == user_key else doc['a']
+            scores[other] = pearson(doc)
+        return scores
+
+    async def check(self, kind: str, limit: int = 200, tolerance: float = 0.5) -> Dict[str, Any]:
+        """Compare up to limit stored pairs against a from-scratch calculation.
+        Cross-service pairs are calculated with the MyAnimeList user first,
+        the way their entries are keyed here"""
+        report = {'checked': 0, 'mismatched': 0, 'max_diff': 0.0, 'examples': []}
+        pairs = await self.col.find({'kind': kind, 'n': {'$gt': 0}}).to_list(length=limit)
+        ids = {ObjectId(p[s]) for p in pairs for s in ('a', 'b')}
+        docs = {}
+        for doc in await self.lists.score_docs({'_id': {'$in': list(ids)}}, kind, {'profile.name': 1}):
+            docs[str(doc['_id'])] = doc
+        for p in pairs:
+            u, v = docs.get(p['a']), docs.get(p['b'])
+            if not (u and v):
+                continue
+            if v['service'] == Service.MYANIMELIST and u['service'] != v['service']:
+                u, v = v, u
+            expected = compatibility_scores(u, [v], kind, self.al2mal2al)[0]
+            stored = pearson(p)
+            report['checked'] += 1
+            diff = abs(expected[0] - stored[0])
+            report['max_diff'] = max(report['max_diff'], diff)
+            if diff > tolerance or expected[1] != stored[1]:
+                report['mismatched'] += 1
+                if len(report['examples']) < 5:
+                    report['examples'].append((u['profile'].get('name'), v['profile'].get('name'), expected, stored))
+        return report
@@ -0,0 +1,219 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Optional, Tuple
+    from .models.entry import ListEntry
+    from .models.user import User
+
+import asyncio, logging, multiprocessing, os, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+from .models.change import Change
+from .models.data import FetchData, QueryResult, ResultStatus
+
+logger = logging.getLogger(__name__)
+
+class _Unset:
+    """Marks a field that wasn't set in a packed entry (pickles by reference)"""
+
+@dataclass
+class ComprehensionStats:
+    users: int = 0
+    entries: int = 0
+    seconds: float = 0.0 # waiting on comprehensions
+
+    def take(self, mode: str) -> str:
+        rate = self.entries / self.seconds if self.seconds else 0
+        line = f"comprehended {self.users} users, {self.entries} entries in {self.seconds:.2f}s ({rate:.0f} entries/s, {mode})"
+        self.users, self.entries, self.seconds = 0, 0, 0.0
+        return line
+
+class LoopLag:
+    """How late the event loop wakes a task that sleeps interval seconds,
+    logged every report_interval"""
+
+    def __init__(self, interval: float = 0.1, report_interval: float = 300) -> None:
+        self.interval = interval
+        self.report_interval = report_interval
+        self.max = 0.0
+        self.total = 0.0
+        self.samples = 0
+        self._task = None
+
+    def start(self, label: str) -> None:
+        if not self._task:
+            self._task = asyncio.get_running_loop().create_task(self._run(label))
+
+    def take(self) -> Tuple[float, float]:
+        """Max and mean lag in seconds since the last take"""
+        result = (self.max, self.total / self.samples if self.samples else 0.0)
+        self.max, self.total, self.samples = 0.0, 0.0, 0
+        return result
+
+    async def _run(self, label: str) -> None:
+        loop = asyncio.get_running_loop()
+        reported = loop.time()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - start - self.interval)
+            self.max = max(self.max, lag)
+            self.total += lag
+            self.samples += 1
+            if loop.time() - reported >= self.report_interval:
+                reported = loop.time()
+                worst, mean = self.take()
+                logger.info(f"event loop lag with {label} comprehension: max {worst*1000:.0f}ms, mean {mean*1000:.1f}ms")
+
+def _pack(stored: Dict[str, Dict], entries: List[ListEntry]) -> Tuple:
+    """What a worker process needs to comprehend a fetched list: its entry
+    classes and field values, and only the stored entries they'd be
+    compared with"""
+    classes, rows, subset = [], [], {}
+    for entry in entries:
+        klass = type(entry)
+        if klass not in classes:
+            classes.append(klass)
+        rows.append((classes.index(klass),) + tuple(getattr(entry, slot, _Unset) for slot in klass._slots.values()))
+        i = str(entry['id'])
+        if i in stored:
+            subset[i] = stored[i]
+    return classes, rows, subset
+
+class _PackedUser:
+    """The parts of a User that comprehension reads"""
+    __slots__ = ['lists', 'profile']
+
+    def __init__(self, lists: Dict[str, Dict], profile: Any) -> None:
+        self.lists = lists
+        self.profile = profile
+
+def _comprehend_packed(packed: Tuple) -> Dict[str, Tuple[List[int], List[Tuple[int, List[Tuple]]]]]:
+    """Runs in a worker process. Returns each list's entry fingerprints and
+    the (row, rendered changes) of entries with changes"""
+    from .syncer import Syncer
+
+    profile, latest, packed_lists = packed
+    lists, stored = {}, {}
+    for lst, (classes, rows, subset) in packed_lists.items():
+        slots = [list(klass._slots.values()) for klass in classes]
+        entries = []
+        for row in rows:
+            klass = classes[row[0]]
+            entry = klass()
+            for slot, value in zip(slots[row[0]], row[1:]):
+                if value is not _Unset:
+                    setattr(entry, slot, value)
+            entries.append(entry)
+        lists[lst] = QueryResult(status=ResultStatus.OK, data=entries)
+        stored[lst] = subset
+    data = FetchData(
+        lists=lists,
+        profile=QueryResult(status=ResultStatus.OK, data=latest) if latest is not None else QueryResult(status=ResultStatus.ERROR, data=None)
+    )
+    comprehensions = Syncer._comprehend(_PackedUser(stored, profile), data)
+
+    result = {}
+    for lst, changed in comprehensions.items():
+        entries = lists[lst].data
+        rows = {id(entry): i for i, entry in enumerate(entries)}
+        result[lst] = (
+            [entry.fingerprint for entry in entries],
+            [(rows[id(entry)], [(c.kind, c.old, c.new, c.msg) for c in entry.changes(pruned=True)]) for entry in changed]
+        )
+    return result
+
+def _unpack(entries: List[ListEntry], fingerprints: List[int], changed: List[Tuple[int, List[Tuple]]]) -> List[ListEntry]:
+    for entry, fingerprint in zip(entries, fingerprints):
+        entry._fingerprint = fingerprint # saves _persist hashing them again
+    comprehended = []
+    for i, changes in changed:
+        entry = entries[i]
+        entry._changes = [Change(*change) for change in changes]
+        comprehended.append(entry)
+    return comprehended
+
+class Comprehender:
+    """Where Syncer._comprehend runs.
+
+    inline: on the event loop, blocking it for as long as it takes
+    thread: in a thread pool (the loop's default one unless workers is set).
+        Comprehension is pure python though, so it still holds the GIL
+        against the loop for most of that time
+    process: in a pool of worker processes. Fetched lists are packed into
+        plain rows along with just the stored entries they're compared to,
+        and only fingerprints and changed entries with their messages come
+        back, so the loop only spends time on packing and unpacking
+    """
+    INLINE = 'inline'
+    THREAD = 'thread'
+    PROCESS = 'process'
+    MODES = (INLINE, THREAD, PROCESS)
+
+    def __init__(self, mode: str = THREAD, workers: Optional[int] = None) -> None:
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown comprehension mode '{mode}', use one of {', '.join(self.MODES)}")
+        self.mode = mode
+        self.workers = workers
+        self.lag = LoopLag()
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            if self.mode == self.PROCESS:
+                # not fork: a forked worker gets a copy of the loop, the db
+                # clients and their threads mid use. Workers import main.py
+                # (without running it, see its __main__ guard) and this module
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(self.workers or os.cpu_count(), mp_context=multiprocessing.get_context(method))
+            elif self.mode == self.THREAD and self.workers:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='comprehension')
+        return self._pool
+
+    async def comprehend(self, user: User, data: FetchData, stats: Optional[ComprehensionStats] = None) -> Dict[str, List[ListEntry]]:
+        from .syncer import Syncer
+
+        self.lag.start(self.mode)
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            if self.mode == self.INLINE:
+                return Syncer._comprehend(user, data)
+            if self.mode == self.THREAD:
+                return await loop.run_in_executor(self._executor(), Syncer._comprehend, user, data)
+            return await self._comprehend_in_process(user, data)
+        finally:
+            if stats:
+                stats.users += 1
+                stats.entries += sum(len(r.data) for r in data.lists.values() if r.status == ResultStatus.OK)
+                stats.seconds += time.perf_counter() - start
+
+    async def _comprehend_in_process(self, user: User, data: FetchData) -> Dict[str, List[ListEntry]]:
+        from .syncer import Syncer
+
+        loop = asyncio.get_running_loop()
+        # a list at a time, giving the loop a turn in between
+        lists = {}
+        for lst, result in data.lists.items():
+            if result.status == ResultStatus.OK:
+                lists[lst] = _pack(user.lists.get(lst, {}), result.data)
+                await asyncio.sleep(0)
+        latest = data.profile.data if data.profile.status == ResultStatus.OK else None
+        try:
+            result = await loop.run_in_executor(self._executor(), _comprehend_packed, (user.profile, latest, lists))
+        except BrokenProcessPool:
+            logger.exception("comprehension worker died, starting a new pool")
+            self.close()
+            return await loop.run_in_executor(None, Syncer._comprehend, user, data)
+        comprehensions = {}
+        for lst, (fingerprints, changed) in result.items():
+            comprehensions[lst] = _unpack(data.lists[lst].data, fingerprints, changed)
+            await asyncio.sleep(0)
+        return comprehensions
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
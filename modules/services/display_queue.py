@@ -0,0 +1,105 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Awaitable, Callable, Dict, List
+    from .models.entry import ListEntry
+    from .models.user import User
+
+import asyncio, datetime, logging
+
+from .models.data import Image
+
+logger = logging.getLogger(__name__)
+
+class QueuedChange:
+    __slots__ = ['msg']
+
+    def __init__(self, msg: str) -> None:
+        self.msg = msg
+
+class QueuedEntry:
+    """What Syncer._display reads from a ListEntry, rebuilt from a queued job"""
+    __slots__ = ['_attributes', '_msgs', '_images']
+
+    def __init__(self, attributes: int, msgs: List[str], images: List[Dict[str, Any]]) -> None:
+        self._attributes = attributes
+        self._msgs = msgs
+        self._images = images
+
+    def __getitem__(self, key: str) -> Any:
+        if key != 'attributes':
+            raise KeyError(key)
+        return self._attributes
+
+    def changes(self, pruned: bool = True) -> List[QueuedChange]:
+        return [QueuedChange(msg) for msg in self._msgs]
+
+    def images(self) -> List[Image]:
+        return [Image(**img) for img in self._images]
+
+class DisplayQueue:
+    """Hands list updates from sync workers to the bot process.
+
+    A sync worker running without the discord gateway can't post updates
+    itself, so push() stores each user's changes as a job in a collection
+    and the bot's consume() loop takes them oldest first and posts them like
+    a local syncer would.
+    """
+
+    def __init__(self, db, poll_interval: float = 2) -> None:
+        self.db = db
+        self.poll_interval = poll_interval
+
+    async def start(self) -> None:
+        try:
+            # consume() takes the oldest job of a service every poll_interval
+            await self.db.collection.create_index([('service', 1), ('created', 1)])
+        except Exception:
+            logger.exception('Could not create the display queue index')
+
+    async def push(self, user: User, comprehensions: Dict[str, List[ListEntry]]) -> None:
+        lists = {}
+        for lst, entries in comprehensions.items():
+            jobs = []
+            for entry in entries:
+                jobs.append({
+                    'attributes': entry['attributes'],
+                    'msgs': [change.msg for change in entry.changes(pruned=True)],
+                    'images': [{'narrow': img.narrow, 'wide': img.wide, 'nsfw': img.nsfw} for img in entry.images()],
+                })
+            if jobs:
+                lists[lst] = jobs
+        if not lists:
+            return
+        await self.db.collection.insert_one({
+            'created': datetime.datetime.utcnow(),
+            'user': user._id,
+            'discord_id': user.discord_id,
+            'service': user.service,
+            'lists': lists,
+        })
+
+    async def consume(self, service: str, handler: Callable[[Dict[str, Any], Dict[str, List[QueuedEntry]]], Awaitable[None]]) -> None:
+        """Pass each queued job for service to handler along with its
+        entries, forever"""
+        while True:
+            try:
+                job = await self.db.collection.find_one_and_delete({'service': service}, sort=[('created', 1)])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Reading the {service} display queue failed")
+                job = None
+            if not job:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            comprehensions = {
+                lst: [QueuedEntry(e['attributes'], e['msgs'], e['images']) for e in entries]
+                for lst, entries in job['lists'].items()
+            }
+            try:
+                await handler(job, comprehensions)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Displaying a queued {service} update failed")
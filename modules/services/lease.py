@@ -0,0 +1,150 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Dict, Set
+    from bson import ObjectId
+
+import asyncio, logging, math, time, zlib
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+def shard_of(user_id: ObjectId, shards: int) -> int:
+    return zlib.crc32(str(user_id).encode()) % shards
+
+class ShardLease:
+    """Which of a service's users this sync worker handles.
+
+    Users are split into shards by a hash of their _id. Each shard has a
+    lease document (_id '<service>:<shard>') naming its owner and when the
+    lease expires. Workers also keep a heartbeat document
+    ('worker:<worker_id>') so each one knows how many are alive and claims
+    an even share of the shards. They renew what they hold every ttl/3
+    seconds and hand back anything past their share, so shards move to new
+    workers within a renewal or two and to survivors once a dead worker's
+    leases expire. A worker only syncs users in shards it holds, so no user
+    is synced twice as long as a worker doesn't stall for longer than ttl.
+
+    A shard that stops being ours is draining first: owns() is False for it,
+    but its lease is still renewed until every batch picked before then
+    (batch_started() to batch_written()) has had its writes land, so the
+    next owner doesn't sync those users again before that.
+
+    If renewals keep failing, the leases run out in the database while we
+    still think we hold them. So owns() is False for everything once ttl
+    has passed since the last renewal that went through, until one does.
+    """
+
+    def __init__(self, db, service: str, worker_id: str, shards: int = 16, ttl: float = 60) -> None:
+        self.db = db
+        self.service = service
+        self.worker_id = worker_id
+        self.shards = shards
+        self.ttl = ttl
+        self.owned: Set[int] = set()
+        self.draining: Dict[int, int] = {} # shard -> renewal it stopped being ours at
+        self.renewals = 0
+        self._batches: Dict[int, int] = {} # renewal -> batches picked since then not written yet
+        self._held_until = 0.0 # time.monotonic() our leases run out at, as of the last renewal
+        self._task = None
+
+    @property
+    def held(self) -> bool:
+        """Whether the last successful renewal is recent enough that the
+        leases it renewed haven't expired"""
+        return time.monotonic() < self._held_until
+
+    def owns(self, user_id: ObjectId) -> bool:
+        return self.held and shard_of(user_id, self.shards) in self.owned
+
+    def batch_started(self) -> int:
+        """Call before picking a batch's users with owns(), and pass what it
+        returns to batch_written() once their writes landed"""
+        self._batches[self.renewals] = self._batches.get(self.renewals, 0) + 1
+        return self.renewals
+
+    def batch_written(self, started: int) -> None:
+        left = self._batches.get(started, 0) - 1
+        if left > 0:
+            self._batches[started] = left
+        else:
+            self._batches.pop(started, None)
+
+    def batches_abandoned(self) -> None:
+        """Batches that were started won't be written (their round failed)"""
+        self._batches = {}
+
+    def _key(self, shard: int) -> str:
+        return f"{self.service}:{shard}"
+
+    async def start(self) -> None:
+        await self.renew()
+        if not self._task:
+            self._task = asyncio.create_task(self._renew_loop())
+
+    async def _renew_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await self.renew()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(f"Renewing {self.service} shard leases failed")
+                if self.owned and not self.held:
+                    logger.warning(f"{self.service} worker {self.worker_id} lost its shard leases, syncing nobody until a renewal goes through")
+                    self.owned = set()
+                    self.draining = {}
+
+    async def renew(self) -> None:
+        started = time.monotonic()
+        now = time.time()
+        col = self.db.collection
+        await col.update_one({'_id': f"worker:{self.worker_id}"}, {'$set': {'expires': now + self.ttl}}, upsert=True)
+        workers = await col.count_documents({'_id': {'$regex': '^worker:'}, 'expires': {'$gt': now}})
+        share = math.ceil(self.shards / max(1, workers))
+
+        owned = set()
+        for shard in range(self.shards):
+            if len(owned) >= share:
+                break
+            try:
+                # ours already or nobody's (expired / never claimed)
+                await col.find_one_and_update(
+                    {'_id': self._key(shard), '$or': [{'owner': self.worker_id}, {'expires': {'$lt': now}}]},
+                    {'$set': {'owner': self.worker_id, 'expires': now + self.ttl}},
+                    upsert=True
+                )
+            except DuplicateKeyError: # someone else holds it
+                continue
+            owned.add(shard)
+
+        # past our share now that more workers are around. stop picking users
+        # from those right away, but hand them over only once batches picked
+        # before this renewal are written
+        renewal = self.renewals + 1
+        for shard in self.owned - owned:
+            self.draining[shard] = renewal
+        for shard in owned:
+            self.draining.pop(shard, None)
+        oldest = min(self._batches, default=renewal)
+        self.draining = {shard: since for shard, since in self.draining.items() if oldest < since}
+        if owned != self.owned:
+            logger.info(f"{self.service} worker {self.worker_id} holds shards {sorted(owned)} of {self.shards} ({workers} workers, draining {sorted(self.draining)})")
+        self.owned = owned
+        self.renewals = renewal
+        self._held_until = started + self.ttl
+
+        if self.draining:
+            await col.update_many({'_id': {'$in': [self._key(s) for s in self.draining]}, 'owner': self.worker_id}, {'$set': {'expires': now + self.ttl}})
+        extra = [s for s in range(self.shards) if s not in owned and s not in self.draining]
+        await col.update_many({'_id': {'$in': [self._key(s) for s in extra]}, 'owner': self.worker_id}, {'$set': {'expires': 0}})
+
+    async def release(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self.owned = set()
+        self.draining = {}
+        await self.db.collection.update_many({'owner': self.worker_id, '_id': {'$regex': f"^{self.service}:"}}, {'$set': {'expires': 0}})
+        await self.db.collection.delete_one({'_id': f"worker:{self.worker_id}"})
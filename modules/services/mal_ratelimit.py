@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+
+@dataclass
+class MalLimiterStats:
+    requests: int = 0
+    backoffs: int = 0 # 500/503 responses reported
+    waited: float = 0.0 # seconds spent waiting for a slot
+
+
+class MalRateLimiter:
+    """Paces requests to myanimelist.net.
+
+    At most concurrency requests are in flight, and request starts are at
+    least min_interval apart. MAL doesn't publish a limit; it answers too
+    many requests with a 500 (or a 503 when it's struggling), so backoff()
+    holds every caller for a cooldown that doubles with each one in a row, up
+    to max_backoff. A success after that resets the cooldown.
+    """
+
+    def __init__(self, *, concurrency: int = 4, min_interval: float = 0.5, base_backoff: float = 5, max_backoff: float = 300) -> None:
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._lock = asyncio.Lock()
+        self._min_interval = min_interval
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._cooldown = 0.0
+        self._next_start = 0.0
+        self.stats = MalLimiterStats()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold a request slot for the duration of the block"""
+        start = time.monotonic()
+        async with self._semaphore:
+            async with self._lock:
+                # starts are handed out in order, waiting under the lock keeps them spaced
+                wait = self._next_start - time.monotonic()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self._next_start = time.monotonic() + self._min_interval
+            self.stats.requests += 1
+            self.stats.waited += time.monotonic() - start
+            yield
+
+    def backoff(self) -> float:
+        """MAL pushed back, hold every caller. Returns the cooldown"""
+        self._cooldown = min(self._max_backoff, self._cooldown * 2 or self._base_backoff)
+        self._next_start = max(self._next_start, time.monotonic() + self._cooldown)
+        self.stats.backoffs += 1
+        return self._cooldown
+
+    def ok(self) -> None:
+        self._cooldown = 0.0
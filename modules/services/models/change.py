@@ -1,4 +1,4 @@
-from typing import TypeVar
+from typing import Any, Callable, TypeVar, Union
 
 K = TypeVar('K')
 #-
@@ -12,16 +12,18 @@ class Change:
         kind: Property user can use as a meta tag for the change
         old: Container for representing old value
         new: Container for representing new value
-        msg: A message to associate with change
+        msg: A message to associate with change. Can be given as a function 
+            msg(source, old, new) that's only called the first time msg is read
         ignore (bool): Specific flag user can set/get for ignoring change
     """
 
-    __slots__ = ['_old', '_new', '_msg', '_kind', '_ignore']
+    __slots__ = ['_old', '_new', '_msg', '_source', '_kind', '_ignore']
 
-    def __init__(self, kind: K, old: O, new: N, msg: str) -> None:
+    def __init__(self, kind: K, old: O, new: N, msg: Union[str, Callable[[Any, O, N], str]], source: Any = None) -> None:
         self._old = old
         self._new = new
         self._msg = msg
+        self._source = source
         self._kind = kind
         self._ignore = False
 
@@ -31,11 +33,30 @@ class Change:
 
     @property
     def msg(self) -> str:
+        if callable(self._msg):
+            self._msg = self._msg(self._source, self._old, self._new)
+            self._source = None
         return self._msg
 
     @msg.setter
     def msg(self, msg: str) -> None:
         self._msg = msg
+        self._source = None
+
+    def defer(self, msg: Callable[[Any, O, N], str], source: Any = None) -> None:
+        """Replace msg with one rendered only if it's read"""
+        self._msg = msg
+        self._source = source
+
+    @property
+    def pending(self) -> tuple:
+        """(msg, source) as they are without rendering msg, for a deferred msg
+        that builds on the current one. Render it with Change.render"""
+        return (self._msg, self._source)
+
+    @staticmethod
+    def render(msg: Union[str, Callable[[Any, O, N], str]], source: Any, old: O, new: N) -> str:
+        return msg(source, old, new) if callable(msg) else msg
 
     @property
     def ignore(self) -> bool:
@@ -44,11 +44,11 @@ class ResultStatus(Enum):
     NOTFOUND = auto()   # used by user search when user not found
     FOUND = auto()      # used by user search as OK and user found (guranteed to have data populated)
 
-@dataclass
+@dataclass(slots=True)
 class QueryResult:
-    __slots__ = ['status', 'data']
     status: ResultStatus
     data: Union[None, List[Type[ListEntry]], str, Type[Profile]]
+    partial: bool = False # list data only has entries changed since the last fetch, the rest are unchanged
 
 @dataclass
 class FetchData:
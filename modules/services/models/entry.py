@@ -8,6 +8,7 @@ if TYPE_CHECKING:
     from .data import Image
 
 from dataclasses import dataclass, field as dcfield
+import hashlib, marshal
 
 class Field(str):
     """A string with benefits :/
@@ -60,55 +61,112 @@ class Specs:
         if errs:
             raise AttributeError(f"Missing required data fields: {', '.join(errs)}")
 
-class ListEntry:
+FINGERPRINT = 'fp' # key of the fingerprint in an entry's database representation
+
+def fingerprint_of(values: tuple) -> int:
+    """Stable signed 64-bit hash of an entry's stored values (int64 in mongo)"""
+    try:
+        # version 0: newer ones mark interned and repeated objects, which
+        # changes the bytes for equal values between processes
+        data = marshal.dumps(values, 0)
+    except ValueError: # not a plain value, hash how it prints
+        data = repr(values).encode()
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little', signed=True)
+
+def _slot(label: str) -> str:
+    return f"_f_{label}"
+
+class EntryType(type):
+    """Builds each ListEntry subclass from its specs.
+
+    Every field gets its own slot (named _f_<label>) instead of a key in a
+    per-instance dict, and the lookups the syncer repeats for every entry
+    are worked out once per class: which slot backs a field, the
+    (label, slot, default) of each non-concealed field for dict, and the
+    (field, slot) pairs consume walks. A subclass that doesn't redefine specs
+    reuses its parent's. An unset slot reads as unset, so e[key] is None and
+    dict/consume fall back to the field default, same as the dict version.
+    """
+
+    def __new__(mcs, name, bases, namespace):
+        specs = namespace.get('specs')
+        if specs is None:
+            specs = next((b.specs for b in bases if hasattr(b, 'specs')), Specs())
+        inherited = set()
+        for base in bases:
+            for klass in base.__mro__:
+                inherited.update(getattr(klass, '__slots__', ()))
+        fields = specs.DYNAMIC_FIELDS + specs.DATA_FIELDS
+        if '__slots__' not in namespace:
+            namespace['__slots__'] = ()
+        namespace['__slots__'] = tuple(namespace['__slots__']) + tuple(
+            s for s in dict.fromkeys(_slot(f) for f in fields) if s not in inherited
+        )
+        namespace['specs'] = specs
+        namespace['_slots'] = {str(f): _slot(f) for f in fields}
+        namespace['_visible'] = tuple((f.label, _slot(f), f.default) for f in fields if not f.concealed)
+        namespace['_consumers'] = tuple((f, _slot(f)) for f in specs.DYNAMIC_FIELDS)
+        return super().__new__(mcs, name, bases, namespace)
+
+class ListEntry(metaclass=EntryType):
     """Represents an entry in list during sync process. Fields are accessed like 
     a dict, ex: my_entry[field].
     """
-    __slots__ = ['fields', '_changes']
+    __slots__ = ['_changes', '_fingerprint']
     specs = Specs()
 
     def __init__(self) -> None:
         self._changes = []
-        self.fields = {}
+        self._fingerprint = None
+
+    @property
+    def fields(self) -> Dict[str, Any]:
+        """Fields that have been set"""
+        return {key: getattr(self, slot) for key, slot in self._slots.items() if hasattr(self, slot)}
 
     ### dict access functionality. don't override ###
     #|  e.get(key, default) functionality
     def get(self, key: str, default: Any = None) -> Any:
         """Get field by key with optional default if key missing"""
-        return self.fields.get(key, default)
+        slot = self._slots.get(key)
+        return default if slot is None else getattr(self, slot, default)
     #|  e[key] functionality
     def __getitem__(self, key: str) -> Any:
-        return self.fields.get(key)
+        slot = self._slots.get(key)
+        return None if slot is None else getattr(self, slot, None)
     #|  e[key] = val functionality
     def __setitem__(self, key: str, val: Any) -> None:
-        if not (key in self.specs.DYNAMIC_FIELDS or key in self.specs.DATA_FIELDS):
+        slot = self._slots.get(key)
+        if slot is None:
             raise AttributeError(f"Entry has no '{key}' field")
-        self.fields[key] = val
+        setattr(self, slot, val)
+        self._fingerprint = None
 
     ### syncer functions. don't override ###
     #|  syncer uses this for knowing what to display
     def changes(self, pruned=True) -> List[Change]:
         """Get changes. Pruning returns list without ignored changes"""
-        return [c for c in self._changes if not c.ignore] if pruned else self.changes
+        return [c for c in self._changes if not c.ignore] if pruned else self._changes
     #|  syncer uses this as database entry
     @property
     def dict(self) -> Dict[str, Any]:
-        """Dict containing all non-concealed fields"""
-        d = {}
-        for field in self.specs.DYNAMIC_FIELDS:
-            if field.concealed:
-                continue
-            d[field.label] = self.fields.get(field, field.default)
-        for field in self.specs.DATA_FIELDS:
-            if field.concealed:
-                continue
-            d[field.label] = self.fields.get(field, field.default)
+        """Dict containing all non-concealed fields and their fingerprint"""
+        d = {label: getattr(self, slot, default) for label, slot, default in self._visible}
+        d[FINGERPRINT] = self.fingerprint
         return d
+    #|  syncer compares this to the stored one to skip unchanged entries
+    @property
+    def fingerprint(self) -> int:
+        """Hash of the non-concealed fields. Entries with the same one store
+        the same dict (short of a 1 in 2^64 collision), so have no changes"""
+        if self._fingerprint is None:
+            self._fingerprint = fingerprint_of(tuple([getattr(self, slot, default) for _, slot, default in self._visible]))
+        return self._fingerprint
     #|  syncer uses this to produce changes between databse entry and fetched entry
     def consume(self, entry: Union[Type[ListEntry], Dict[str, Any]]) -> None:
         """Generate changes between this entry (new) and provided entry (old)"""
-        for field in self.specs.DYNAMIC_FIELDS:
-            change = field.consume(self, entry.get(field, field.default), self.fields.get(field, field.default))
+        for field, slot in self._consumers:
+            change = field.consume(self, entry.get(field, field.default), getattr(self, slot, field.default))
             if change:
                 self._changes.append(change)
 
@@ -16,6 +16,7 @@ class Query:
     format
     """
     MAX_USERS_PER_QUERY = 1 #: For queries supporting multiple users per query, 0 for unlimited
+    SHARED_BATCH = False #: Whether a batch costs the same requests however many users are in it, so a scheduled syncer tops batches up
 
     async def find(self, username: str) -> UserSearch:
         """Try to find user from given username for service. Useful for services
@@ -0,0 +1,85 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Dict, List, Sequence
+    from .entry import ListEntry
+
+from dataclasses import dataclass
+
+import numpy as np
+
+_MISSING: Dict[str, Any] = {} # stands in for the stored entry of rows that weren't stored
+
+@dataclass
+class ListDiff:
+    changed: np.ndarray # row indices of fetched entries whose dynamic fields differ from the stored ones
+    added: np.ndarray # row indices of fetched entries that weren't stored
+    removed: List[str] # ids of stored entries that weren't fetched, only meaningful for complete lists
+
+class ListSnapshot:
+    """A list's dynamic fields as columns, one row per entry.
+
+    Columns are object arrays so comparing two snapshots uses the same ==
+    the field consumers do (status strings, int/float scores, None), just
+    over the whole list at once.
+    """
+    __slots__ = ['ids', 'columns']
+
+    def __init__(self, ids: List[str], columns: Dict[str, np.ndarray]) -> None:
+        self.ids = ids
+        self.columns = columns
+
+    @staticmethod
+    def _column(values: Sequence[Any]) -> np.ndarray:
+        return np.fromiter(values, dtype=object, count=len(values))
+
+    @classmethod
+    def from_entries(cls, entries: List[ListEntry]) -> ListSnapshot:
+        """Snapshot of fetched entries, all of the same entry class"""
+        klass = type(entries[0]) if entries else None
+        if not klass:
+            return cls([], {})
+        id_slot = klass._slots['id']
+        columns = {}
+        for field, slot in klass._consumers:
+            default = field.default
+            columns[field.label] = cls._column([getattr(e, slot, default) for e in entries])
+        return cls([str(getattr(e, id_slot, None)) for e in entries], columns)
+
+    @classmethod
+    def from_stored(cls, stored: Dict[str, Dict[str, Any]], ids: List[str], fields: Sequence) -> ListSnapshot:
+        """Snapshot of stored entries, in the row order of ids. Rows with no
+        stored entry get the field defaults, like consume gets from {}"""
+        rows = [stored.get(i, _MISSING) for i in ids]
+        columns = {}
+        for field in fields:
+            label, default = field.label, field.default
+            columns[label] = cls._column([row.get(label, default) for row in rows])
+        return cls(ids, columns)
+
+def diff_list(stored: Dict[str, Dict[str, Any]], entries: List[ListEntry]) -> ListDiff:
+    """Rows of entries that consume() could produce changes for.
+
+    A row is left out only when every dynamic field compares equal to the
+    stored value and neither is None, which relies on consumers returning
+    no change for old == new and rationalize_changes adding none. Lists
+    mixing entry classes with different specs aren't compared, every row
+    counts as changed.
+    """
+    fetched = ListSnapshot.from_entries(entries)
+    n = len(fetched.ids)
+    klasses = set(map(type, entries))
+    fetched_ids = set(fetched.ids)
+    removed = [i for i in stored if i not in fetched_ids]
+    if len({k._consumers for k in klasses}) > 1:
+        everything = np.arange(n)
+        return ListDiff(everything, everything, removed)
+    fields = [field for field, _ in next(iter(klasses))._consumers] if klasses else []
+    old = ListSnapshot.from_stored(stored, fetched.ids, fields)
+
+    same = np.ones(n, dtype=bool)
+    for field in fields:
+        a, b = old.columns[field.label], fetched.columns[field.label]
+        same &= (a == b) & ~np.equal(a, None) & ~np.equal(b, None)
+    added = np.flatnonzero(np.fromiter((i not in stored for i in fetched.ids), dtype=bool, count=n))
+    return ListDiff(np.flatnonzero(~same), added, removed)
@@ -23,9 +23,11 @@ class User:
         service_id: id used when doing 3rd party api call to service
         profile: any extra 3rd party data to associate with user other than lists
         lists: lists used to store entry data for syncing
+        synced: False until the first sync after linking has been stored.
+            Documents from before the flag existed count as synced
     """
 
-    __slots__ = ['_id', 'discord_id', 'status', 'service', 'service_id', 'profile', 'lists']
+    __slots__ = ['_id', 'discord_id', 'status', 'service', 'service_id', 'profile', 'lists', 'synced']
 
     def __init__(
         self,
@@ -36,6 +38,7 @@ class User:
         service_id:     Union[str, int]             = None,
         profile:        Type[Profile]               = None,
         lists:          Dict[str, Dict[str, Any]]   = {},
+        synced:         bool                        = True,
         **kwargs # ignore any extra fields entry might have
     ) -> None:
         self._id = _id
@@ -46,6 +49,7 @@ class User:
 
         self.profile = Service(service).profile(profile)
         self.lists = Service(service).lists(lists)
+        self.synced = synced
 
     @property
     def dict(self) -> Dict[str, Any]:
@@ -56,4 +60,5 @@ class User:
             'service_id': self.service_id,
             'profile': self.profile.dict,
             'lists': self.lists,
+            'synced': self.synced,
         }
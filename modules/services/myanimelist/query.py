@@ -2,7 +2,7 @@ from __future__ import annotations
 import logging
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
-    from typing import List, Dict
+    from typing import List, Dict, Optional
     from ..models.user import User
 
 from modules.core.resources import Resources
@@ -11,12 +11,16 @@ from ..models.data import EntryAttributes, FetchData, QueryResult, ResultStatus,
 from ..anilist.entry import AnimeEntry, MangaEntry
 from .profile import MALProfile
 from ..anilist.enums import ScoreFormat, Status
-import datetime, logging, types, os
+import asyncio, datetime, logging, os, time
+from dataclasses import dataclass
 
 logger = logging.getLogger(__name__)
 
 profile_api_url = os.getenv('MAL_PROFILE_API_URL')
 
+PAGE_SIZE = 300 # entries per load.json response
+UPDATED_ORDER = int(os.getenv('MAL_UPDATED_ORDER', default=5)) # load.json sort order for most recently updated first
+
 def img_a(self) -> List[Image]:
     if self['cover']:
         try:
@@ -43,8 +47,45 @@ def img_m(self) -> List[Image]:
     else:
         return []
 
+class MalAnimeEntry(AnimeEntry):
+    images = img_a
+
+class MalMangaEntry(MangaEntry):
+    images = img_m
+
+@dataclass
+class FetchStats:
+    """How long fetching a user's lists takes"""
+    users: int = 0
+    pages: int = 0
+    seconds: float = 0 # summed over users, who are fetched concurrently
+    last_seconds: float = 0
+    last_pages: int = 0
+
+    def observe(self, seconds: float, pages: int) -> None:
+        self.users += 1
+        self.pages += pages
+        self.seconds += seconds
+        self.last_seconds = seconds
+        self.last_pages = pages
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages / self.seconds if self.seconds else 0
+
 class MyAnimeListQuery(Query):
-    MAX_USERS_PER_QUERY = 1
+    MAX_USERS_PER_QUERY = int(os.getenv('MAL_USERS_PER_QUERY', default=4))
+
+    def __init__(self, page_concurrency: int = 3, incremental: bool = None, full_every: int = None, match_run: int = 5) -> None:
+        self.page_concurrency = page_concurrency # pages of one list fetched ahead at a time
+        self.stats = FetchStats()
+        # read lists most recently updated first and stop at the first
+        # match_run entries in a row that are the same as what's stored, with
+        # a full fetch every full_every fetches to catch removed entries
+        self.incremental = bool(os.getenv('MAL_INCREMENTAL', default=False)) if incremental is None else incremental
+        self.full_every = int(os.getenv('MAL_FULL_SYNC_EVERY', default=20)) if full_every is None else full_every
+        self.match_run = match_run
+        self.since_full: Dict[user_id, int] = {} # incremental fetches since the last full one
 
     async def find(self, username: str) -> UserSearch:
         if not username:
@@ -98,23 +139,42 @@ class MyAnimeListQuery(Query):
     async def fetch(self, users: List[User] = [], tries: int = 3) -> Dict[user_id, FetchData]:
         if not users or tries < 1:
             return {}
-        user = users[0]
 
+        # every user at once, the limiter keeps requests to mal in check
+        results = await asyncio.gather(*(self._fetch_user(user, tries) for user in users))
+        return {user._id: data for user, data in zip(users, results) if data}
+
+    async def _fetch_user(self, user: User, tries: int) -> Optional[FetchData]:
+        start = time.monotonic()
+        pages = [0]
+        incremental = self._fetch_incrementally(user)
         try:
-            animelist = await self._gen_animelist(user)
-            mangalist = await self._gen_mangalist(user)
-            return {
-                user._id: FetchData(
-                    lists={
-                        'anime': animelist,
-                        'manga': mangalist
-                    },
-                    profile= await self._gen_profile(user, animelist, mangalist)
-                )
-            }
+            animelist, mangalist = await asyncio.gather(
+                self._gen_animelist(user, tries, pages, incremental),
+                self._gen_mangalist(user, tries, pages, incremental)
+            )
+            data = FetchData(
+                lists={
+                    'anime': animelist,
+                    'manga': mangalist
+                },
+                profile= await self._gen_profile(user, animelist, mangalist)
+            )
         except Exception as e:
             logger.exception(str(e))
-            return {}
+            return None
+        if self.incremental:
+            full = not incremental or not (animelist.partial or mangalist.partial)
+            self.since_full[user._id] = 0 if full else self.since_full.get(user._id, 0) + 1
+        self.stats.observe(time.monotonic() - start, pages[0])
+        logger.info(f"mal user {user.service_id}: {pages[0]} pages in {time.monotonic() - start:.1f}s{' (updates only)' if incremental else ''}")
+        return data
+
+    def _fetch_incrementally(self, user: User) -> bool:
+        if not self.incremental or user._id not in self.since_full or self.since_full[user._id] >= self.full_every - 1:
+            return False
+        # never synced, only has the placeholder from linking
+        return user.synced and all(user.lists.get(lst) and 'None' not in user.lists[lst] for lst in ('anime', 'manga'))
 
     async def _gen_profile(self, user: User, animelist, mangalist) -> QueryResult:
         diff = datetime.datetime.now() - user.profile.last_profile_update
@@ -135,37 +195,88 @@ class MyAnimeListQuery(Query):
             data.data.last_profile_update = datetime.datetime.now()
             return data
 
-    async def _gen_animelist(self, user: User) -> QueryResult:
-        data = await self._fetch_list(user.service_id, 'anime')
+    async def _gen_animelist(self, user: User, tries: int = 3, pages: List[int] = None, incremental: bool = False) -> QueryResult:
+        if incremental:
+            return await self._fetch_updated(user, 'anime', self._animelist, tries, pages)
+        data = await self._fetch_list(user.service_id, 'anime', tries, pages)
         return self._animelist(data)
 
-    async def _gen_mangalist(self, user: User) -> QueryResult:
-        data = await self._fetch_list(user.service_id, 'manga')
+    async def _gen_mangalist(self, user: User, tries: int = 3, pages: List[int] = None, incremental: bool = False) -> QueryResult:
+        if incremental:
+            return await self._fetch_updated(user, 'manga', self._mangalist, tries, pages)
+        data = await self._fetch_list(user.service_id, 'manga', tries, pages)
         return self._mangalist(data)
 
-    async def _fetch_list(self, id, kind: str):
+    async def _fetch_updated(self, user: User, kind: str, convert, tries: int = 3, pages: List[int] = None) -> QueryResult:
+        """Entries of a list that changed since it was stored, read most
+        recently updated first until match_run entries in a row haven't
+        changed. Everything past that was updated even earlier"""
+        stored = user.lists.get(kind) or {}
+        seen, changed = [], []
+        run = 0
+        limit = 50
+        for page in range(limit):
+            partial_lst = await self._fetch_partial_list(user.service_id, kind, page*PAGE_SIZE, tries, UPDATED_ORDER)
+            if pages is not None:
+                pages[0] += 1
+            result = convert(partial_lst)
+            if result.status != ResultStatus.OK:
+                return result
+            for entry in result.data:
+                seen.append(entry)
+                if stored.get(str(entry['id'])) == entry.dict:
+                    run += 1
+                    if run >= self.match_run:
+                        return QueryResult(status=ResultStatus.OK, data=changed, partial=True)
+                else:
+                    run = 0
+                    changed.append(entry)
+            if len(partial_lst) < PAGE_SIZE:
+                break
+        # went through the whole list, so it doubles as a full fetch
+        return QueryResult(status=ResultStatus.OK, data=seen)
+
+    async def _fetch_list(self, id, kind: str, tries: int = 3, pages: List[int] = None):
         """get well-formated list from myanimelist"""
-        lst = []
         # mal sends up to 300 entries in a response
         # build complete list by combinig entries from multiple responses
-        page = 0
-        partial_lst = await self._fetch_partial_list(id, kind, page)
         limit = 50  # safety for preventing infinite loop, theoretically this could go up to a list with 15000 entries
-        while page < limit:
-            page += 1
-            if not partial_lst: # good request but empty list, we have all the list data
-                break
-            lst.extend(partial_lst)
-            # await asyncio.sleep(0.5) # idk rate limits for this endpoint
-            partial_lst = await self._fetch_partial_list(id, kind, page*300)
+        lst = await self._fetch_partial_list(id, kind, 0, tries)
+        fetched = 1
+        done = len(lst) < PAGE_SIZE
+        # most lists fit in the first page, only past that are pages fetched
+        # ahead, page_concurrency at a time until one comes back short
+        while not done and fetched < limit:
+            offsets = range(fetched, min(limit, fetched + self.page_concurrency))
+            partials = await asyncio.gather(*(self._fetch_partial_list(id, kind, page*PAGE_SIZE, tries) for page in offsets))
+            fetched += len(partials)
+            for partial_lst in partials:
+                lst.extend(partial_lst)
+                if len(partial_lst) < PAGE_SIZE: # the rest are past the end of the list
+                    done = True
+                    break
+        if pages is not None:
+            pages[0] += fetched
         return lst
 
-    async def _fetch_partial_list(self, id, kind, page):
+    async def _fetch_partial_list(self, id, kind, page, tries: int = 3, order: int = None):
         """get list from myanimelist via jikan api"""
-        async with Resources.syncer_session.get(f"https://myanimelist.net/{kind}list/{id}/load.json?offset={page}", raise_for_status=True) as resp:
-            if resp.status != 200:
-                raise Exception('Bad response from myanimelist call')
-            return await resp.json()
+        url = f"https://myanimelist.net/{kind}list/{id}/load.json?offset={page}"
+        if order is not None:
+            url += f"&order={order}"
+        while True:
+            tries -= 1
+            async with Resources.mal_rate_limiter.slot():
+                async with Resources.syncer_session.get(url, raise_for_status=False) as resp:
+                    if resp.status in (500, 503) and tries > 0: # too many requests or mal's struggling
+                        cooldown = Resources.mal_rate_limiter.backoff()
+                        logger.info(f"mal answered {resp.status}, backing off {cooldown:.0f}s")
+                        continue
+                    resp.raise_for_status()
+                    if resp.status != 200:
+                        raise Exception('Bad response from myanimelist call')
+                    Resources.mal_rate_limiter.ok()
+                    return await resp.json()
 
     async def _fetch_profile(self, id):
         """get profile from myanimelist via jikan api"""
@@ -181,8 +292,7 @@ class MyAnimeListQuery(Query):
         lst = []
         try:
             for entry in data:
-                media = AnimeEntry()
-                media.images = types.MethodType(img_a, media)
+                media = MalAnimeEntry()
                 media['id'] = entry.get('anime_id')
                 media['link'] = f"https://myanimelist.net/anime/{entry.get('anime_id')}" if entry.get('anime_id') else ''
                 media['cover'] = entry.get('anime_image_path')
@@ -216,8 +326,7 @@ class MyAnimeListQuery(Query):
         lst = []
         try:
             for entry in data:
-                media = MangaEntry()
-                media.images = types.MethodType(img_m, media)
+                media = MalMangaEntry()
                 media['id'] = entry.get('manga_id')
                 media['link'] = f"https://myanimelist.net/manga/{entry.get('manga_id')}" if entry.get('manga_id') else ''
                 media['cover'] = entry.get('manga_image_path')
@@ -0,0 +1,106 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from typing import Any, Callable, Dict, List, Optional
+    from bson import ObjectId
+    from .models.user import User
+
+import heapq, logging, time
+
+from .models.user import UserStatus
+from modules.core.resources import Resources
+
+logger = logging.getLogger(__name__)
+
+class UserSchedule:
+    """When each of a service's users is next due for a sync.
+
+    How long until a user is polled again scales with how long ago their
+    lists last changed: recency times that, between min_interval and
+    max_interval. Someone who changed something a few minutes ago is polled
+    again a minute later, while someone idle for days costs a request
+    every max_interval, and the polls saved on idle users go to the active
+    ones. The schedule lives in each user document as sync.next (unix time),
+    sync.interval and sync.changed (when a sync last found changes) and is
+    loaded into a heap ordered by next at the start of every round. Users
+    without one are due right away, and count as idle until they change.
+
+    With fill, a batch with anyone due in it is topped up with whoever is
+    due next, for services where extra users in a batch cost nothing.
+    """
+
+    def __init__(self, service: str, min_interval: float = 60, max_interval: float = 60*60, recency: float = 0.02,
+                 owns: Optional[Callable[[ObjectId], bool]] = None, fill: bool = False) -> None:
+        self.service = service
+        self.owns = owns # only schedule users this returns True for (a sync worker's shards)
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.recency = recency
+        self.fill = fill
+        self._heap: List[tuple] = [] # (next, _id)
+        self._changed: Dict[ObjectId, Optional[float]] = {}
+
+    async def load(self) -> None:
+        heap, changed = [], {}
+        try:
+            async for doc in Resources.user_col.find(
+                {'status': { '$not': { '$eq': UserStatus.INACTIVE } }, 'service': self.service},
+                {'sync': 1}
+            ):
+                if self.owns and not self.owns(doc['_id']):
+                    continue
+                sync = doc.get('sync') or {}
+                heap.append((sync.get('next') or 0, doc['_id']))
+                changed[doc['_id']] = sync.get('changed')
+        except Exception:
+            logger.exception(f"Loading the {self.service} sync schedule failed")
+            return
+        heapq.heapify(heap)
+        self._heap, self._changed = heap, changed
+
+    def wait_time(self) -> float:
+        """Seconds until the next user is due"""
+        if not self._heap:
+            return self.min_interval
+        return max(0.0, self._heap[0][0] - time.time())
+
+    def due_ids(self, limit: int) -> List[ObjectId]:
+        """Up to limit users that are due, soonest first. With fill, a batch
+        that has anyone due is topped up with whoever is due next"""
+        now = time.time()
+        ids = []
+        while self._heap and (len(ids) < limit or not limit):
+            next_sync, _id = self._heap[0]
+            if next_sync > now and not (self.fill and ids and limit):
+                break
+            heapq.heappop(self._heap)
+            if self.owns and not self.owns(_id): # shard moved to another worker
+                continue
+            ids.append(_id)
+        return ids
+
+    async def due(self, limit: int) -> List[Dict[str, Any]]:
+        """User documents of up to limit users that are due, soonest first"""
+        ids = self.due_ids(limit)
+        if not ids:
+            return []
+        docs = await Resources.user_col.find(
+            {'_id': {'$in': ids}, 'status': { '$not': { '$eq': UserStatus.INACTIVE } }, 'service': self.service}
+        ).to_list(length=None)
+        order = {_id: i for i, _id in enumerate(ids)}
+        return sorted(docs, key=lambda doc: order[doc['_id']])
+
+    def observe(self, user: User, changed: bool) -> Dict[str, Any]:
+        """Schedule the user's next sync after one that did or didn't find
+        changes, returns the fields to $set on their document"""
+        now = time.time()
+        if changed:
+            self._changed[user._id] = now
+        last_change = self._changed.get(user._id)
+        if last_change is None:
+            interval = self.max_interval
+        else:
+            interval = min(self.max_interval, max(self.min_interval, (now - last_change) * self.recency))
+        next_sync = now + interval
+        heapq.heappush(self._heap, (next_sync, user._id))
+        return {'sync': {'next': next_sync, 'interval': interval, 'changed': last_change}}
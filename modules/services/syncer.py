@@ -1,53 +1,94 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
-    from typing import Dict, Type, List
+    from typing import Dict, Type, List, Optional, Tuple
     from .models.query import Query
     from .models.data import FetchData
     from discord.ext.commands import bot
     from modules.services.models.entry import ListEntry
     from io import BytesIO
     
-import asyncio, discord, datetime, logging, time
+import asyncio, bson, discord, datetime, logging, time
+from dataclasses import dataclass, field
 from io import BytesIO
+from pymongo import UpdateOne
 
 from . import Service
 from .models.user import User, UserStatus
 from .models.data import ResultStatus, Image
-from modules.core.resources import Resources
+from .models.snapshot import diff_list
+from .models.entry import FINGERPRINT
+from modules.core.resources import Resources, BulkWriter
+from .schedule import UserSchedule
+from .lease import ShardLease
+from .display_queue import DisplayQueue
+from .comprehension import Comprehender, ComprehensionStats
 
 logger = logging.getLogger(__name__)
 
+_NOT_STORED = {} # what an entry missing from the stored list looks up its fingerprint in
+
+_STAGE_DONE = None # sentinel passed down the pipeline once a round has no more batches
+_SIZE_SAMPLE = 50 # bytes_avoided encodes the whole document of one in this many persisted users
+
+@dataclass
+class PipelineStats:
+    """Numbers for the last completed pipelined sync round"""
+    round_time: float = 0
+    batches: int = 0
+    users: int = 0
+    max_queue_depth: Dict[str, int] = field(default_factory=dict)
+
+    def observe_depth(self, stage: str, queue: asyncio.Queue) -> None:
+        self.max_queue_depth[stage] = max(self.max_queue_depth.get(stage, 0), queue.qsize())
+
 class Syncer:
 
-    def __init__(self, bot: bot, service: str, query: Type[Query], sleep_time: float = 30) -> None:
-        print(f"{service} service registered!")
+    def __init__(self, bot: bot, service: str, query: Type[Query], sleep_time: float = 30, pipelined: bool = False, queue_size: int = 2, schedule: Optional[UserSchedule] = None,
+                 lease: Optional[ShardLease] = None, display_queue: Optional[DisplayQueue] = None, comprehender: Optional[Comprehender] = None) -> None:
+        print(f"{service} service registered!{' (pipelined)' if pipelined else ''}{' (scheduled)' if schedule else ''}{' (worker)' if lease else ''}")
         self.bot = bot
         self.service = service
         self.query = query
         self.sleep_time = sleep_time
+        self.pipelined = pipelined
+        self.queue_size = queue_size # max batches waiting between pipeline stages
+        self.round_stats = PipelineStats()
+        self.writer = BulkWriter(Resources.user_col, max_delay=sleep_time)
+        self.bytes_avoided = 0 # for the current round, vs. $set-ing the whole user document (estimated from a sample)
+        self._persisted = 0
+        self.schedule = schedule # poll users when they're due instead of all of them every round
+        self.lease = lease # only sync users in the shards this worker holds
+        self.display_queue = display_queue # no gateway here, queue updates for the bot to post
+        self.comprehender = comprehender or Comprehender() # where diffing lists runs, may be shared between syncers
+        self.comprehension_stats = ComprehensionStats() # for the current round
+        self._unwritten_batches: List[int] = [] # lease.batch_started() of batches persisted since the last flush
+        self._queued_writes: Dict[bson.ObjectId, Tuple[Dict, List]] = {} # user -> (update, diffs) waiting in the writer
 
     async def loop(self) -> None:
         await self.bot.wait_until_ready()
+        if self.pipelined:
+            return await self._pipeline_loop()
         try:
             while not self.bot.is_closed():
                 Resources.removal_buffers[self.service] = set()
                 Resources.status_buffers[self.service] = {}
-                cursor = Resources.user_col.find({'status': { '$not': { '$eq': UserStatus.INACTIVE } }, 'service': self.service})
+                cursor = await self._round_cursor()
+                started = self._batch_started()
 
                 resume_users = Resources.sync_resume_buffers.get(self.service, [])
                 if resume_users:
-                    users = resume_users
+                    users = self._still_owned(resume_users)
                     Resources.sync_resume_buffers[self.service] = []
                 else:
                     try:
-                        raw_users = await cursor.to_list(length=self.query.MAX_USERS_PER_QUERY)
+                        raw_users = await self._batch_docs(cursor)
                     except asyncio.CancelledError:
                         raise
                     except:
                         raw_users = []
                         logger.exception(f"initial batch fail for {self.service}")
-                    users = [User(**user) for user in raw_users]
+                    users = await self._users(raw_users)
 
                 while users:
                     names = [u.profile.name for u in users]
@@ -69,35 +110,21 @@ class Syncer:
                             continue # skip
                         
                         # generate changes and get all entries from each list that have (pruned) changes
-                        comprehensions = await self.bot.loop.run_in_executor(
-                            None, 
-                            self._comprehend,
-                            user,
-                            user_data
-                        )
+                        try:
+                            comprehensions = await self.comprehender.comprehend(user, user_data, self.comprehension_stats)
+                        except Exception:
+                            logger.exception(f"comprehension failed for {self.service} user {user.discord_id}")
+                            continue
 
                         # send changes
                         if user.status == UserStatus.ACTIVE:
                             await self._display(user, comprehensions)
 
                         # # update db
-                        # make sure user didn't remove themself between when db grabbed user and now
-                        if user.discord_id not in Resources.removal_buffers[self.service]:
-                            if user_data.profile.status == ResultStatus.OK:
-                                user.profile = user_data.profile.data
-                            # user hid themself between when db grabbed user and now. make sure user matches that change
-                            if user.discord_id in Resources.status_buffers[self.service]:
-                                user.status = Resources.status_buffers[self.service][user.discord_id]
-                            for lst in user_data.lists:
-                                if user_data.lists[lst].status == ResultStatus.OK:
-                                    k = {}
-                                    for entry in user_data.lists[lst].data:
-                                        k[str(entry['id'])] = entry.dict
-                                    user.lists[lst] = k
-                            await Resources.user_col.update_one(
-                                {'discord_id': user.discord_id, 'service': user.service},
-                                {'$set': user.dict}
-                            )
+                        self._persist(user, user_data)
+
+                    self._batch_persisted(started)
+                    await self._flush_if_due()
                 
                     users_end = time.time()
                     sleep_corrected = max(0, self.sleep_time - (users_end-fetch_start))
@@ -105,32 +132,388 @@ class Syncer:
 
                     if deferred_users:
                         Resources.sync_resume_buffers[self.service] = deferred_users
-                        users = []
+                        started, users = None, []
                         continue
 
                     # ready new batch from db
-                    try:
-                        raw_users = await cursor.to_list(length=self.query.MAX_USERS_PER_QUERY)
-                    except asyncio.CancelledError:
-                        raise
-                    except:
-                        logger.exception(f'new batch fail for {self.service}')
-                        raw_users = []
-                    users = [User(**user) for user in raw_users]
+                    started = self._batch_started()
+                    users = await self._next_batch(cursor)
             
                 # done with all the batches, start new round of batches
-                await cursor.close()
+                self._batch_persisted(started) # the empty one
+                await self._flush()
+                self._log_round_writes()
+                await self._end_round(cursor)
         except (asyncio.CancelledError, RuntimeError):
             pass
 
+    ### pipelined mode ###
+    # fetch -> comprehend -> display/persist, each stage its own task joined by
+    # bounded queues so the next batch is fetched while the last one is still
+    # being diffed and posted. only the fetch stage talks to the service, so the
+    # time_between_queries spacing (and VndbRateLimiter) hold like in serial mode
+
+    async def _pipeline_loop(self) -> None:
+        try:
+            while not self.bot.is_closed():
+                try:
+                    await self._pipeline_round()
+                except (asyncio.CancelledError, RuntimeError):
+                    raise
+                except Exception:
+                    # a failing stage ends the round, not the syncer. whatever was
+                    # still queued in the writer goes out with the next round
+                    logger.exception(f"{self.service} pipelined sync round failed")
+                    await asyncio.sleep(self.sleep_time)
+                if self.schedule:
+                    await self._end_round(None)
+        except (asyncio.CancelledError, RuntimeError):
+            pass
+
+    async def _pipeline_round(self) -> None:
+        Resources.removal_buffers[self.service] = set()
+        Resources.status_buffers[self.service] = {}
+        stats = PipelineStats()
+        round_start = time.time()
+
+        fetched = asyncio.Queue(maxsize=self.queue_size)
+        comprehended = asyncio.Queue(maxsize=self.queue_size)
+        stages = [
+            asyncio.create_task(self._fetch_stage(fetched, stats)),
+            asyncio.create_task(self._comprehend_stage(fetched, comprehended, stats)),
+            asyncio.create_task(self._display_stage(comprehended)),
+        ]
+        try:
+            await asyncio.gather(*stages)
+        finally:
+            for stage in stages:
+                stage.cancel()
+            # let the others unwind before the next round starts its own
+            await asyncio.gather(*stages, return_exceptions=True)
+            if self.lease and any(stage.cancelled() or stage.exception() for stage in stages):
+                # batches still in the queues are dropped, don't hold their shards for them
+                self.lease.batches_abandoned()
+                self._unwritten_batches = []
+
+        stats.round_time = time.time() - round_start
+        self.round_stats = stats
+        self._log_round_writes()
+        logger.info(
+            f"{self.service} sync round: {stats.users} users in {stats.batches} batches "
+            f"took {stats.round_time:.1f}s (max queue depth {stats.max_queue_depth})"
+        )
+
+    async def _fetch_stage(self, out: asyncio.Queue, stats: PipelineStats) -> None:
+        cursor = await self._round_cursor()
+        try:
+            started = self._batch_started()
+            users = self._still_owned(Resources.sync_resume_buffers.get(self.service, []))
+            Resources.sync_resume_buffers[self.service] = []
+            if not users:
+                users = await self._next_batch(cursor)
+
+            last_fetch = None
+            while users:
+                # keep fetches spaced out the same as serial mode does
+                if last_fetch is not None:
+                    await asyncio.sleep(max(0, self.sleep_time - (time.time() - last_fetch)))
+                last_fetch = time.time()
+
+                fetched_data = await self.query.fetch(users) # query new data for users
+                deferred_users = getattr(self.query, 'deferred_users', [])
+                deferred_ids = {u._id for u in deferred_users} if deferred_users else set()
+
+                stats.batches += 1
+                stats.users += len(users) - len(deferred_ids)
+                await out.put((users, fetched_data, deferred_ids, started))
+                stats.observe_depth('fetched', out)
+
+                if deferred_users:
+                    # out of budget, finish these first next round
+                    Resources.sync_resume_buffers[self.service] = deferred_users
+                    await asyncio.sleep(self.sleep_time)
+                    started = None
+                    break
+
+                started = self._batch_started()
+                users = await self._next_batch(cursor)
+            self._batch_persisted(started) # the empty one
+            # only once the round ran out of batches. a cancelled or failed
+            # stage doesn't need to tell the next one (the round cancels them
+            # all) and waiting on a full queue then would never return
+            await out.put(_STAGE_DONE)
+        finally:
+            await self._close_cursor(cursor)
+
+    async def _comprehend_stage(self, inp: asyncio.Queue, out: asyncio.Queue, stats: PipelineStats) -> None:
+        while (batch := await inp.get()) is not _STAGE_DONE:
+            users, fetched_data, deferred_ids, started = batch
+            processed = []
+            for user in users:
+                if user._id in deferred_ids:
+                    continue
+                user_data = fetched_data.get(user._id)
+                if not user_data: # query didn't populate this user
+                    logger.info(f"no user data for {user.profile.name}")
+                    continue
+                try:
+                    comprehensions = await self.comprehender.comprehend(user, user_data, self.comprehension_stats)
+                except Exception:
+                    logger.exception(f"comprehension failed for {self.service} user {user.discord_id}")
+                    continue
+                processed.append((user, user_data, comprehensions))
+            await out.put((processed, started))
+            stats.observe_depth('comprehended', out)
+        await out.put(_STAGE_DONE)
+
+    async def _display_stage(self, inp: asyncio.Queue) -> None:
+        while (batch := await inp.get()) is not _STAGE_DONE:
+            processed, started = batch
+            for user, user_data, comprehensions in processed:
+                if user.status == UserStatus.ACTIVE:
+                    await self._display(user, comprehensions)
+                self._persist(user, user_data)
+            self._batch_persisted(started)
+            await self._flush_if_due()
+        await self._flush()
+
+    async def _flush_if_due(self) -> None:
+        if self.writer.due:
+            await self._flush()
+
+    async def _flush(self) -> None:
+        await self.writer.flush()
+        written = {str(key) for key in self.writer.flushed - self.writer.failed}
+        failed = {str(key) for key in self.writer.failed}
+        if self.lease:
+            # shards handed back meanwhile can go once their users are written
+            for started in self._unwritten_batches:
+                self.lease.batch_written(started)
+        self._unwritten_batches = []
+        # entry/index and compatibility changes were queued as the writes were built
+        # only changes whose user write landed count, the rest were never stored
+        await Resources.lists.apply(written=written, failed=failed)
+        await Resources.compatibility.apply(written=written, failed=failed)
+
+    ### where batches come from ###
+    # every active user once a round, or with a schedule, a round is whoever
+    # is due until nobody is. a sync worker marks each batch started before
+    # picking its users and persisted once they're queued, see ShardLease
+
+    def _batch_started(self) -> Optional[int]:
+        return self.lease.batch_started() if self.lease else None
+
+    def _batch_persisted(self, started: Optional[int]) -> None:
+        if started is not None:
+            self._unwritten_batches.append(started)
+
+    def _still_owned(self, users: List[User]) -> List[User]:
+        """Resumed users whose shards are still ours"""
+        if not self.lease:
+            return users
+        return [user for user in users if self.lease.owns(user._id)]
+
+    async def _round_cursor(self):
+        if self.schedule:
+            await self.schedule.load()
+            return None
+        query = {'status': { '$not': { '$eq': UserStatus.INACTIVE } }, 'service': self.service}
+        if self.lease:
+            # just the ids of users in our shards, documents are read a batch at a time
+            return [doc['_id'] async for doc in Resources.user_col.find(query, {'_id': 1}) if self.lease.owns(doc['_id'])]
+        return Resources.user_col.find(query)
+
+    async def _batch_docs(self, cursor) -> List[Dict]:
+        if self.schedule:
+            return await self.schedule.due(self.query.MAX_USERS_PER_QUERY)
+        if self.lease:
+            while cursor:
+                ids = [i for i in cursor[:self.query.MAX_USERS_PER_QUERY] if self.lease.owns(i)] # shards can move mid round
+                del cursor[:self.query.MAX_USERS_PER_QUERY]
+                if ids:
+                    return await Resources.user_col.find({'_id': {'$in': ids}, 'status': { '$not': { '$eq': UserStatus.INACTIVE } }}).to_list(length=None)
+            return []
+        return await cursor.to_list(length=self.query.MAX_USERS_PER_QUERY)
+
+    @staticmethod
+    async def _close_cursor(cursor) -> None:
+        if cursor is not None and not isinstance(cursor, list):
+            await cursor.close()
+
+    async def _end_round(self, cursor) -> None:
+        await self._close_cursor(cursor)
+        if self.schedule:
+            # nobody's due, wait for whoever is next. capped so users that linked meanwhile get picked up
+            await asyncio.sleep(min(max(self.schedule.wait_time(), self.sleep_time), self.schedule.min_interval))
+
+    async def _next_batch(self, cursor) -> List[User]:
+        try:
+            raw_users = await self._batch_docs(cursor)
+        except asyncio.CancelledError:
+            raise
+        except:
+            logger.exception(f'new batch fail for {self.service}')
+            raw_users = []
+        return await self._users(raw_users)
+
+    async def _users(self, raw_users: List[Dict]) -> List[User]:
+        if Resources.lists.reads_entries: # documents come without their lists
+            try:
+                await Resources.lists.fill(raw_users, Service(self.service).list_names)
+            except Exception:
+                logger.exception(f"loading lists failed for {self.service}")
+                return []
+        return [User(**user) for user in raw_users]
+
+    def _persist(self, user: User, user_data: FetchData) -> None:
+        # only send what changed: entries added/changed get $set on their own
+        # lists.<list>.<id> path, removed ones get $unset, profile only if different.
+        # a user synced again before their last write went out (a failed round
+        # leaves writes waiting) has this one merged into it, see _merge_update
+        update = {'$set': {}, '$unset': {}}
+        score_diffs = {} # list -> {id: (old score, new score)} for the compatibility store
+        entry_diffs = {} # list -> ({id: (old entry, new entry)} added/changed, [removed ids]) for Resources.lists
+        in_document = Resources.lists.writes_documents
+        old_format = getattr(user.profile, 'score_format', None)
+        if user_data.profile.status == ResultStatus.OK:
+            profile = user_data.profile.data.dict
+            if profile != user.profile.dict:
+                update['$set']['profile'] = profile
+            user.profile = user_data.profile.data
+        for lst in user_data.lists:
+            if user_data.lists[lst].status == ResultStatus.OK:
+                old = user.lists.get(lst) or {}
+                k = self._stored_list(old, user_data.lists[lst].data)
+                diffs = score_diffs[lst] = {}
+                changed, removed = entry_diffs[lst] = ({}, [])
+                if not old:
+                    if k:
+                        if in_document:
+                            update['$set'][f"lists.{lst}"] = k
+                        for i in k:
+                            diffs[i] = (None, k[i].get('score'))
+                            changed[i] = (None, k[i])
+                else:
+                    for i in k:
+                        if old.get(i) is not k[i] and old.get(i) != k[i]:
+                            if in_document:
+                                update['$set'][f"lists.{lst}.{i}"] = k[i]
+                            old_score = old[i].get('score') if i in old else None
+                            if i not in old or old_score != k[i].get('score'):
+                                diffs[i] = (old_score, k[i].get('score'))
+                            changed[i] = (old.get(i), k[i])
+                    if user_data.lists[lst].partial: # only changed entries were fetched, keep the rest
+                        k = {**old, **k}
+                    for i in old:
+                        if i not in k:
+                            if in_document:
+                                update['$unset'][f"lists.{lst}.{i}"] = ''
+                            diffs[i] = (old[i].get('score'), None)
+                            removed.append(i)
+                user.lists[lst] = k
+        if not user.synced:
+            update['$set']['synced'] = True
+            user.synced = True
+        if Resources.lists.tracks_revisions and any(c or r for c, r in entry_diffs.values()):
+            update['$inc'] = {Resources.lists.REVISION: 1} # lets migrate() tell its copy went stale
+        if self.schedule:
+            changed = any(c or r for c, r in entry_diffs.values())
+            update['$set'].update(self.schedule.observe(user, changed))
+
+        self._persisted += 1
+        if self._persisted % _SIZE_SAMPLE == 0:
+            try:
+                self.bytes_avoided += (len(bson.encode({'$set': user.dict})) - len(bson.encode(update))) * _SIZE_SAMPLE
+            except Exception:
+                pass
+
+        diffs = (score_diffs, entry_diffs, old_format)
+        queued = self._queued_writes.get(user._id)
+        if queued:
+            self._merge_update(user, queued[0], update)
+            queued[1].append(diffs)
+            return
+        self._queued_writes[user._id] = (update, [diffs])
+        self.writer.add(user._id, lambda: self._user_update(user, update, self._queued_writes.pop(user._id, (None, []))[1]))
+
+    @staticmethod
+    def _merge_update(user: User, queued: Dict[str, Dict], update: Dict[str, Dict]) -> None:
+        """Fold update into the queued one for the same user, so the changes
+        both hold get written"""
+        for path, value in update['$set'].items():
+            queued['$unset'].pop(path, None)
+            queued['$set'][path] = value
+        for path in update['$unset']:
+            queued['$set'].pop(path, None)
+            queued['$unset'][path] = ''
+        for path, n in update.get('$inc', {}).items():
+            inc = queued.setdefault('$inc', {})
+            inc[path] = inc.get(path, 0) + n
+        # one whole list and paths inside it can't go in the same update, the
+        # whole list as it is now covers both
+        for lst in user.lists:
+            whole = f"lists.{lst}"
+            inside = [p for op in ('$set', '$unset') for p in queued[op] if p.startswith(whole + '.')]
+            if inside and whole in queued['$set']:
+                for p in inside:
+                    queued['$set'].pop(p, None)
+                    queued['$unset'].pop(p, None)
+                queued['$set'][whole] = user.lists[lst]
+
+    @staticmethod
+    def _stored_list(old: Dict[str, Dict], entries: List[ListEntry]) -> Dict[str, Dict]:
+        """Database representation of a fetched list. Entries with the same
+        fingerprint as their stored copy keep that copy instead of being built again"""
+        k = {}
+        for entry in entries:
+            i = str(entry['id'])
+            stored = old.get(i, _NOT_STORED)
+            k[i] = stored if stored.get(FINGERPRINT) == entry.fingerprint else entry.dict
+        return k
+
+    def _user_update(self, user: User, update: Dict[str, Dict], diffs: List[Tuple[Dict, Dict, Optional[str]]] = []) -> Optional[UpdateOne]:
+        """Build the db write for user. Called when the writer flushes so 
+        removals/hides that happen while the write waits are respected. diffs
+        is (score diffs, entry diffs, old score format) of each sync the
+        update holds, oldest first"""
+        # make sure user didn't remove themself between when db grabbed user and now
+        if user.discord_id in Resources.removal_buffers[self.service]:
+            return None
+        # user hid themself between when db grabbed user and now. make sure user matches that change
+        if user.discord_id in Resources.status_buffers[self.service]:
+            user.status = Resources.status_buffers[self.service][user.discord_id]
+            update['$set']['status'] = user.status
+        for score_diffs, entry_diffs, old_format in diffs:
+            for lst, (changed, removed) in entry_diffs.items():
+                Resources.lists.queue(user, lst, changed, removed)
+            for lst, scores in score_diffs.items():
+                Resources.compatibility.queue(user, lst, scores, old_format)
+        update = {op: fields for op, fields in update.items() if fields}
+        if not update: # nothing changed
+            return None
+        return UpdateOne(
+            {'discord_id': user.discord_id, 'service': user.service},
+            update
+        )
+
+    def _log_round_writes(self) -> None:
+        logger.info(f"{self.service} sync round avoided writing about {self.bytes_avoided/1024:.1f}KiB by sending only changes")
+        self.bytes_avoided = 0
+        logger.info(f"{self.service} sync round {self.comprehension_stats.take(self.comprehender.mode)}")
+
     @staticmethod
     def _comprehend(user: User, data: FetchData) -> Dict[str, List[ListEntry]]:
         comprehensions = {}
         for lst in data.lists:
             if data.lists[lst].status == ResultStatus.OK:
                 comprehensions[lst] = []
-                for entry in data.lists[lst].data:
-                    entry.consume(user.lists.get(lst, {}).get(str(entry['id']), {}))
+                stored = user.lists.get(lst, {})
+                # most entries haven't changed, only run the consumers for the ones that might have:
+                # those without a matching stored fingerprint and, of those, ones with dynamic fields that differ
+                entries = [e for e in data.lists[lst].data if stored.get(str(e['id']), _NOT_STORED).get(FINGERPRINT) != e.fingerprint]
+                for i in diff_list(stored, entries).changed:
+                    entry = entries[i]
+                    entry.consume(stored.get(str(entry['id']), {}))
                     if data.profile.status == ResultStatus.OK:
                         entry.rationalize_changes(user, data.profile.data)
                     else:
@@ -147,12 +530,19 @@ class Syncer:
         # myanimelist doesn't populate list data* when finding user to save on 
         # time and APi rate limits, so ignore displaying the first sync since 
         # it'll see everything as a change and have a massive output.
-        # *it actually populates a single empty anime entry to signify having 
-        # never been synced before
+        # *linking stores synced=False (and a single empty anime entry, which
+        # lists read from the entries collection don't have) until then
         if user.service == Service.MYANIMELIST:
-            if 'None' in user.lists['anime']:
+            if not user.synced or 'None' in user.lists.get('anime', {}):
                 return
 
+        if self.display_queue: # the bot process posts it
+            try:
+                await self.display_queue.push(user, comprehensions)
+            except Exception:
+                logger.exception(f"Queueing {self.service} updates for {user.discord_id} failed")
+            return
+
         # user removed themself between when db grabbed user and now. ignore this phantom
         if user.discord_id in Resources.removal_buffers[self.service]:
             return
@@ -174,18 +564,13 @@ class Syncer:
         
         combined_images = {} # rudimentary caching for generated images
         try:
-            disaply_guild_ids = []
-            for guild in self.bot.guilds:
-                # check if this guild contains that user
-                try: member = await guild.fetch_member(int(user.discord_id))
-                except: member = None
-                if member: 
-                    disaply_guild_ids.append(str(guild.id))
+            # guilds that contain that user
+            disaply_guild_ids = list(await Resources.member_index.resolve(self.bot, user.discord_id))
             if not disaply_guild_ids:
                 return
             
             # display for each of those guilds based on its settings
-            async for guild in Resources.guild_col.find({'guild_id': {'$in': disaply_guild_ids}}):
+            for guild in Resources.guild_settings.get_many(disaply_guild_ids):
                 # go through all the channels it displays updates for
                 for ch in guild['settings']['updates']:
                     channel = self.bot.get_channel(int(ch))
@@ -219,15 +604,26 @@ class Syncer:
             for s in combined_images:
                 combined_images[s].close()
 
+    async def display_from(self, queue: DisplayQueue) -> None:
+        """Post updates sync workers queued, for a bot that doesn't sync itself"""
+        await self.bot.wait_until_ready()
+        try:
+            await queue.consume(self.service, self._display_queued)
+        except (asyncio.CancelledError, RuntimeError):
+            pass
+
+    async def _display_queued(self, job: Dict, comprehensions: Dict) -> None:
+        doc = await Resources.user_col.find_one({'_id': job['user']}, {'discord_id': 1, 'status': 1, 'service': 1, 'service_id': 1, 'profile': 1})
+        # unlinked or hid their updates since the worker synced them
+        if not doc or doc.get('status') != UserStatus.ACTIVE:
+            return
+        await self._display(User(**doc), comprehensions)
+
     async def _embed(self, channel, user: User, msgs: Dict[str, List[str]], imgs: List[Image], img_stash: Dict[int, BytesIO]) -> None:
         if not msgs:
             return
 
-        nick = ''
-        for member in channel.members:
-            if str(member.id) == user.discord_id:
-                nick = member.nick if member.nick else member.name
-                break
+        nick = Resources.member_index.nick(user.discord_id, channel.guild.id)
         try:
             name = f"{user.profile.name} ({nick})"
         except:
@@ -16,28 +16,30 @@ def _format_title(self: VnEntry) -> str:
     return title
 
 
+def _status_msg(self: VnEntry, old: str, new: str) -> str:
+    return f"status of {_format_title(self)} set to {new}"
+
+
+def _vote_msg(self: VnEntry, old: Optional[int], new: Optional[int]) -> str:
+    if not old:
+        return f"score for {_format_title(self)} set to {new}"
+    return f"score for {_format_title(self)} changed: {old} ➔ {new}"
+
+
 def _status_consumer(self: VnEntry, old: str, new: str) -> Optional[Change]:
     if old == new:
         return None
 
     old_label = old if old else Status.UNKNOWN
     new_label = new if new else Status.UNKNOWN
-    return Change(
-        ChangeKind.STATUS,
-        old_label,
-        new_label,
-        f"status of {_format_title(self)} set to {new_label}",
-    )
+    return Change(ChangeKind.STATUS, old_label, new_label, _status_msg, self)
 
 
 def _vote_consumer(self: VnEntry, old: Optional[int], new: Optional[int]) -> Optional[Change]:
     if old == new:
         return None
 
-    target = _format_title(self)
-    if not old:
-        return Change(ChangeKind.SCORE, old, new, f"score for {target} set to {new}")
-    return Change(ChangeKind.SCORE, old, new, f"score for {target} changed: {old} ➔ {new}")
+    return Change(ChangeKind.SCORE, old, new, _vote_msg, self)
 
 
 class VnEntry(ListEntry):
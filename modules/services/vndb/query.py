@@ -1,7 +1,9 @@
 from __future__ import annotations
 
+import asyncio
 import logging
-from typing import TYPE_CHECKING, Dict, List
+import os
+from typing import TYPE_CHECKING, Dict, List, Optional
 
 if TYPE_CHECKING:
     from ..models.user import User
@@ -15,7 +17,7 @@ from ..models.entry import ListEntry
 from ..anilist.enums import Status
 from .entry import VnEntry
 from .profile import VndbProfile
-from modules.services.vndb_ratelimit import RateLimitError, SyncBudgetError, parse_retry_after
+from modules.services.vndb_ratelimit import Priority, RateLimitError, SyncBudgetError, parse_retry_after
 
 logger = logging.getLogger(__name__)
 
@@ -33,7 +35,16 @@ LABEL_STATUS_MAP = {
 
 
 class VndbQuery(Query):
-    MAX_USERS_PER_QUERY = 5
+    MAX_USERS_PER_QUERY = int(os.getenv('VNDB_USERS_PER_QUERY', default=5))
+
+    def __init__(self, incremental: Optional[bool] = None, full_every: Optional[int] = None, budget_wait: float = 60) -> None:
+        self.budget_wait = budget_wait # seconds a request waits for a rate limit permit before the user is deferred
+        # only fetch entries modified since the newest one stored, with a full
+        # fetch every full_every fetches to catch removed entries
+        self.incremental = bool(os.getenv('VNDB_INCREMENTAL', default=False)) if incremental is None else incremental
+        self.full_every = int(os.getenv('VNDB_FULL_SYNC_EVERY', default=20)) if full_every is None else full_every
+        self.since_full: Dict[user_id, int] = {} # incremental fetches since the last full one
+        self.deferred_users: List['User'] = []
 
     async def find(self, username: str) -> UserSearch:
         if not username:
@@ -89,43 +100,55 @@ class VndbQuery(Query):
             self.deferred_users = []
             return {}
 
-        self.deferred_users: List['User'] = []
+        # every user at once, the rate limiter decides who gets through
+        outcomes = await asyncio.gather(*(self._fetch_user(user) for user in users))
 
-        results: Dict[user_id, FetchData] = {}
-        for index, user in enumerate(users):
-            entries: List[ListEntry] = []
-            try:
-                entries = await self._fetch_user_entries(user.service_id)
-            except SyncBudgetError as exc:
-                logger.info(
-                    "VNDB sync budget reached; pausing sync for %.2f seconds",
-                    exc.retry_after,
-                )
-                self.deferred_users = users[index:]
-                break
-            except RateLimitError as exc:
-                logger.warning(
-                    "VNDB API hard rate limit reached; retry after %.2f seconds",
-                    exc.retry_after,
-                )
-                self.deferred_users = users[index:]
-                break
-            except Exception as exc:
-                logger.exception('VNDB fetch failed for user %s', user.service_id)
-                results[user._id] = FetchData(
-                    lists={'vn': QueryResult(status=ResultStatus.ERROR, data=str(exc))},
-                    profile=QueryResult(status=ResultStatus.OK, data=user.profile),
-                )
-                continue
-
-            results[user._id] = FetchData(
-                lists={'vn': QueryResult(status=ResultStatus.OK, data=entries)},
+        self.deferred_users = [user for user, outcome in zip(users, outcomes) if outcome is None]
+        return {user._id: outcome for user, outcome in zip(users, outcomes) if outcome is not None}
+
+    async def _fetch_user(self, user: 'User') -> Optional[FetchData]:
+        """The user's data, None if the rate budget ran out and they should be
+        tried again later"""
+        since = self._since(user)
+        try:
+            entries = await self._fetch_user_entries(user.service_id, since)
+        except SyncBudgetError as exc:
+            logger.info(
+                "VNDB sync budget reached; pausing sync for %.2f seconds",
+                exc.retry_after,
+            )
+            return None
+        except RateLimitError as exc:
+            logger.warning(
+                "VNDB API hard rate limit reached; retry after %.2f seconds",
+                exc.retry_after,
+            )
+            return None
+        except Exception as exc:
+            logger.exception('VNDB fetch failed for user %s', user.service_id)
+            return FetchData(
+                lists={'vn': QueryResult(status=ResultStatus.ERROR, data=str(exc))},
                 profile=QueryResult(status=ResultStatus.OK, data=user.profile),
             )
 
-        return results
+        if self.incremental:
+            self.since_full[user._id] = 0 if since is None else self.since_full.get(user._id, 0) + 1
+        return FetchData(
+            lists={'vn': QueryResult(status=ResultStatus.OK, data=entries, partial=since is not None)},
+            profile=QueryResult(status=ResultStatus.OK, data=user.profile),
+        )
 
-    async def _fetch_user_entries(self, service_id: str) -> List[VnEntry]:
+    def _since(self, user: 'User') -> Optional[int]:
+        """Newest lastmod stored for the user if only entries modified since
+        then should be fetched, None for a full fetch"""
+        if not self.incremental or user._id not in self.since_full or self.since_full[user._id] >= self.full_every - 1:
+            return None
+        stored = user.lists.get('vn') or {}
+        if not stored:
+            return None
+        return max((entry.get('lastmod') or 0 for entry in stored.values()), default=0)
+
+    async def _fetch_user_entries(self, service_id: str, since: Optional[int] = None) -> List[VnEntry]:
         page = 1
         entries: List[VnEntry] = []
 
@@ -136,8 +159,11 @@ class VndbQuery(Query):
                 'page': page,
                 'results': 100,
             }
+            if since is not None:
+                payload['sort'] = 'lastmod'
+                payload['reverse'] = True
 
-            await Resources.vndb_rate_limiter.consume(for_sync=True)
+            await Resources.vndb_rate_limiter.acquire(priority=Priority.SYNC, timeout=self.budget_wait)
             try:
                 async with Resources.syncer_session.post(f'{API_BASE}/ulist', json=payload, raise_for_status=True) as resp:
                     data = await resp.json()
@@ -148,11 +174,17 @@ class VndbQuery(Query):
                     raise RateLimitError(retry_after) from exc
                 raise
 
+            reached_stored = False
             for item in data.get('results', []):
+                # newest first, the rest were modified before the last fetch. same second ones are
+                # fetched again, consuming an unchanged entry does nothing
+                if since is not None and (item.get('lastmod') or 0) < since:
+                    reached_stored = True
+                    break
                 entry = self._map_entry(item)
                 entries.append(entry)
 
-            if not data.get('more'):
+            if reached_stored or not data.get('more'):
                 break
 
             page += 1
@@ -4,9 +4,10 @@ from typing import Dict
 from aiohttp import ClientResponseError
 
 from modules.core.resources import Resources
-from modules.services.vndb_ratelimit import RateLimitError, parse_retry_after
+from modules.services.vndb_ratelimit import Priority, RateLimitError, parse_retry_after
 
 API_BASE = 'https://api.vndb.org/kana'
+INTERACTIVE_WAIT = 2 # seconds a command waits for a rate limit permit, discord wants an answer within 3
 
 VN_FIELDS = ', '.join([
 	'id',
@@ -40,7 +41,7 @@ class VndbSearch:
 			'sort': 'searchrank',
 			'results': limit,
 		}
-		await Resources.vndb_rate_limiter.consume(for_sync=False)
+		await Resources.vndb_rate_limiter.acquire(priority=Priority.INTERACTIVE, timeout=INTERACTIVE_WAIT)
 		try:
 			async with Resources.session.post(f'{API_BASE}/vn', json=payload, raise_for_status=True) as resp:
 				data = await resp.json()
@@ -62,7 +63,7 @@ class VndbSearch:
 			"filters": ["random", "=", 1],
 		}
 
-		await Resources.vndb_rate_limiter.consume(for_sync=False)
+		await Resources.vndb_rate_limiter.acquire(priority=Priority.INTERACTIVE, timeout=INTERACTIVE_WAIT)
 		try:
 			async with Resources.session.post(f'{API_BASE}/quote', json=payload, raise_for_status=True) as resp:
 				data = await resp.json()
@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 import asyncio
+import collections
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Deque, Dict
 
 
 class RateLimitError(RuntimeError):
@@ -21,66 +24,131 @@ class SyncBudgetError(RuntimeError):
         self.retry_after = retry_after
 
 
+class Priority(IntEnum):
+    INTERACTIVE = 0 # commands, someone is waiting on the answer
+    SYNC = 1
+
+
 @dataclass
 class ConsumeResult:
     remaining: int
     retry_after: float
 
 
+@dataclass
+class VndbLimiterStats:
+    granted: Dict[Priority, int] = field(default_factory=lambda: {p: 0 for p in Priority})
+    waited: Dict[Priority, float] = field(default_factory=lambda: {p: 0.0 for p in Priority}) # seconds
+    max_wait: Dict[Priority, float] = field(default_factory=lambda: {p: 0.0 for p in Priority})
+    timeouts: Dict[Priority, int] = field(default_factory=lambda: {p: 0 for p in Priority})
+    max_queue_depth: int = 0
+    limited: int = 0 # 429s reported
+
+
 class VndbRateLimiter:
-    """Fixed-window limiter to keep VNDB usage under ~200 requests / 5 minutes."""
+    """Sliding-window limiter to keep VNDB usage under ~200 requests / 5 minutes.
+
+    Every permit handed out in the last window_seconds counts, so there is
+    no burst at a window boundary. Callers await acquire() and get a permit
+    as soon as one frees up, or an error if that would take longer than their
+    timeout. Sync requests stop at sync_threshold, leaving the rest of the
+    budget to interactive ones, and give way to any interactive request
+    that's waiting. consume() keeps the old non-waiting behaviour for sync.
+    """
 
-    def __init__(self, *, max_requests: int = 200, sync_threshold: int = 195, window_seconds: int = 300) -> None:
+    def __init__(self, *, max_requests: int = 200, sync_threshold: int = 195, window_seconds: int = 300, interactive_timeout: float = 10) -> None:
         if sync_threshold > max_requests:
             raise ValueError("Sync threshold cannot exceed the maximum request budget")
         self._max_requests = max_requests
         self._sync_threshold = sync_threshold
         self._window_seconds = window_seconds
+        self._interactive_timeout = interactive_timeout
 
         self._lock = asyncio.Lock()
-        now = time.monotonic()
-        self._window_start: float = now
-        self._reset_at: float = now + window_seconds
-        self._count: int = 0
+        self._granted: Deque[float] = collections.deque() # monotonic times of permits in the window
+        self._blocked_until: float = 0.0
+        self._waiting: Dict[Priority, int] = {p: 0 for p in Priority}
+        self.stats = VndbLimiterStats()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(self._waiting.values())
+
+    def _limit(self, priority: Priority) -> int:
+        return self._max_requests if priority == Priority.INTERACTIVE else self._sync_threshold
+
+    def _wait_time(self, priority: Priority, now: float) -> float:
+        while self._granted and self._granted[0] <= now - self._window_seconds:
+            self._granted.popleft()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        limit = self._limit(priority)
+        if len(self._granted) < limit:
+            return 0.0
+        # until enough of the oldest permits leave the window
+        return self._granted[len(self._granted) - limit] + self._window_seconds - now
+
+    async def acquire(self, *, priority: Priority = Priority.SYNC, timeout: float | None = None) -> float:
+        """Wait for a permit, returns the seconds waited. Raises SyncBudgetError
+        (sync) or RateLimitError (interactive) if one won't free up within timeout"""
+        start = time.monotonic()
+        self._waiting[priority] += 1
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.queue_depth)
+        try:
+            while True:
+                async with self._lock:
+                    now = time.monotonic()
+                    wait = self._wait_time(priority, now)
+                    yielding = priority == Priority.SYNC and self._waiting[Priority.INTERACTIVE] > 0
+                    if wait <= 0 and not yielding:
+                        self._granted.append(now)
+                        waited = now - start
+                        self.stats.granted[priority] += 1
+                        self.stats.waited[priority] += waited
+                        self.stats.max_wait[priority] = max(self.stats.max_wait[priority], waited)
+                        return waited
+                    wait = max(wait, 0.05)
+                if timeout is not None and now + wait > start + timeout:
+                    self.stats.timeouts[priority] += 1
+                    if priority == Priority.INTERACTIVE:
+                        raise RateLimitError(wait)
+                    raise SyncBudgetError(wait)
+                await asyncio.sleep(wait)
+        finally:
+            self._waiting[priority] -= 1
 
     async def consume(self, *, for_sync: bool) -> ConsumeResult:
+        """Older interface: sync requests fail right away when the budget is
+        spent, interactive ones wait up to interactive_timeout"""
+        if for_sync:
+            await self.acquire(priority=Priority.SYNC, timeout=0)
+        else:
+            await self.acquire(priority=Priority.INTERACTIVE, timeout=self._interactive_timeout)
         async with self._lock:
             now = time.monotonic()
-            self._maybe_reset(now)
-
-            if for_sync and self._count >= self._sync_threshold:
-                retry_after = max(0.0, self._reset_at - now)
-                raise SyncBudgetError(retry_after)
-
-            self._count += 1
-            remaining = max(0, self._max_requests - self._count)
+            self._wait_time(Priority.INTERACTIVE, now)
             return ConsumeResult(
-                remaining=remaining,
-                retry_after=max(0.0, self._reset_at - now),
+                remaining=max(0, self._max_requests - len(self._granted)),
+                retry_after=self._window_remaining(now),
             )
 
     async def mark_limited(self, retry_after: float | None = None) -> float:
         """Force the limiter into a limited state after a 429 response."""
         async with self._lock:
             now = time.monotonic()
-            self._maybe_reset(now)
-
-            current_remaining = max(0.0, self._reset_at - now)
-            cooldown = current_remaining
+            self._wait_time(Priority.INTERACTIVE, now)
+            cooldown = self._window_remaining(now)
             if retry_after is not None:
                 cooldown = max(cooldown, max(0.0, retry_after))
+            self._blocked_until = max(self._blocked_until, now + cooldown)
+            self.stats.limited += 1
+            return max(0.0, self._blocked_until - now)
 
-            self._count = self._max_requests
-            self._reset_at = now + cooldown
-            self._window_start = self._reset_at - self._window_seconds
-
-            return max(0.0, self._reset_at - now)
-
-    def _maybe_reset(self, now: float) -> None:
-        if now >= self._reset_at:
-            self._window_start = now
-            self._reset_at = now + self._window_seconds
-            self._count = 0
+    def _window_remaining(self, now: float) -> float:
+        """Until the oldest permit in the window expires"""
+        if not self._granted:
+            return 0.0
+        return max(0.0, self._granted[0] + self._window_seconds - now)
 
 
 def parse_retry_after(value: str | None) -> float | None:
@@ -90,4 +158,3 @@ def parse_retry_after(value: str | None) -> float | None:
         return float(value)
     except (TypeError, ValueError):
         return None
-
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import asyncio, logging, os, socket, uuid
+
+from . import Service
+from .display_queue import DisplayQueue
+from .lease import ShardLease
+from modules.core.resources import Resources
+
+logger = logging.getLogger(__name__)
+
+class HeadlessBot:
+    """Just enough of discord's Bot for a Syncer to run without the gateway"""
+
+    def __init__(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self._closed = asyncio.Event()
+
+    async def wait_until_ready(self) -> None:
+        pass
+
+    def is_closed(self) -> bool:
+        return self._closed.is_set()
+
+    def close(self) -> None:
+        self._closed.set()
+
+async def run(worker_id: str = None, shards: int = None, lease_ttl: float = None) -> None:
+    """Sync the users in this worker's shards of every active service until
+    cancelled. The bot process should run with SYNC_MODE=remote to post the
+    updates queued here"""
+    worker_id = worker_id or os.getenv('SYNC_WORKER_ID') or f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+    shards = shards or int(os.getenv('SYNC_SHARDS', default=16))
+    lease_ttl = lease_ttl or float(os.getenv('SYNC_LEASE_TTL', default=60))
+
+    await Resources.init()
+    await Service.start_stores()
+
+    leases = {service: ShardLease(Resources.lease_col, service, worker_id, shards, lease_ttl) for service in Service.active()}
+    for lease in leases.values():
+        await lease.start()
+
+    bot = HeadlessBot()
+    syncers = Service.syncers(bot, leases=leases, display_queue=DisplayQueue(Resources.display_col))
+    logger.info(f"sync worker {worker_id} started with {shards} shards per service")
+    try:
+        await asyncio.gather(*(syncer.loop() for syncer in syncers))
+    finally:
+        bot.close()
+        for syncer in syncers:
+            syncer.comprehender.close()
+        for lease in leases.values():
+            try:
+                await lease.release()
+            except Exception:
+                logger.exception(f"Releasing {lease.service} shards failed")
+        await asyncio.gather(Resources.session.close(), Resources.syncer_session.close())
@@ -0,0 +1,26 @@
+import os, sys, logging, logging.handlers, asyncio
+from dotenv import load_dotenv
+load_dotenv()
+
+from modules.services import worker
+
+# syncs users without connecting to discord, run as many of these as wanted
+# next to the bot started with SYNC_MODE=remote
+
+file_handler = logging.handlers.RotatingFileHandler(
+	'sync_worker.log', encoding='utf-8', maxBytes=2 * 1024**2, backupCount=5)
+stream_handler = logging.StreamHandler()
+stream_handler.setLevel(logging.ERROR)
+logging.basicConfig(level=logging.DEBUG, handlers=[
+	stream_handler, file_handler])
+
+logging.getLogger('pymongo').setLevel(logging.WARNING)
+
+os.chdir(os.path.dirname(os.path.abspath(__file__))) #changes cwd to project root
+
+if __name__ == '__main__':
+	logging.info("Starting sync worker...")
+	try:
+		asyncio.run(worker.run())
+	except KeyboardInterrupt:
+		logging.info('Sync worker shut down.')